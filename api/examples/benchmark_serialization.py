@@ -0,0 +1,95 @@
+"""レスポンスのシリアライズ方式のベンチマーク.
+
+大きな解析結果・可視化結果について、エンコード時間とペイロードの大きさを比較する.
+
+- FastAPI 標準 (jsonable_encoder + json.dumps)
+- pydantic-core の to_json (src.serialization が使う方式)
+- orjson (インストールされている場合)
+- MessagePack (インストールされている場合)
+
+実行方法 (api ディレクトリで):
+    uv run python -m examples.benchmark_serialization
+"""
+
+import asyncio
+import json
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
+
+from src.models.analysis import AnalyzeResponse
+from src.models.visualization import VisualizeResponse
+from src.serialization import encode_model
+from src.services.analyzer import analyze_code
+from src.services.visualizer import visualize_code
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+ROUNDS = 200
+SOURCE_DIR = Path(__file__).resolve().parent.parent / "src" / "services"
+
+
+def build_code() -> str:
+    """ベンチマーク用の大きなコード (サービスのソースを連結)."""
+    return "\n\n".join(path.read_text(encoding="utf-8") for path in sorted(SOURCE_DIR.glob("*.py")))
+
+
+def measure(encode: Callable[[], bytes]) -> tuple[float, int]:
+    """エンコード 1 回あたりの時間 (ミリ秒) とバイト数を測る."""
+    payload = encode()
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        encode()
+    return (time.perf_counter() - start) * 1000 / ROUNDS, len(payload)
+
+
+def encoders(model: BaseModel) -> dict[str, Callable[[], bytes]]:
+    """比較するエンコード方式."""
+    methods: dict[str, Callable[[], bytes]] = {
+        "fastapi (jsonable_encoder + json.dumps)": lambda: json.dumps(
+            jsonable_encoder(model, by_alias=True),
+            ensure_ascii=False,
+            allow_nan=False,
+            separators=(",", ":"),
+        ).encode(),
+        "pydantic-core to_json": lambda: encode_model(model),
+    }
+    if orjson is not None:
+        methods["orjson (model_dump)"] = lambda: orjson.dumps(model.model_dump(mode="json", by_alias=True))
+    if msgpack is not None:
+        methods["msgpack"] = lambda: encode_model(model, "application/msgpack")
+    return methods
+
+
+def main() -> None:
+    """ベンチマークを実行."""
+    code = build_code()
+    print(f"コード: {len(code.splitlines())} 行, {ROUNDS} 回の平均\n")
+
+    results = {
+        "analyze": AnalyzeResponse(**asyncio.run(analyze_code(code))),
+        "visualize": VisualizeResponse.from_result(visualize_code(code)),
+    }
+    for name, model in results.items():
+        print(f"=== {name} ===")
+        baseline = None
+        for label, encode in encoders(model).items():
+            elapsed, size = measure(encode)
+            baseline = baseline or elapsed
+            print(f"  {label:42s} {elapsed:8.3f} ms  {size / 1024:8.1f} KiB  x{baseline / elapsed:.1f}")
+        print()
+
+
+if __name__ == "__main__":
+    main()
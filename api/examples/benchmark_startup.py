@@ -0,0 +1,102 @@
+"""起動時間のベンチマーク.
+
+uvicorn でサーバーを起動し、最初のレスポンスが返るまでの時間 (time-to-first-response) と、
+最初の解析リクエストにかかる時間を測る. Cloud Run のコールドスタートの目安になる.
+
+実行方法 (api ディレクトリで):
+    uv run python -m examples.benchmark_startup
+    uv run python -m examples.benchmark_startup --runs 10 --warmup
+"""
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+API_DIR = Path(__file__).resolve().parent.parent
+SAMPLE_CODE = "def greet(name):\n    return f'こんにちは {name}'\n\n\nprint(greet('Python'))\n"
+
+
+def free_port() -> int:
+    """空いているポートを取得."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def request(url: str, payload: dict | None = None) -> int:
+    """リクエストを送り、ステータスコードを返す."""
+    data = json.dumps(payload).encode() if payload is not None else None
+    req = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})  # noqa: S310
+    with urllib.request.urlopen(req, timeout=10) as response:  # noqa: S310
+        response.read()
+        return response.status
+
+
+def measure_once(*, warmup: bool, sandbox: bool, timeout: float) -> dict[str, float]:
+    """サーバーを 1 回起動して計測."""
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    env = {
+        **os.environ,
+        "STARTUP_WARMUP": str(warmup).lower(),
+        "SANDBOX_PREFORK": str(sandbox).lower(),
+    }
+    started = time.perf_counter()
+    process = subprocess.Popen(  # noqa: S603
+        [sys.executable, "-m", "uvicorn", "src.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=API_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        while True:
+            if time.perf_counter() - started > timeout:
+                msg = "サーバーが起動しませんでした"
+                raise TimeoutError(msg)
+            try:
+                request(f"{base_url}/")
+                break
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.005)
+        first_response = time.perf_counter() - started
+
+        analyze_started = time.perf_counter()
+        request(f"{base_url}/api/v1/analyze", {"code": SAMPLE_CODE})
+        first_analyze = time.perf_counter() - analyze_started
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+    return {"first_response_ms": first_response * 1000, "first_analyze_ms": first_analyze * 1000}
+
+
+def main() -> None:
+    """ベンチマークを実行."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="計測回数")
+    parser.add_argument("--warmup", action="store_true", help="STARTUP_WARMUP=true で起動する")
+    parser.add_argument("--sandbox", action="store_true", help="サンドボックスのワーカーも事前起動する")
+    parser.add_argument("--timeout", type=float, default=30.0, help="起動待ちのタイムアウト (秒)")
+    args = parser.parse_args()
+
+    results = [measure_once(warmup=args.warmup, sandbox=args.sandbox, timeout=args.timeout) for _ in range(args.runs)]
+
+    print(f"warmup={args.warmup} sandbox={args.sandbox} runs={args.runs}")
+    for key, label in (("first_response_ms", "最初のレスポンスまで"), ("first_analyze_ms", "最初の /analyze")):
+        values = [result[key] for result in results]
+        print(
+            f"  {label:20s} 中央値 {statistics.median(values):8.1f} ms  最小 {min(values):8.1f} ms  最大 {max(values):8.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
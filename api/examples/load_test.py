@@ -0,0 +1,368 @@
+"""授業中のアクセスを再現する負荷試験.
+
+1 つのインスタンスで何人の生徒を受け持てるかを見積もるため、生徒のプログラムを集めたコーパスを使い、
+次のトラフィックの形でリクエストを送る.
+
+- steady: 一定の頻度 (ポアソン到着) で /analyze を送る
+- burst: クラス全員 (既定 40 人) がほぼ同時に「実行」を押す. 1 人あたり /analyze と /visualize を送り、
+  エラーのあるプログラムでは /analyze-error も送る. これを --rounds 回くり返す
+- mixed: 一定の頻度で、エンドポイントを授業中の比率 (解析 5 : 可視化 3 : エラー解析 1 : 総合解析 1) で混ぜて送る
+
+スループット、エンドポイントごとのレイテンシ (p50/p95/p99)、エラー率 (ステータス別の内訳つき)、
+イベントループの遅延を表示する.
+
+既定では FastAPI の app を httpx の ASGI トランスポートで同じプロセス内から呼び出す (サーバーの
+起動は不要で、イベントループの遅延はサーバー側の値になる). --url を指定すると起動済みの
+サーバー (uvicorn) に送る (イベントループの遅延は負荷をかける側の値になる).
+
+同じプロセス内で測る場合はすべてのリクエストが同じクライアントになる. burst はクラス 1 つ分なら
+既定のレート制限に収まるが、steady・mixed で高い頻度を測る場合は RATE_LIMIT_ENABLED=false を付けて実行する.
+--unique を付けるとリクエストごとにコードを少し変え、結果キャッシュが効かない場合を測る.
+
+実行方法 (api ディレクトリで):
+    uv run python -m examples.load_test --shape burst
+    RATE_LIMIT_ENABLED=false uv run python -m examples.load_test --shape mixed --rate 30 --duration 20 --unique
+    uv run python -m examples.load_test --url http://127.0.0.1:8000 --shape steady --rate 50
+    uv run python -m examples.load_test --corpus ./student_programs --shape burst --students 120
+"""
+
+import argparse
+import asyncio
+import logging
+import random
+import statistics
+import time
+from collections import Counter, defaultdict
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+import httpx
+
+# 授業で扱う典型的なプログラム (コード, 実行時のエラーメッセージ)
+CORPUS: list[tuple[str, str | None]] = [
+    ("name = input('名前: ')\nprint('こんにちは、' + name + 'さん')\n", None),
+    (
+        "total = 0\nfor i in range(1, 11):\n    total += i\nprint(total)\n",
+        None,
+    ),
+    (
+        (
+            "scores = [72, 85, 90, 64, 78]\naverage = sum(scores) / len(scores)\n"
+            "if average >= 80:\n    print('よくできました')\nelse:\n    print('もう少し')\n"
+        ),
+        None,
+    ),
+    (
+        (
+            "def fizzbuzz(n):\n    for i in range(1, n + 1):\n        if i % 15 == 0:\n            print('FizzBuzz')\n"
+            "        elif i % 3 == 0:\n            print('Fizz')\n        elif i % 5 == 0:\n            print('Buzz')\n"
+            "        else:\n            print(i)\n\n\nfizzbuzz(30)\n"
+        ),
+        None,
+    ),
+    (
+        (
+            "class Student:\n    def __init__(self, name, score):\n        self.name = name\n        self.score = score\n\n"
+            "    def passed(self):\n        return self.score >= 60\n\n\n"
+            "students = [Student('A', 70), Student('B', 40)]\nfor s in students:\n    print(s.name, s.passed())\n"
+        ),
+        None,
+    ),
+    (
+        (
+            "def bubble_sort(data):\n    n = len(data)\n    for i in range(n):\n        for j in range(n - 1 - i):\n"
+            "            if data[j] > data[j + 1]:\n                data[j], data[j + 1] = data[j + 1], data[j]\n"
+            "    return data\n\n\nprint(bubble_sort([5, 3, 8, 1, 9, 2]))\n"
+        ),
+        None,
+    ),
+    (
+        "age = input('年齢: ')\nprint(age + 1)\n",
+        'TypeError: can only concatenate str (not "int") to str',
+    ),
+    (
+        "numbers = [1, 2, 3]\nfor i in range(4):\n    print(numbers[i])\n",
+        "IndexError: list index out of range",
+    ),
+    (
+        "def area(r):\n    return 3.14 * r * r\n\n\nprint(Area(2))\n",
+        "NameError: name 'Area' is not defined",
+    ),
+    (
+        "count = 0\nwhile count < 3\n    print(count)\n    count += 1\n",
+        "SyntaxError: expected ':'",
+    ),
+]
+
+# mixed の各エンドポイントの比率
+MIX = {"analyze": 5, "visualize": 3, "analyze-error": 1, "inspect": 1}
+# イベントループの遅延を測る間隔 (秒)
+LAG_INTERVAL = 0.01
+
+
+@dataclass
+class Program:
+    """コーパスの 1 つのプログラム.
+
+    Attributes:
+        code: Pythonコード
+        error_message: 実行時のエラーメッセージ (エラーにならない場合は None)
+    """
+
+    code: str
+    error_message: str | None = None
+
+
+@dataclass
+class LoadResult:
+    """負荷試験の計測結果.
+
+    Attributes:
+        latencies: エンドポイントごとのレイテンシ (秒)
+        statuses: エンドポイントとステータス (通信エラーは 0) ごとの件数
+        lags: イベントループの遅延 (秒)
+        elapsed: 試験全体の時間 (秒)
+    """
+
+    latencies: dict[str, list[float]] = field(default_factory=lambda: defaultdict(list))
+    statuses: Counter[tuple[str, int]] = field(default_factory=Counter)
+    lags: list[float] = field(default_factory=list)
+    elapsed: float = 0.0
+
+
+def load_corpus(directory: Path | None) -> list[Program]:
+    """コーパスを読み込む.
+
+    ディレクトリを指定した場合は *.py を読み込む. 同じ名前の *.err があれば、
+    その 1 行目をエラーメッセージとして使う.
+    """
+    if directory is None:
+        return [Program(code, error) for code, error in CORPUS]
+    programs = []
+    for path in sorted(directory.glob("*.py")):
+        error_path = path.with_suffix(".err")
+        error = error_path.read_text(encoding="utf-8").splitlines()[0] if error_path.exists() else None
+        programs.append(Program(path.read_text(encoding="utf-8"), error))
+    if not programs:
+        msg = f"{directory} に *.py がありません"
+        raise SystemExit(msg)
+    return programs
+
+
+class LoadGenerator:
+    """コーパスのプログラムを使ってリクエストを送り、結果を記録する."""
+
+    def __init__(self, client: httpx.AsyncClient, corpus: list[Program], *, unique: bool, seed: int) -> None:
+        """コンストラクタ.
+
+        Args:
+            client: リクエストを送るクライアント
+            corpus: プログラムのコーパス
+            unique: リクエストごとにコードを変えるか (結果キャッシュを効かせない)
+            seed: 乱数のシード
+        """
+        self.client = client
+        self.corpus = corpus
+        self.unique = unique
+        self.random = random.Random(seed)  # noqa: S311
+        self.result = LoadResult()
+        self._serial = 0
+        self._pending: set[asyncio.Task[None]] = set()
+
+    def _payload(self, endpoint: str, program: Program) -> dict[str, Any]:
+        """エンドポイントに送る本文."""
+        code = program.code
+        if self.unique:
+            self._serial += 1
+            code += f"# submission {self._serial}\n"
+        if endpoint == "analyze":
+            return {"code": code}
+        if endpoint == "visualize":
+            return {"code": code, "highlight_line": 1}
+        if endpoint == "analyze-error":
+            return {"code": code, "error_message": program.error_message or "NameError: name 'x' is not defined"}
+        return {"code": code, "error_message": program.error_message}
+
+    async def send(self, endpoint: str, program: Program, student: int) -> None:
+        """1 件のリクエストを送り、レイテンシとステータスを記録."""
+        headers = {"X-Forwarded-For": f"10.0.{student // 250}.{student % 250 + 1}"}
+        started = time.perf_counter()
+        try:
+            response = await self.client.post(
+                f"/api/v1/{endpoint}", json=self._payload(endpoint, program), headers=headers
+            )
+            status = response.status_code
+        except httpx.HTTPError:
+            status = 0
+        self.result.latencies[endpoint].append(time.perf_counter() - started)
+        self.result.statuses[endpoint, status] += 1
+
+    def spawn(self, endpoint: str, program: Program, student: int) -> None:
+        """応答を待たずにリクエストを送る (オープンループ)."""
+        task = asyncio.create_task(self.send(endpoint, program, student))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def drain(self) -> None:
+        """送ったリクエストの応答をすべて待つ."""
+        while self._pending:
+            await asyncio.gather(*self._pending)
+
+    async def steady(self, rate: float, duration: float, endpoints: dict[str, int]) -> None:
+        """平均 rate 件/秒のポアソン到着で duration 秒間送る."""
+        names, weights = list(endpoints), list(endpoints.values())
+        deadline = time.perf_counter() + duration
+        student = 0
+        while time.perf_counter() < deadline:
+            endpoint = self.random.choices(names, weights)[0]
+            program = self.random.choice(self.corpus)
+            if endpoint == "analyze-error" and program.error_message is None:
+                program = self.random.choice([p for p in self.corpus if p.error_message] or self.corpus)
+            self.spawn(endpoint, program, student)
+            student += 1
+            await asyncio.sleep(self.random.expovariate(rate))
+        await self.drain()
+
+    async def burst(self, students: int, rounds: int, spread: float, gap: float) -> None:
+        """クラス全員が spread 秒の間に一斉に実行する場面を rounds 回くり返す."""
+        for _ in range(rounds):
+            # 同じ課題に取り組んでいるため、クラスで使うプログラムは数種類に偏る
+            assignment = self.random.sample(self.corpus, min(3, len(self.corpus)))
+            for student in range(students):
+                program = self.random.choice(assignment)
+                self._schedule(spread * self.random.random(), student, program)
+            await self.drain()
+            await asyncio.sleep(gap)
+
+    def _schedule(self, delay: float, student: int, program: Program) -> None:
+        """1 人の生徒が delay 秒後に実行したときのリクエストを送る."""
+
+        async def run() -> None:
+            await asyncio.sleep(delay)
+            requests = [self.send("analyze", program, student), self.send("visualize", program, student)]
+            if program.error_message:
+                requests.append(self.send("analyze-error", program, student))
+            await asyncio.gather(*requests)
+
+        task = asyncio.create_task(run())
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+
+async def monitor_lag(lags: list[float], stop: asyncio.Event) -> None:
+    """イベントループの遅延 (sleep が予定より遅れて戻った時間) を記録."""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(LAG_INTERVAL)
+        lags.append(max(0.0, time.perf_counter() - started - LAG_INTERVAL))
+
+
+@asynccontextmanager
+async def open_client(url: str | None, concurrency: int) -> AsyncIterator[httpx.AsyncClient]:
+    """負荷をかけるクライアントを開く (url がなければ同じプロセス内の app に送る)."""
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    timeout = httpx.Timeout(60.0)
+    if url is not None:
+        async with httpx.AsyncClient(base_url=url, limits=limits, timeout=timeout) as client:
+            yield client
+        return
+
+    from src.main import app  # noqa: PLC0415
+
+    # サーバーのログ (main.py は DEBUG) で結果の表示が埋もれないようにする
+    logging.getLogger().setLevel(logging.WARNING)
+    async with (
+        app.router.lifespan_context(app),
+        httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app, client=("127.0.0.1", 0)),
+            base_url="http://loadtest",
+            limits=limits,
+            timeout=timeout,
+        ) as client,
+    ):
+        yield client
+
+
+def percentile(values: list[float], q: float) -> float:
+    """パーセンタイル (q は 0-100)."""
+    if len(values) < 2:  # noqa: PLR2004
+        return values[0] if values else 0.0
+    return statistics.quantiles(values, n=100, method="inclusive")[round(q) - 1]
+
+
+def report(result: LoadResult) -> None:
+    """計測結果を表示."""
+    total = sum(result.statuses.values())
+    errors = sum(count for (_, status), count in result.statuses.items() if not 200 <= status < 300)  # noqa: PLR2004
+    print(f"リクエスト: {total} 件 / {result.elapsed:.1f} 秒 = {total / result.elapsed:.1f} req/s")
+    print(f"エラー率: {errors / total if total else 0.0:.2%}")
+    breakdown = Counter()
+    for (_, status), count in result.statuses.items():
+        breakdown[status] += count
+    print(
+        "ステータス: " + ", ".join(f"{status or '通信エラー'}: {count}" for status, count in sorted(breakdown.items()))
+    )
+    print()
+    print(f"  {'endpoint':16s} {'count':>6s} {'p50 ms':>9s} {'p95 ms':>9s} {'p99 ms':>9s} {'max ms':>9s}")
+    for endpoint, latencies in sorted(result.latencies.items()):
+        values = [value * 1000 for value in latencies]
+        print(
+            f"  {endpoint:16s} {len(values):6d} {percentile(values, 50):9.1f} {percentile(values, 95):9.1f}"
+            f" {percentile(values, 99):9.1f} {max(values):9.1f}",
+        )
+    lags = [lag * 1000 for lag in result.lags]
+    if lags:
+        print()
+        print(
+            f"イベントループの遅延: p50 {percentile(lags, 50):.1f} ms, p99 {percentile(lags, 99):.1f} ms,"
+            f" max {max(lags):.1f} ms",
+        )
+
+
+async def run(args: argparse.Namespace) -> LoadResult:
+    """指定されたトラフィックの形で負荷をかける."""
+    corpus = load_corpus(args.corpus)
+    async with open_client(args.url, args.concurrency) as client:
+        generator = LoadGenerator(client, corpus, unique=args.unique, seed=args.seed)
+        stop = asyncio.Event()
+        lag_task = asyncio.create_task(monitor_lag(generator.result.lags, stop))
+        started = time.perf_counter()
+        if args.shape == "steady":
+            await generator.steady(args.rate, args.duration, {"analyze": 1})
+        elif args.shape == "mixed":
+            await generator.steady(args.rate, args.duration, MIX)
+        else:
+            await generator.burst(args.students, args.rounds, args.spread, args.gap)
+        generator.result.elapsed = time.perf_counter() - started
+        stop.set()
+        await lag_task
+    return generator.result
+
+
+def main() -> None:
+    """負荷試験を実行."""
+    parser = argparse.ArgumentParser(description="授業中のアクセスを再現する負荷試験")
+    parser.add_argument("--url", help="起動済みのサーバーの URL (省略時は同じプロセス内の app に送る)")
+    parser.add_argument("--shape", choices=("steady", "burst", "mixed"), default="burst", help="トラフィックの形")
+    parser.add_argument("--rate", type=float, default=20.0, help="steady・mixed の平均リクエスト数 (件/秒)")
+    parser.add_argument("--duration", type=float, default=10.0, help="steady・mixed の時間 (秒)")
+    parser.add_argument("--students", type=int, default=40, help="burst の生徒数")
+    parser.add_argument("--rounds", type=int, default=3, help="burst のくり返し回数")
+    parser.add_argument("--spread", type=float, default=1.0, help="burst で全員が実行し終えるまでの時間 (秒)")
+    parser.add_argument("--gap", type=float, default=2.0, help="burst の間隔 (秒)")
+    parser.add_argument("--concurrency", type=int, default=100, help="クライアントの最大同時接続数")
+    parser.add_argument("--corpus", type=Path, help="プログラムのディレクトリ (*.py と、任意で同名の *.err)")
+    parser.add_argument("--unique", action="store_true", help="リクエストごとにコードを変える (キャッシュを効かせない)")
+    parser.add_argument("--seed", type=int, default=0, help="乱数のシード")
+    args = parser.parse_args()
+
+    target = args.url or "同じプロセス内の app (ASGI)"
+    print(f"対象: {target}, トラフィック: {args.shape}{' (unique)' if args.unique else ''}\n")
+    report(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,448 @@
+"""提出ファイルの一括解析 (コマンドライン).
+
+学期末のレポートなどで数千件の提出ファイルを解析する場合に、HTTP API を 1 件ずつ呼び出す代わりに
+サービス (analyze_code・visualize_code・analyze_error) を直接呼び出す.
+
+- 入力: ディレクトリ (*.py を再帰的に探す) と tar アーカイブ (.tar・.tar.gz・.tgz など).
+  同じ名前の *.err があれば、その内容をエラーメッセージとしてエラー解析も行う
+- 並列化: ファイルを CHUNK_SIZE 件ずつまとめてプロセスプールに渡す (プロセス間のやり取りを減らす).
+  渡したまま終わっていないチャンクはワーカー数の 2 倍までにし、ファイルを先に読みすぎないようにする
+- 出力: 1 ファイル 1 行の JSONL を、終わったものから書き出す (入力の順とは限らない).
+  各処理の結果は HTTP API のレスポンスと同じ形にする
+- 再開: 1 行書き出すごとに、ファイルの ID と出力ファイルの位置をチェックポイントに追記する.
+  --resume を付けると、チェックポイントより後の書きかけの出力を切り詰め、処理済みのファイルを飛ばす
+
+実行方法 (api ディレクトリで):
+    uv run python -m src.cli submissions/ -o results.jsonl
+    uv run python -m src.cli term1.tar.gz term2.tar.gz -o results.jsonl --tasks analyze,error --workers 8
+    uv run python -m src.cli submissions/ -o results.jsonl --resume
+"""
+
+import argparse
+import asyncio
+import hashlib
+import logging
+import os
+import sys
+import tarfile
+import time
+from collections.abc import Iterable, Iterator
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, BinaryIO
+
+from pydantic_core import from_json, to_json
+
+from .models.analysis import AnalyzeResponse
+from .models.error_analysis import ErrorAnalyzeResponse
+from .models.visualization import VisualizeResponse
+from .services.analyzer import analyze_code
+from .services.deadline import Deadline, DeadlineExceeded, use_deadline
+from .services.error_analyzer import analyze_error, prepare_code
+from .services.parsing import ParsedCode
+from .services.visualizer import visualize_code
+
+logger = logging.getLogger(__name__)
+
+TASKS = ("analyze", "visualize", "error")
+# 1 回にワーカーへ渡すファイル数
+CHUNK_SIZE = 16
+# 進捗を表示する間隔 (秒)
+PROGRESS_INTERVAL = 5.0
+
+
+@dataclass(frozen=True)
+class Submission:
+    """1 つの提出ファイル.
+
+    Attributes:
+        id: ファイルの ID (パス. tar アーカイブの中のファイルは「アーカイブ:メンバー名」)
+        code: Python コード
+        error_message: 同じ名前の *.err の内容 (なければ None)
+    """
+
+    id: str
+    code: str
+    error_message: str | None = None
+
+
+@dataclass(frozen=True)
+class Options:
+    """ワーカーでの解析の設定.
+
+    Attributes:
+        tasks: 実行する処理 (analyze, visualize, error)
+        show_flow: 可視化でフロー図 (SVG) を生成するか
+        timeout: 1 ファイルあたりの締め切り (秒. None で締め切りなし)
+        verbose: ワーカーでサービスのログを出すか
+    """
+
+    tasks: tuple[str, ...]
+    show_flow: bool
+    timeout: float | None
+    verbose: bool = False
+
+
+def _decode(data: bytes) -> str:
+    """提出ファイルの内容を文字列にする (UTF-8 として読めない部分は置き換える)."""
+    return data.decode("utf-8", errors="replace")
+
+
+def iter_directory(root: Path) -> Iterator[Submission]:
+    """ディレクトリの *.py を名前の順に読み込む (隠しディレクトリと __pycache__ は除く)."""
+    for path in sorted(root.rglob("*.py")):
+        if any(part.startswith(".") or part == "__pycache__" for part in path.relative_to(root).parts[:-1]):
+            continue
+        error_path = path.with_suffix(".err")
+        error = _decode(error_path.read_bytes()).strip() if error_path.is_file() else ""
+        yield Submission(str(path), _decode(path.read_bytes()), error or None)
+
+
+def iter_tarball(path: Path) -> Iterator[Submission]:
+    """アーカイブ (tar) の *.py を読み込む.
+
+    圧縮されたアーカイブを何度も先頭から展開し直さないよう、先に *.err だけを集めてから
+    *.py をアーカイブの順に読む.
+    """
+    with tarfile.open(path) as archive:
+        members = [member for member in archive.getmembers() if member.isfile()]
+        errors = {}
+        for member in members:
+            if member.name.endswith(".err"):
+                errors[member.name.removesuffix(".err")] = _decode(archive.extractfile(member).read()).strip()  # type: ignore[union-attr]
+        for member in members:
+            if member.name.endswith(".py"):
+                code = _decode(archive.extractfile(member).read())  # type: ignore[union-attr]
+                yield Submission(f"{path}:{member.name}", code, errors.get(member.name.removesuffix(".py")) or None)
+
+
+def iter_submissions(paths: Iterable[Path]) -> Iterator[Submission]:
+    """入力 (ディレクトリ・tar アーカイブ・*.py) の提出ファイルを読み込む."""
+    for path in paths:
+        if path.is_dir():
+            yield from iter_directory(path)
+        elif tarfile.is_tarfile(path):
+            yield from iter_tarball(path)
+        elif path.suffix == ".py":
+            error_path = path.with_suffix(".err")
+            error = _decode(error_path.read_bytes()).strip() if error_path.is_file() else ""
+            yield Submission(str(path), _decode(path.read_bytes()), error or None)
+        else:
+            logger.warning("Skipping %s (not a directory, tarball or .py file)", path)
+
+
+def chunked(submissions: Iterable[Submission], size: int) -> Iterator[list[Submission]]:
+    """提出ファイルを size 件ずつまとめる."""
+    chunk: list[Submission] = []
+    for submission in submissions:
+        chunk.append(submission)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# ワーカープロセスのイベントループ (サービスのコルーチンを動かす. プロセスごとに 1 つだけ作る)
+_loop: asyncio.AbstractEventLoop | None = None
+
+
+def _init_worker(verbose: bool) -> None:  # noqa: FBT001
+    """ワーカープロセスの初期化.
+
+    失敗は出力の errors に記録するため、既定ではサービスのログ (構文エラーなど) を出さない.
+    """
+    logging.basicConfig(
+        level=logging.DEBUG if verbose else logging.CRITICAL,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+
+
+def _run_coroutine(coroutine: Any) -> Any:  # noqa: ANN401
+    """サービスのコルーチンをワーカープロセスのイベントループで実行."""
+    global _loop  # noqa: PLW0603
+    if _loop is None:
+        _loop = asyncio.new_event_loop()
+    return _loop.run_until_complete(coroutine)
+
+
+def _run_task(task: str, submission: Submission, parsed: ParsedCode, options: Options) -> dict[str, Any]:
+    """1 つの処理を実行し、HTTP API のレスポンスと同じ形にする."""
+    code = submission.code
+    if task == "analyze":
+        result = _run_coroutine(analyze_code(code, parsed))
+        return AnalyzeResponse(**result).model_dump(mode="json", by_alias=True)
+    if task == "visualize":
+        result = visualize_code(code, show_flow=options.show_flow, parsed=parsed)
+        return VisualizeResponse.from_result(result).model_dump(mode="json", by_alias=True)
+    result = _run_coroutine(analyze_error(code, submission.error_message or "", prepare_code(code, parsed)))
+    return ErrorAnalyzeResponse(success=True, **result).model_dump(mode="json", by_alias=True)
+
+
+def analyze_submission(submission: Submission, options: Options) -> dict[str, Any]:
+    """1 つの提出ファイルを解析し、出力の 1 行にする.
+
+    Returns:
+        ID・内容のハッシュ・行数・処理ごとの結果 (results). 失敗した処理は errors に理由を入れる
+    """
+    parsed = ParsedCode(submission.code)
+    results: dict[str, Any] = {}
+    errors: dict[str, str] = {}
+    with use_deadline(Deadline.after(options.timeout)):
+        for task in options.tasks:
+            if task == "error" and submission.error_message is None:
+                continue
+            try:
+                results[task] = _run_task(task, submission, parsed, options)
+            except DeadlineExceeded as e:
+                errors[task] = str(e)
+            except Exception as e:  # noqa: BLE001 (1 つのファイルの失敗で全体を止めない)
+                errors[task] = f"{type(e).__name__}: {e}"
+    record: dict[str, Any] = {
+        "id": submission.id,
+        "sha256": hashlib.sha256(submission.code.encode()).hexdigest(),
+        "lines": len(parsed.lines),
+        "results": results,
+    }
+    if errors:
+        record["errors"] = errors
+    return record
+
+
+def analyze_chunk(chunk: list[Submission], options: Options) -> list[dict[str, Any]]:
+    """チャンクの提出ファイルを解析 (ワーカープロセスで実行)."""
+    return [analyze_submission(submission, options) for submission in chunk]
+
+
+class Checkpoint:
+    """処理済みのファイルの記録 (1 行ごとに ID と、その行を書き終えた出力ファイルの位置)."""
+
+    def __init__(self, path: Path) -> None:
+        """コンストラクタ."""
+        self.path = path
+        self._file: BinaryIO | None = None
+
+    def load(self) -> tuple[set[str], int]:
+        """処理済みの ID と、出力ファイルの有効な長さを読み込む.
+
+        書きかけの最後の行は捨て、チェックポイントのファイルもその前で切り詰める.
+        """
+        done: set[str] = set()
+        offset = 0
+        valid = 0
+        if not self.path.exists():
+            return done, offset
+        with self.path.open("rb") as file:
+            for line in file:
+                try:
+                    entry = from_json(line)
+                except ValueError:
+                    break
+                done.add(entry["id"])
+                offset = entry["offset"]
+                valid += len(line)
+        with self.path.open("r+b") as file:
+            file.truncate(valid)
+        return done, offset
+
+    def open(self, *, append: bool) -> None:
+        """記録を始める (append=False の場合は以前の記録を消す)."""
+        self._file = self.path.open("ab" if append else "wb")
+
+    def record(self, submission_id: str, offset: int) -> None:
+        """1 つのファイルを処理済みとして記録."""
+        if self._file is not None:
+            self._file.write(to_json({"id": submission_id, "offset": offset}) + b"\n")
+            self._file.flush()
+
+    def close(self) -> None:
+        """記録を終える."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+@dataclass
+class Summary:
+    """一括解析の集計.
+
+    Attributes:
+        processed: 解析したファイル数
+        skipped: 再開時に飛ばした処理済みのファイル数
+        failed: いずれかの処理に失敗したファイル数
+        elapsed: 所要時間 (秒)
+    """
+
+    processed: int = 0
+    skipped: int = 0
+    failed: int = 0
+    elapsed: float = 0.0
+
+
+class BatchRunner:
+    """提出ファイルをプロセスプールで解析し、終わったものから JSONL に書き出す."""
+
+    def __init__(
+        self,
+        output: BinaryIO,
+        checkpoint: Checkpoint | None,
+        options: Options,
+        *,
+        workers: int,
+        chunk_size: int = CHUNK_SIZE,
+    ) -> None:
+        """コンストラクタ.
+
+        Args:
+            output: 出力先 (バイナリ)
+            checkpoint: チェックポイント (None で記録しない)
+            options: ワーカーでの解析の設定
+            workers: ワーカープロセス数
+            chunk_size: 1 回にワーカーへ渡すファイル数
+        """
+        self.output = output
+        self.checkpoint = checkpoint
+        self.options = options
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.summary = Summary()
+        self._last_progress = 0.0
+
+    def run(self, submissions: Iterable[Submission], done: set[str] | frozenset[str] = frozenset()) -> Summary:
+        """すべての提出ファイルを解析 (done の ID は飛ばす)."""
+        started = time.perf_counter()
+        self._last_progress = started
+
+        def remaining() -> Iterator[Submission]:
+            for submission in submissions:
+                if submission.id in done:
+                    self.summary.skipped += 1
+                    continue
+                yield submission
+
+        with ProcessPoolExecutor(self.workers, initializer=_init_worker, initargs=(self.options.verbose,)) as pool:
+            pending: set[Future[list[dict[str, Any]]]] = set()
+            try:
+                for chunk in chunked(remaining(), self.chunk_size):
+                    if len(pending) >= self.workers * 2:
+                        pending = self._write_completed(pending)
+                    pending.add(pool.submit(analyze_chunk, chunk, self.options))
+                while pending:
+                    pending = self._write_completed(pending)
+            except BaseException:
+                pool.shutdown(cancel_futures=True)
+                raise
+        self.summary.elapsed = time.perf_counter() - started
+        return self.summary
+
+    def _write_completed(self, pending: set[Future[list[dict[str, Any]]]]) -> set[Future[list[dict[str, Any]]]]:
+        """終わったチャンクを待って書き出し、残りを返す."""
+        completed, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in completed:
+            for record in future.result():
+                self._write(record)
+        self._report_progress()
+        return pending
+
+    def _write(self, record: dict[str, Any]) -> None:
+        """1 行を書き出し、チェックポイントに記録."""
+        self.output.write(to_json(record) + b"\n")
+        self.output.flush()
+        self.summary.processed += 1
+        if "errors" in record:
+            self.summary.failed += 1
+        if self.checkpoint is not None:
+            self.checkpoint.record(record["id"], self.output.tell())
+
+    def _report_progress(self) -> None:
+        """一定の間隔で進捗を表示 (標準エラー出力)."""
+        now = time.perf_counter()
+        if now - self._last_progress < PROGRESS_INTERVAL:
+            return
+        self._last_progress = now
+        print(f"{self.summary.processed} 件を解析しました (失敗 {self.summary.failed} 件)", file=sys.stderr)
+
+
+def parse_tasks(value: str) -> tuple[str, ...]:
+    """--tasks の値 (カンマ区切り) を解釈."""
+    tasks = tuple(task.strip() for task in value.split(",") if task.strip())
+    unknown = [task for task in tasks if task not in TASKS]
+    if unknown or not tasks:
+        msg = f"処理は {', '.join(TASKS)} から選んでください: {value}"
+        raise argparse.ArgumentTypeError(msg)
+    return tasks
+
+
+def main(argv: list[str] | None = None) -> int:
+    """一括解析を実行."""
+    parser = argparse.ArgumentParser(description="提出ファイルを一括で解析し、結果を JSONL で出力する")
+    parser.add_argument("inputs", nargs="+", type=Path, help="ディレクトリ・tar アーカイブ・*.py")
+    parser.add_argument("-o", "--output", default="-", help="出力する JSONL のパス (- で標準出力、既定: -)")
+    parser.add_argument(
+        "--tasks", type=parse_tasks, default=("analyze",), help="実行する処理 (analyze,visualize,error)"
+    )
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="ワーカープロセス数")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="1 回にワーカーへ渡すファイル数")
+    parser.add_argument("--timeout", type=float, default=30.0, help="1 ファイルあたりの締め切り (秒、0 で無制限)")
+    parser.add_argument("--no-flow", action="store_true", help="可視化でフロー図 (SVG) を生成しない")
+    parser.add_argument("--checkpoint", type=Path, help="チェックポイントのパス (既定: 出力のパス + .checkpoint)")
+    parser.add_argument("--resume", action="store_true", help="チェックポイントから再開する")
+    parser.add_argument("--verbose", action="store_true", help="サービスのログを出す")
+    args = parser.parse_args(argv)
+
+    if args.output == "-" and args.resume:
+        parser.error("--resume には --output でファイルを指定してください")
+
+    options = Options(
+        tasks=args.tasks,
+        show_flow=not args.no_flow,
+        timeout=args.timeout or None,
+        verbose=args.verbose,
+    )
+    checkpoint: Checkpoint | None = None
+    done: set[str] = set()
+    if args.output == "-":
+        output = sys.stdout.buffer
+    else:
+        output_path = Path(args.output)
+        checkpoint = Checkpoint(args.checkpoint or output_path.with_name(output_path.name + ".checkpoint"))
+        resuming = args.resume and output_path.exists()
+        offset = 0
+        if resuming:
+            done, offset = checkpoint.load()
+        output = output_path.open("r+b" if resuming else "wb")
+        # チェックポイントに記録する前に中断した行を捨てる
+        output.truncate(offset)
+        output.seek(offset)
+        checkpoint.open(append=resuming)
+
+    runner = BatchRunner(
+        output,
+        checkpoint,
+        options,
+        workers=max(1, args.workers),
+        chunk_size=max(1, args.chunk_size),
+    )
+    try:
+        summary = runner.run(iter_submissions(args.inputs), done)
+    except KeyboardInterrupt:
+        print("\n中断しました. --resume を付けて実行すると続きから解析します", file=sys.stderr)
+        return 130
+    finally:
+        if checkpoint is not None:
+            checkpoint.close()
+        if output is not sys.stdout.buffer:
+            output.close()
+
+    rate = summary.processed / summary.elapsed if summary.elapsed > 0 else 0.0
+    print(
+        f"解析 {summary.processed} 件 (失敗 {summary.failed} 件), 処理済みのため飛ばした {summary.skipped} 件, "
+        f"{summary.elapsed:.1f} 秒 ({rate:.1f} 件/秒)",
+        file=sys.stderr,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
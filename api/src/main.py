@@ -3,8 +3,12 @@
 共通バックエンドとして動作
 """
 
+import asyncio
 import logging
+import os
 import traceback
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
@@ -20,8 +24,68 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
+from .middleware.compression import CompressionMiddleware
+from .middleware.deadline import DeadlineMiddleware
+from .middleware.metrics import MetricsMiddleware
+from .middleware.rate_limit import RateLimitMiddleware
+
 # ルーターのインポート
-from .routers import analysis, error_analysis, visualization
+from .routers import (
+    analysis,
+    cache,
+    classroom,
+    error_analysis,
+    execution,
+    inspect,
+    live,
+    metrics,
+    similarity,
+    visualization,
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:  # noqa: ARG001
+    """起動時にサンドボックスのワーカーを事前起動し、終了時に停止.
+
+    終了時には永続キャッシュの書き込み待ちの結果も書き込み、類似度の索引を閉じる.
+
+    STARTUP_WARMUP=true の場合は、リクエストを受け付ける前に各サービスを温めておく.
+
+    WEB_CONCURRENCY が 2 以上の場合、ワーカーごとに分かれてしまう状態 (クラスの統計、
+    SIMILARITY_DB_PATH を設定していない類似度の索引) を警告する.
+    """
+    if int(os.getenv("WEB_CONCURRENCY", "1")) > 1:
+        from .services.similarity import DB_PATH as SIMILARITY_DB_PATH  # noqa: PLC0415
+
+        logger.warning(
+            "WEB_CONCURRENCY > 1: classroom error stats are kept per worker, "
+            "so each request sees only the events recorded by the worker that serves it",
+        )
+        if not SIMILARITY_DB_PATH:
+            logger.warning(
+                "WEB_CONCURRENCY > 1 without SIMILARITY_DB_PATH: each worker keeps its own in-memory "
+                "similarity index; set SIMILARITY_DB_PATH to a local file to share it",
+            )
+    sandbox_enabled = os.getenv("SANDBOX_PREFORK", "true").lower() == "true"
+    if sandbox_enabled:
+        from .services.sandbox import get_sandbox_pool  # noqa: PLC0415
+
+        await get_sandbox_pool().start()
+    if os.getenv("STARTUP_WARMUP", "false").lower() == "true":
+        from .services.warmup import warm_up  # noqa: PLC0415
+
+        await warm_up()
+    yield
+    if sandbox_enabled:
+        await get_sandbox_pool().close()
+    from .services.persistent_cache import close_persistent_cache  # noqa: PLC0415
+
+    await asyncio.to_thread(close_persistent_cache)
+    from .services.similarity import close_similarity_index  # noqa: PLC0415
+
+    await asyncio.to_thread(close_similarity_index)
+
 
 # FastAPIアプリケーションの初期化
 app = FastAPI(
@@ -30,8 +94,17 @@ app = FastAPI(
     version="1.0.0",
     docs_url="/docs",
     redoc_url="/redoc",
+    lifespan=lifespan,
 )
 
+# クライアントごとのレート制限と同時実行数の制御
+# (断ったレスポンスにも CORS ヘッダーが付くよう CORS より内側に置く)
+app.add_middleware(RateLimitMiddleware)
+
+# リクエストの締め切りと切断したリクエストの取り消し
+# (順番待ちの間も切断を検出し、504 にも CORS ヘッダーが付くようレート制限と CORS の間に置く)
+app.add_middleware(DeadlineMiddleware)
+
 # CORS設定（将来のWebフロントエンド対応）
 app.add_middleware(
     CORSMiddleware,
@@ -39,12 +112,27 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # ブラウザーから条件付きリクエスト (ETag) と再試行の待ち時間 (Retry-After) を読めるようにする
+    expose_headers=["ETag", "Retry-After"],
 )
 
+# レスポンス圧縮 (gzip / brotli)
+app.add_middleware(CompressionMiddleware)
+
+# リクエストのメトリクス (圧縮後のレスポンスサイズを記録するため最も外側に置く)
+app.add_middleware(MetricsMiddleware)
+
 # ルーターの登録
 app.include_router(analysis.router, prefix="/api/v1", tags=["analysis"])
 app.include_router(visualization.router, prefix="/api/v1", tags=["visualization"])
 app.include_router(error_analysis.router, prefix="/api/v1", tags=["error"])
+app.include_router(inspect.router, prefix="/api/v1", tags=["inspect"])
+app.include_router(live.router, prefix="/api/v1", tags=["live"])
+app.include_router(execution.router, prefix="/api/v1", tags=["execution"])
+app.include_router(classroom.router, prefix="/api/v1", tags=["classroom"])
+app.include_router(similarity.router, prefix="/api/v1", tags=["similarity"])
+app.include_router(cache.router, prefix="/api/v1", tags=["cache"])
+app.include_router(metrics.router, tags=["metrics"])
 
 
 # ヘルスチェックモデル
@@ -108,4 +196,11 @@ async def not_found_handler(request: Request, exc: object) -> JSONResponse:
 if __name__ == "__main__":
     import uvicorn
 
-    uvicorn.run(app, host="0.0.0.0", port=8000, log_level="debug")  # noqa: S104
+    # WEB_CONCURRENCY でワーカー数を指定 (ワーカー間で結果キャッシュを共有する)
+    uvicorn.run(
+        "src.main:app",
+        host="0.0.0.0",  # noqa: S104
+        port=8000,
+        log_level="debug",
+        workers=int(os.getenv("WEB_CONCURRENCY", "1")),
+    )
@@ -0,0 +1 @@
+"""ミドルウェア."""
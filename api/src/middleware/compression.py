@@ -0,0 +1,223 @@
+"""レスポンス圧縮ミドルウェア.
+
+/visualize の SVG やステップ配列は同じキーや要素の繰り返しが多く、圧縮がよく効く.
+一定サイズ以上のレスポンスを、クライアントの Accept-Encoding に合わせて brotli または gzip で圧縮する
+(brotli は依存関係に含まれる. インストールされていない環境では gzip だけを使う).
+
+強い ETag が付いたレスポンスを圧縮した場合は、ETag に圧縮方式の接尾辞 (-br, -gzip) を付けて
+圧縮前の表現と区別する.
+
+同じ本文を何度も圧縮しないよう、圧縮結果は本文のダイジェストをキーにした LRU キャッシュに保持する.
+解析結果が同じなら本文も同じになるため、キャッシュ済みの結果は圧縮済みのまま返せる.
+
+COMPRESSION_OFFLOAD_SIZE 以上の本文の圧縮は、ほかのリクエストを止めないようワーカースレッドで行う.
+"""
+
+import asyncio
+import gzip
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from ..services.metrics import REGISTRY
+
+try:
+    import brotli
+except ImportError:  # 依存関係を同期していない環境でも gzip は使えるようにする
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# 圧縮する最小サイズ (バイト). これより小さい本文はそのまま返す
+MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "5"))
+# ワーカースレッドで圧縮する本文の最小サイズ (バイト). 小さい本文はスレッドに渡す手間のほうが大きい
+OFFLOAD_SIZE = int(os.getenv("COMPRESSION_OFFLOAD_SIZE", "32768"))
+# 圧縮済み本文のキャッシュの上限 (MB, 0 で無効)
+CACHE_MB = float(os.getenv("COMPRESSION_CACHE_MB", "32"))
+
+COMPRESSIBLE_TYPES = ("application/json", "application/msgpack", "image/svg+xml", "text/")
+
+
+def _parse_accept_encoding(value: str) -> dict[str, float]:
+    """Accept-Encoding ヘッダーをエンコーディングごとの優先度に変換."""
+    accepted: dict[str, float] = {}
+    for part in value.split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        key, _, raw = params.strip().partition("=")
+        if key.strip() == "q":
+            try:
+                quality = float(raw)
+            except ValueError:
+                quality = 0.0
+        accepted[coding] = quality
+    return accepted
+
+
+def choose_encoding(accept_encoding: str) -> str | None:
+    """使用する圧縮方式を選ぶ (優先度が同じなら brotli を優先)."""
+    accepted = _parse_accept_encoding(accept_encoding)
+    wildcard = accepted.get("*", 0.0)
+    candidates = ["br", "gzip"] if brotli is not None else ["gzip"]
+    best, best_quality = None, 0.0
+    for coding in candidates:
+        quality = accepted.get(coding, wildcard)
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    """本文を指定の方式で圧縮."""
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+async def compress_off_loop(body: bytes, encoding: str, offload_size: int = OFFLOAD_SIZE) -> bytes:
+    """本文を圧縮 (offload_size 以上の本文はイベントループを止めないようワーカースレッドで圧縮)."""
+    if len(body) >= offload_size:
+        return await asyncio.to_thread(compress, body, encoding)
+    return compress(body, encoding)
+
+
+class CompressedBodyCache:
+    """圧縮済み本文の LRU キャッシュ (合計バイト数で上限を設ける)."""
+
+    def __init__(self, max_bytes: int) -> None:
+        """コンストラクタ."""
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[tuple[bytes, str], bytes] = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def get_or_compress(self, body: bytes, encoding: str, offload_size: int = OFFLOAD_SIZE) -> bytes:
+        """キャッシュにあればそれを返し、なければ圧縮して保存.
+
+        Args:
+            body: 圧縮する本文
+            encoding: 圧縮方式 (br, gzip)
+            offload_size: ワーカースレッドで圧縮する本文の最小サイズ (バイト)
+        """
+        if self.max_bytes <= 0:
+            return await compress_off_loop(body, encoding, offload_size)
+
+        key = (hashlib.blake2b(body, digest_size=16).digest(), encoding)
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return cached
+            self.misses += 1
+
+        compressed = await compress_off_loop(body, encoding, offload_size)
+        if len(compressed) > self.max_bytes:
+            return compressed
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = compressed
+                self.size += len(compressed)
+                while self.size > self.max_bytes:
+                    _, evicted = self._entries.popitem(last=False)
+                    self.size -= len(evicted)
+        return compressed
+
+
+compressed_cache = CompressedBodyCache(int(CACHE_MB * 1024 * 1024))
+
+
+def _collect_metrics() -> list[tuple[str, str, str, list[tuple[dict[str, str], float]]]]:
+    """/metrics 用の圧縮キャッシュの値."""
+    return [
+        ("compression_cache_hits_total", "counter", "圧縮済み本文のキャッシュヒット数", [({}, compressed_cache.hits)]),
+        (
+            "compression_cache_misses_total",
+            "counter",
+            "圧縮済み本文のキャッシュミス数",
+            [({}, compressed_cache.misses)],
+        ),
+        (
+            "compression_cache_bytes",
+            "gauge",
+            "圧縮済み本文のキャッシュの使用量 (バイト)",
+            [({}, compressed_cache.size)],
+        ),
+    ]
+
+
+REGISTRY.add_collector(_collect_metrics)
+
+
+class CompressionMiddleware:
+    """レスポンス圧縮の ASGI ミドルウェア.
+
+    本文を 1 回で送るレスポンスだけを圧縮し、ストリーミングレスポンスはそのまま流す.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = MIN_SIZE, offload_size: int = OFFLOAD_SIZE) -> None:
+        """コンストラクタ."""
+        self.app = app
+        self.minimum_size = minimum_size
+        self.offload_size = offload_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """リクエストを処理."""
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message: Message | None = None
+
+        async def send_compressed(message: Message) -> None:
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                # 本文を見るまでヘッダーの送信を保留する
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or start_message is None:
+                await send(message)
+                return
+
+            initial, start_message = start_message, None
+            body = message.get("body", b"")
+            headers = MutableHeaders(raw=initial["headers"])
+            content_type = headers.get("content-type", "")
+            if (
+                message.get("more_body", False)
+                or len(body) < self.minimum_size
+                or "content-encoding" in headers
+                or not content_type.startswith(COMPRESSIBLE_TYPES)
+            ):
+                await send(initial)
+                await send(message)
+                return
+
+            compressed = await compressed_cache.get_or_compress(body, encoding, self.offload_size)
+            etag = headers.get("etag")
+            if etag is not None and etag.startswith('"'):
+                headers["etag"] = f'{etag[:-1]}-{encoding}"'
+            headers["content-encoding"] = encoding
+            headers["content-length"] = str(len(compressed))
+            headers.add_vary_header("Accept-Encoding")
+            await send(initial)
+            await send({"type": "http.response.body", "body": compressed})
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,132 @@
+"""リクエストの締め切りと切断の検出.
+
+解析系のエンドポイントで、リクエストごとの締め切り (services/deadline.py) を設定する.
+締め切りは X-Request-Deadline-Ms ヘッダー (締め切りまでの残りミリ秒) で指定でき、
+指定がない場合や REQUEST_DEADLINE_SECONDS より長い場合はその値にする.
+
+- 締め切りまでに解析が終わらなければ処理を打ち切り、504 を返す
+- リクエストの本文を読み終えた後にクライアントが切断した場合は処理のタスクを取り消す.
+  結果を待っているリクエストがいなくなった計算は、ワーカースレッドの中でも打ち切られる
+"""
+
+import asyncio
+import logging
+import os
+
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from ..services.deadline import ABORTED, DEFAULT_SECONDS, Deadline, DeadlineExceeded, reset_deadline, set_deadline
+
+logger = logging.getLogger(__name__)
+
+# 締め切りを設定するパスのプレフィックス (カンマ区切り)
+_DEFAULT_PATHS = "/api/v1/analyze,/api/v1/visualize,/api/v1/inspect"
+DEADLINE_PATHS = tuple(path.strip() for path in os.getenv("DEADLINE_PATHS", _DEFAULT_PATHS).split(",") if path.strip())
+
+DEADLINE_HEADER = "x-request-deadline-ms"
+
+
+def request_deadline(scope: Scope, default_seconds: float = DEFAULT_SECONDS) -> Deadline:
+    """リクエストの締め切りを決める (ヘッダーの値と既定値の短いほう)."""
+    seconds = default_seconds if default_seconds > 0 else None
+    value = Headers(scope=scope).get(DEADLINE_HEADER)
+    if value is not None:
+        try:
+            requested = max(0.0, float(value) / 1000)
+        except ValueError:
+            logger.debug("Ignoring invalid %s header: %r", DEADLINE_HEADER, value)
+        else:
+            seconds = requested if seconds is None else min(seconds, requested)
+    if seconds is not None and seconds <= 0:
+        # すでに締め切りを過ぎている (負の値にすると Deadline.after が締め切りなしとみなすため)
+        return Deadline(0.0)
+    return Deadline.after(seconds)
+
+
+class _Connection:
+    """1 つのリクエストの受信・送信を中継し、本文を読み終えた後の切断を見張る."""
+
+    def __init__(self, receive: Receive, send: Send) -> None:
+        """コンストラクタ."""
+        self._receive = receive
+        self._send = send
+        self.body_received = asyncio.Event()
+        self.disconnected = asyncio.Event()
+        self.response_started = False
+
+    async def receive(self) -> Message:
+        """アプリケーションへの受信 (本文を読み終えた後は切断の通知を待つ)."""
+        if self.body_received.is_set():
+            await self.disconnected.wait()
+            return {"type": "http.disconnect"}
+        message = await self._receive()
+        if message["type"] == "http.disconnect":
+            self.disconnected.set()
+        elif not message.get("more_body", False):
+            self.body_received.set()
+        return message
+
+    async def send(self, message: Message) -> None:
+        """アプリケーションからの送信 (レスポンスを始めたかを記録する)."""
+        if message["type"] == "http.response.start":
+            self.response_started = True
+        await self._send(message)
+
+    async def watch(self, task: asyncio.Task[None]) -> None:
+        """本文を読み終えた後にクライアントが切断したら、処理のタスクを取り消す."""
+        await self.body_received.wait()
+        while True:
+            message = await self._receive()
+            if message["type"] == "http.disconnect":
+                self.disconnected.set()
+                task.cancel()
+                return
+
+
+class DeadlineMiddleware:
+    """締め切りの設定と、切断したリクエストの取り消しを行う ASGI ミドルウェア."""
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        *,
+        paths: tuple[str, ...] = DEADLINE_PATHS,
+        default_seconds: float = DEFAULT_SECONDS,
+    ) -> None:
+        """コンストラクタ."""
+        self.app = app
+        self.paths = paths
+        self.default_seconds = default_seconds
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """リクエストを処理."""
+        if scope["type"] != "http" or not scope["path"].startswith(self.paths):
+            await self.app(scope, receive, send)
+            return
+
+        connection = _Connection(receive, send)
+        token = set_deadline(request_deadline(scope, self.default_seconds))
+        try:
+            # タスクは現在のコンテキスト (締め切り) を引き継ぐ
+            task = asyncio.create_task(self.app(scope, connection.receive, connection.send))
+        finally:
+            reset_deadline(token)
+        watcher = asyncio.create_task(connection.watch(task))
+        try:
+            await task
+        except asyncio.CancelledError:
+            if not connection.disconnected.is_set():
+                raise
+            ABORTED.inc("disconnected")
+            logger.info("Client disconnected, cancelled %s", scope["path"])
+        except DeadlineExceeded as e:
+            if connection.response_started:
+                raise
+            logger.warning("Deadline exceeded: %s (%s)", scope["path"], e)
+            response = JSONResponse(status_code=504, content={"error": str(e), "status": 504})
+            await response(scope, receive, send)
+        finally:
+            watcher.cancel()
+            task.cancel()
@@ -0,0 +1,72 @@
+"""リクエストのメトリクスを記録するミドルウェア.
+
+ルートごとの処理時間・ステータスコード・レスポンスサイズと、処理中のリクエスト数を記録する.
+ルートのラベルにはパスそのものではなくルートのパスのテンプレート (/api/v1/classroom/{class_id}/errors など)
+を使い、ラベルの種類が増え続けないようにする.
+"""
+
+import re
+import time
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from ..services.metrics import IN_FLIGHT, REQUEST_DURATION, REQUESTS, RESPONSE_SIZE
+
+UNMATCHED_ROUTE = "<unmatched>"
+
+_PATH_PARAM = re.compile(r"\{(\w+)(?::\w+)?\}")
+
+
+def route_template(scope: Scope) -> str:
+    """リクエストが一致したルートのパスのテンプレートを取得.
+
+    ルーターのプレフィックスがルートのパスに含まれない FastAPI のバージョンでも
+    完全なパスになるよう、実際のパスからプレフィックスを補う.
+    """
+    route = scope.get("route")
+    template = getattr(route, "path", None)
+    if template is None:
+        return UNMATCHED_ROUTE
+    params = scope.get("path_params", {})
+    rendered = _PATH_PARAM.sub(lambda match: str(params.get(match.group(1), match.group(0))), template)
+    path = scope["path"]
+    if path != rendered and path.endswith(rendered):
+        return path[: len(path) - len(rendered)] + template
+    return template
+
+
+class MetricsMiddleware:
+    """リクエストのメトリクスを記録する ASGI ミドルウェア."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        """コンストラクタ."""
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """リクエストを処理."""
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+        size = 0
+
+        async def send_with_metrics(message: Message) -> None:
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            IN_FLIGHT.dec()
+            path = route_template(scope)
+            method = scope["method"]
+            REQUESTS.inc(path, method, str(status))
+            REQUEST_DURATION.observe(time.perf_counter() - started, path, method)
+            RESPONSE_SIZE.observe(size, path)
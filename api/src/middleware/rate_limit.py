@@ -0,0 +1,234 @@
+"""クライアントごとのレート制限と同時実行数の制御.
+
+授業中の自動送信ループや、ツールを繰り返し呼び出す MCP エージェントが 1 つあるだけで、
+学校全体のリクエストが遅くなることがある. 解析系のエンドポイントの前で次の 2 段階の制御を行う.
+
+1. クライアント (API キーまたは IP アドレス) ごとのトークンバケットによるレート制限.
+   超えた場合は 429 と、次のトークンが貯まるまでの秒数を Retry-After で返す.
+2. ワーカープロセス全体の同時実行数の制限. 上限に達している間は待ち行列で待たせ、
+   待ち行列があふれた場合や待ち時間が長すぎる場合は 503 と Retry-After を返す.
+
+どちらの値もワーカープロセスごとに管理する.
+"""
+
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import OrderedDict
+
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from ..services.metrics import LATENCY_BUCKETS, REGISTRY, Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+# 制限の対象にするパスのプレフィックス (カンマ区切り)
+_DEFAULT_PATHS = "/api/v1/analyze,/api/v1/visualize,/api/v1/inspect,/api/v1/run-and-diagnose"
+LIMITED_PATHS = tuple(path.strip() for path in os.getenv("RATE_LIMIT_PATHS", _DEFAULT_PATHS).split(",") if path.strip())
+# クライアントごとの 1 分あたりのリクエスト数と、連続して受け付けられる数.
+# 学校の NAT の後ろではクラス全員が同じ IP アドレスになるため、2 クラス (80 人) が同時に
+# 「実行」を押しても (1 人あたり /analyze・/visualize・/analyze-error の 2〜3 件) 断らない値にする
+PER_MINUTE = float(os.getenv("RATE_LIMIT_PER_MINUTE", "1200"))
+BURST = float(os.getenv("RATE_LIMIT_BURST", "240"))
+# 追跡するクライアント数の上限 (古いものから忘れる)
+MAX_CLIENTS = int(os.getenv("RATE_LIMIT_MAX_CLIENTS", "10000"))
+# クライアントを API キーで区別する場合のキー (カンマ区切り). 登録されていないキーは無視して IP で区別する
+API_KEYS = frozenset(key.strip() for key in os.getenv("RATE_LIMIT_API_KEYS", "").split(",") if key.strip())
+# X-Forwarded-For を信頼するプロキシの段数. Cloud Run (K_SERVICE が設定される) では
+# 全リクエストがフロントエンドのプロキシから届くため、既定で右端の 1 段を信頼する
+PROXY_HOPS = int(os.getenv("RATE_LIMIT_PROXY_HOPS", "1" if os.getenv("K_SERVICE") else "0"))
+
+# 同時に処理するリクエスト数の上限 (0 で無制限)
+MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT", "16"))
+# 上限に達しているときに待たせるリクエスト数と、待つ最大時間 (秒)
+MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "64"))
+QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "5.0"))
+# 混雑で断った場合に返す Retry-After (秒)
+OVERLOAD_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "1"))
+
+API_KEY_HEADER = "x-api-key"
+
+REJECTED = REGISTRY.register(
+    Counter("admission_rejected_total", "レート制限・同時実行数の制限で断ったリクエスト数", ("reason",)),
+)
+QUEUE_WAIT = REGISTRY.register(
+    Histogram("admission_queue_wait_seconds", "同時実行数の制限で待った時間 (秒)", (), LATENCY_BUCKETS),
+)
+
+
+class TokenBucketLimiter:
+    """クライアントごとのトークンバケット.
+
+    トークンは 1 秒あたり per_minute / 60 個ずつ、最大 burst 個まで貯まる.
+    1 リクエストごとに 1 個消費し、足りなければ断る.
+    """
+
+    def __init__(self, per_minute: float, burst: float, max_clients: int) -> None:
+        """コンストラクタ."""
+        self.rate = per_minute / 60
+        self.burst = max(burst, 1.0)
+        self.max_clients = max_clients
+        # クライアント -> (トークン数, 最終更新時刻)
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    @property
+    def clients(self) -> int:
+        """追跡中のクライアント数."""
+        return len(self._buckets)
+
+    def acquire(self, client: str, now: float | None = None) -> float:
+        """トークンを 1 個消費.
+
+        Returns:
+            受け付けた場合は 0、断った場合は次のトークンが貯まるまでの秒数
+        """
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic() if now is None else now
+        tokens, updated = self._buckets.pop(client, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        if tokens >= 1:
+            tokens -= 1
+            wait = 0.0
+        else:
+            wait = (1 - tokens) / self.rate
+        self._buckets[client] = (tokens, now)
+        while len(self._buckets) > self.max_clients:
+            self._buckets.popitem(last=False)
+        return wait
+
+
+class AdmissionController:
+    """ワーカープロセス全体の同時実行数の制御."""
+
+    def __init__(self, max_concurrent: int, max_queue: int, queue_timeout: float) -> None:
+        """コンストラクタ."""
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.waiting = 0
+        self._semaphore: asyncio.Semaphore | None = None
+
+    async def acquire(self) -> str | None:
+        """実行枠を確保.
+
+        Returns:
+            確保できた場合は None、断った場合はその理由
+        """
+        if self.max_concurrent <= 0:
+            self.in_flight += 1
+            return None
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        if self._semaphore.locked():
+            if self.waiting >= self.max_queue:
+                return "queue_full"
+            started = time.perf_counter()
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+            except TimeoutError:
+                return "queue_timeout"
+            finally:
+                self.waiting -= 1
+                QUEUE_WAIT.observe(time.perf_counter() - started)
+        else:
+            await self._semaphore.acquire()
+        self.in_flight += 1
+        return None
+
+    def release(self) -> None:
+        """実行枠を返却."""
+        self.in_flight -= 1
+        if self._semaphore is not None:
+            self._semaphore.release()
+
+
+limiter = TokenBucketLimiter(PER_MINUTE, BURST, MAX_CLIENTS)
+admission = AdmissionController(MAX_CONCURRENT, MAX_QUEUE, QUEUE_TIMEOUT)
+
+
+def _collect_metrics() -> list[tuple[str, str, str, list[tuple[dict[str, str], float]]]]:
+    """/metrics 用のレート制限・同時実行数の値."""
+    return [
+        ("admission_in_flight", "gauge", "同時実行数の制限の対象で処理中のリクエスト数", [({}, admission.in_flight)]),
+        ("admission_queue_waiting", "gauge", "実行枠を待っているリクエスト数", [({}, admission.waiting)]),
+        ("rate_limit_clients", "gauge", "レート制限で追跡中のクライアント数", [({}, limiter.clients)]),
+    ]
+
+
+REGISTRY.add_collector(_collect_metrics)
+
+
+def client_id(scope: Scope) -> str:
+    """レート制限でクライアントを区別するための ID を取得.
+
+    登録済みの API キーがあればキーごと、なければ IP アドレスごとに区別する.
+    """
+    headers = Headers(scope=scope)
+    api_key = headers.get(API_KEY_HEADER)
+    if api_key and api_key in API_KEYS:
+        return f"key:{api_key}"
+    if PROXY_HOPS > 0:
+        # プロキシが付け足した右端の値だけを信頼する (左側はクライアントが偽装できる)
+        forwarded = [value.strip() for value in headers.get("x-forwarded-for", "").split(",") if value.strip()]
+        if len(forwarded) >= PROXY_HOPS:
+            return f"ip:{forwarded[-PROXY_HOPS]}"
+    client = scope.get("client")
+    return f"ip:{client[0]}" if client else "ip:unknown"
+
+
+def _reject(status_code: int, message: str, retry_after: float) -> JSONResponse:
+    """制限で断ったときのレスポンス."""
+    seconds = max(1, math.ceil(retry_after))
+    return JSONResponse(
+        status_code=status_code,
+        content={"error": message, "status": status_code, "retry_after": seconds},
+        headers={"Retry-After": str(seconds)},
+    )
+
+
+class RateLimitMiddleware:
+    """レート制限と同時実行数の制御を行う ASGI ミドルウェア."""
+
+    def __init__(self, app: ASGIApp, *, enabled: bool = ENABLED, paths: tuple[str, ...] = LIMITED_PATHS) -> None:
+        """コンストラクタ."""
+        self.app = app
+        self.enabled = enabled
+        self.paths = paths
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """リクエストを処理."""
+        if not self.enabled or scope["type"] != "http" or not scope["path"].startswith(self.paths):
+            await self.app(scope, receive, send)
+            return
+
+        client = client_id(scope)
+        wait = limiter.acquire(client)
+        if wait > 0:
+            REJECTED.inc("rate_limit")
+            logger.info("Rate limited: %s (retry after %.1fs)", client, wait)
+            response = _reject(429, "リクエストが多すぎます。しばらく待ってから再度お試しください", wait)
+            await response(scope, receive, send)
+            return
+
+        reason = await admission.acquire()
+        if reason is not None:
+            REJECTED.inc(reason)
+            logger.warning("Admission rejected (%s): %s", reason, client)
+            response = _reject(
+                503, "サーバーが混み合っています。しばらく待ってから再度お試しください", OVERLOAD_RETRY_AFTER
+            )
+            await response(scope, receive, send)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            admission.release()
@@ -0,0 +1,4 @@
+"""Pydantic モデル.
+
+各エンドポイントのリクエスト/レスポンスモデル.
+"""
@@ -0,0 +1,170 @@
+"""コード解析リクエスト/レスポンスモデル."""
+
+from pydantic import BaseModel
+
+
+class AnalyzeRequest(BaseModel):
+    """コード解析リクエストモデル."""
+
+    code: str
+    options: dict | None = None
+
+
+class ImportInfo(BaseModel):
+    """インポート情報モデル."""
+
+    type: str
+    name: str
+    alias: str | None = None
+    module: str | None = None
+    line: int
+
+
+class FunctionInfo(BaseModel):
+    """関数情報モデル."""
+
+    name: str
+    line: int
+    args: list[str]
+    decorators: list[str]
+    docstring: str | None = None
+    complexity: int
+
+
+class MethodInfo(BaseModel):
+    """メソッド情報モデル."""
+
+    name: str
+    line: int
+    is_static: bool
+    is_class: bool
+
+
+class ClassInfo(BaseModel):
+    """クラス情報モデル."""
+
+    name: str
+    line: int
+    bases: list[str]
+    decorators: list[str]
+    docstring: str | None = None
+    methods: list[MethodInfo]
+
+
+class VariableInfo(BaseModel):
+    """変数情報モデル."""
+
+    name: str
+    line: int
+    type: str
+
+
+class LoopInfo(BaseModel):
+    """ループ情報モデル."""
+
+    type: str
+    line: int
+    target: str | None = None
+    iter: str | None = None
+    has_else: bool
+
+
+class ConditionalInfo(BaseModel):
+    """条件分岐情報モデル."""
+
+    type: str
+    line: int
+    has_else: bool
+    elif_count: int
+
+
+class ScopeInfo(BaseModel):
+    """スコープ情報モデル."""
+
+    name: str
+    type: str
+    line: int
+    defined: list[str]
+    free: list[str]
+    undefined: list[str]
+
+
+class CodeLocation(BaseModel):
+    """行の範囲モデル."""
+
+    start_line: int
+    end_line: int
+
+
+class DuplicateCode(BaseModel):
+    """重複したコードモデル."""
+
+    type: str
+    nodes: int
+    occurrences: list[CodeLocation]
+
+
+class CodeStructure(BaseModel):
+    """コード構造モデル."""
+
+    imports: list[ImportInfo]
+    functions: list[FunctionInfo]
+    classes: list[ClassInfo]
+    variables: list[VariableInfo]
+    loops: list[LoopInfo]
+    conditionals: list[ConditionalInfo]
+    complexity: int
+    scopes: list[ScopeInfo] = []
+    undefined_names: list[str] = []
+    duplicates: list[DuplicateCode] = []
+
+
+class StyleIssue(BaseModel):
+    """スタイルの問題モデル."""
+
+    line: int
+    type: str
+    message: str
+    severity: str
+
+
+class Improvement(BaseModel):
+    """改善提案モデル."""
+
+    type: str
+    message: str
+
+
+class AnalysisStats(BaseModel):
+    """統計情報モデル."""
+
+    total_lines: int
+    code_lines: int
+    import_count: int
+    function_count: int
+    class_count: int
+    complexity_score: int
+
+
+class AnalysisSummary(BaseModel):
+    """解析サマリーモデル."""
+
+    total_issues: int
+    total_suggestions: int
+    quality_score: int
+
+
+class AnalyzeResponse(BaseModel):
+    """コード解析レスポンスモデル."""
+
+    success: bool
+    error: str | None = None
+    message: str | None = None
+    line: int | None = None
+    offset: int | None = None
+    text: str | None = None
+    structure: CodeStructure | None = None
+    style_issues: list[StyleIssue] | None = None
+    improvements: list[Improvement] | None = None
+    stats: AnalysisStats | None = None
+    summary: AnalysisSummary | None = None
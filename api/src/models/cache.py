@@ -0,0 +1,50 @@
+"""キャッシュ統計レスポンスモデル."""
+
+from pydantic import BaseModel
+
+
+class ResultCacheInfo(BaseModel):
+    """結果キャッシュの統計モデル."""
+
+    enabled: bool
+    path: str | None = None
+    slots: int
+    slot_kb: int
+    hits: int
+    misses: int
+    stores: int
+    too_large: int
+    hit_rate: float
+
+
+class PersistentCacheInfo(BaseModel):
+    """永続キャッシュの統計モデル."""
+
+    enabled: bool
+    path: str | None = None
+    entries: int
+    size_bytes: int
+    hits: int
+    misses: int
+    writes: int
+    dropped: int
+    evicted: int
+    hit_rate: float
+
+
+class SingleFlightInfo(BaseModel):
+    """single-flight の統計モデル."""
+
+    leaders: int
+    coalesced: int
+    in_flight: int
+    coalesce_rate: float
+
+
+class CacheStatsResponse(BaseModel):
+    """キャッシュ統計レスポンスモデル."""
+
+    pid: int
+    cache: ResultCacheInfo
+    persistent: PersistentCacheInfo
+    single_flight: SingleFlightInfo
@@ -0,0 +1,22 @@
+"""クラス統計レスポンスモデル."""
+
+from pydantic import BaseModel
+
+
+class RankedItem(BaseModel):
+    """ランキング項目モデル."""
+
+    value: str
+    count: int
+
+
+class ClassroomErrorsResponse(BaseModel):
+    """クラスのエラー統計レスポンスモデル."""
+
+    class_id: str
+    window_seconds: int
+    events: int
+    distinct_students: int
+    top_error_types: list[RankedItem]
+    top_signatures: list[RankedItem]
+    top_line_patterns: list[RankedItem]
@@ -0,0 +1,93 @@
+"""エラー解析リクエスト/レスポンスモデル."""
+
+from pydantic import BaseModel
+
+
+class ErrorAnalyzeRequest(BaseModel):
+    """エラー解析リクエストモデル."""
+
+    code: str
+    error_message: str
+    class_id: str | None = None
+    student_id: str | None = None
+
+
+class SimilarExample(BaseModel):
+    """類似例モデル."""
+
+    wrong: str
+    correct: str
+    explanation: str
+
+
+class GuideStep(BaseModel):
+    """解決ガイドのステップモデル."""
+
+    step: int
+    action: str
+    detail: str
+
+
+class VisualExplanation(BaseModel):
+    """視覚的な説明モデル."""
+
+    type: str
+    content: str
+
+
+class ErrorContext(BaseModel):
+    """エラー箇所のコンテキストモデル."""
+
+    problematic_line: str
+    surrounding_lines: list[str]
+    indentation_level: int
+
+
+class ErrorAnalyzeResponse(BaseModel):
+    """エラー解析レスポンスモデル."""
+
+    success: bool
+    error_type: str
+    line_number: int
+    column_number: int
+    simple_explanation: str
+    detailed_explanation: str
+    common_causes: list[str]
+    fix_suggestions: list[str]
+    similar_examples: list[SimilarExample]
+    learning_resources: list[str]
+    concept_explanation: str = ""
+    difficulty_level: int = 1
+    step_by_step_guide: list[GuideStep] = []
+    visual_explanation: VisualExplanation | None = None
+    context: ErrorContext | None = None
+
+
+class ErrorLogAnalyzeRequest(BaseModel):
+    """エラーログ一括解析リクエストモデル."""
+
+    code: str
+    log: str | None = None
+    error_messages: list[str] = []
+    filename: str | None = None
+    class_id: str | None = None
+    student_id: str | None = None
+
+
+class ErrorDiagnosis(BaseModel):
+    """重複をまとめた診断モデル."""
+
+    error_message: str
+    occurrences: int
+    indices: list[int]
+    analysis: ErrorAnalyzeResponse
+
+
+class ErrorLogAnalyzeResponse(BaseModel):
+    """エラーログ一括解析レスポンスモデル."""
+
+    success: bool
+    error_count: int
+    unique_count: int
+    error_messages: list[str]
+    diagnoses: list[ErrorDiagnosis]
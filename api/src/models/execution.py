@@ -0,0 +1,27 @@
+"""実行・診断リクエスト/レスポンスモデル."""
+
+from pydantic import BaseModel
+
+from .error_analysis import ErrorAnalyzeResponse
+
+
+class RunRequest(BaseModel):
+    """実行リクエストモデル."""
+
+    code: str
+    stdin: str = ""
+    class_id: str | None = None
+    student_id: str | None = None
+
+
+class RunResponse(BaseModel):
+    """実行・診断レスポンスモデル."""
+
+    success: bool
+    status: str
+    stdout: str
+    stdout_truncated: bool
+    elapsed_ms: float
+    error_message: str | None = None
+    traceback: str | None = None
+    diagnosis: ErrorAnalyzeResponse | None = None
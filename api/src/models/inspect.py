@@ -0,0 +1,69 @@
+"""総合解析リクエスト/レスポンスモデル."""
+
+from typing import Any, Literal
+
+from pydantic import BaseModel
+
+from .analysis import AnalyzeResponse
+from .error_analysis import ErrorAnalyzeResponse
+from .visualization import VisualizeResponse
+
+InspectSection = Literal["analysis", "visualization", "error"]
+
+
+class InspectOptions(BaseModel):
+    """総合解析の対象のコードと実行する処理.
+
+    include を省略した場合は解析と可視化を行い、error_message があればエラー解析も行う.
+    """
+
+    code: str
+    include: list[InspectSection] | None = None
+    highlight_line: int = 0
+    show_flow: bool = True
+    error_message: str | None = None
+
+    def section_options(self) -> dict[str, Any]:
+        """各処理のオプション."""
+        return {
+            "highlight_line": self.highlight_line,
+            "show_flow": self.show_flow,
+            "error_message": self.error_message,
+        }
+
+    def sections(self) -> set[InspectSection]:
+        """実行する処理."""
+        if self.include is not None:
+            return set(self.include)
+        sections: set[InspectSection] = {"analysis", "visualization"}
+        if self.error_message:
+            sections.add("error")
+        return sections
+
+
+class InspectRequest(InspectOptions):
+    """総合解析リクエストモデル."""
+
+    class_id: str | None = None
+    student_id: str | None = None
+
+
+class InspectResponse(BaseModel):
+    """総合解析レスポンスモデル (実行しなかった処理は null)."""
+
+    success: bool
+    analysis: AnalyzeResponse | None = None
+    visualization: VisualizeResponse | None = None
+    error_analysis: ErrorAnalyzeResponse | None = None
+
+    @classmethod
+    def from_results(cls, results: dict[str, dict[str, Any]]) -> "InspectResponse":
+        """inspect_code の結果 (処理ごとの結果) をレスポンスの形式に変換."""
+        response = cls(success=True)
+        if "analysis" in results:
+            response.analysis = AnalyzeResponse(**results["analysis"])
+        if "visualization" in results:
+            response.visualization = VisualizeResponse.from_result(results["visualization"])
+        if "error" in results:
+            response.error_analysis = ErrorAnalyzeResponse(success=True, **results["error"])
+        return response
@@ -0,0 +1,34 @@
+"""ライブ解析の WebSocket メッセージモデル."""
+
+from typing import Literal
+
+from pydantic import BaseModel
+
+from .inspect import InspectOptions, InspectResponse, InspectSection
+
+
+class LiveEditMessage(InspectOptions):
+    """クライアントから送るコードの版.
+
+    version はクライアントが編集ごとに増やす番号で、結果にも同じ番号が付く.
+    """
+
+    version: int
+
+
+class LiveResultMessage(BaseModel):
+    """1 つの処理の結果 (result には該当する処理の結果だけが入る)."""
+
+    type: Literal["result"] = "result"
+    version: int
+    section: InspectSection
+    final: bool
+    result: InspectResponse
+
+
+class LiveErrorMessage(BaseModel):
+    """エラー (メッセージの形式が不正な場合、version は null)."""
+
+    type: Literal["error"] = "error"
+    version: int | None = None
+    message: str
@@ -0,0 +1,72 @@
+"""類似度 (コピーの検出) リクエスト/レスポンスモデル."""
+
+from pydantic import BaseModel, Field
+
+
+class SimilaritySearchRequest(BaseModel):
+    """登録済みの提出から似ているものを探すリクエストモデル."""
+
+    code: str
+    class_id: str | None = None
+    threshold: float = Field(0.6, ge=0.0, le=1.0)
+    limit: int = Field(10, ge=1, le=100)
+
+
+class SimilarityRegisterRequest(BaseModel):
+    """提出の登録リクエストモデル."""
+
+    submission_id: str
+    code: str
+    class_id: str | None = None
+    label: str | None = None
+    threshold: float = Field(0.6, ge=0.0, le=1.0)
+    limit: int = Field(10, ge=1, le=100)
+
+
+class SimilarMatch(BaseModel):
+    """似ている提出モデル."""
+
+    submission_id: str
+    class_id: str | None = None
+    label: str | None = None
+    similarity: float
+
+
+class SimilarityResponse(BaseModel):
+    """似ている提出の検索・登録レスポンスモデル."""
+
+    success: bool
+    submission_id: str | None = None
+    indexed: bool = False
+    fingerprints: int = 0
+    matches: list[SimilarMatch] = []
+    total_submissions: int = 0
+    error: str | None = None
+    message: str | None = None
+    line: int | None = None
+
+
+class SimilarPair(BaseModel):
+    """似ている提出の組モデル."""
+
+    first_id: str
+    second_id: str
+    first_label: str | None = None
+    second_label: str | None = None
+    similarity: float
+
+
+class SimilarityPairsResponse(BaseModel):
+    """クラスの中で似ている提出の組のレスポンスモデル."""
+
+    class_id: str
+    submissions: int
+    threshold: float
+    pairs: list[SimilarPair]
+
+
+class SimilarityDeleteResponse(BaseModel):
+    """提出の削除レスポンスモデル."""
+
+    submission_id: str
+    removed: bool
@@ -0,0 +1,100 @@
+"""可視化リクエスト/レスポンスモデル."""
+
+from typing import Any
+
+from pydantic import BaseModel, ConfigDict, Field
+
+
+class VisualizeRequest(BaseModel):
+    """可視化リクエストモデル."""
+
+    code: str
+    highlight_line: int = 0
+    show_flow: bool = True
+
+
+class SimulatedStep(BaseModel):
+    """シミュレーションステップモデル."""
+
+    line_number: int
+    code: str
+    action: str
+    description: str
+    scope: str
+
+
+class FlowEdge(BaseModel):
+    """フローエッジモデル."""
+
+    model_config = ConfigDict(populate_by_name=True)
+
+    from_: int = Field(alias="from")
+    to: int
+    type: str
+    label: str | None = None
+
+
+class VisualizeStructure(BaseModel):
+    """可視化の構造情報モデル."""
+
+    variables: dict[str, str] = {}
+    flow_edges: list[FlowEdge] = []
+
+
+class VisualizeResponse(BaseModel):
+    """可視化レスポンスモデル."""
+
+    success: bool
+    steps: list[SimulatedStep]
+    structure: VisualizeStructure
+    flow_diagram: str
+    explanation: str
+    error: str | None = None
+
+    @classmethod
+    def from_result(cls, result: dict[str, Any]) -> "VisualizeResponse":
+        """visualize_code の結果をレスポンスの形式に変換."""
+        if not result.get("success", False):
+            return cls.failure(result.get("message", "可視化エラー"))
+
+        # ステップを期待される形式に変換
+        steps = [
+            SimulatedStep(
+                line_number=step["line"],
+                code=step["description"],
+                action=step["operation"],
+                description=step.get("description", ""),
+                scope="global",  # シンプルにglobalとする
+            )
+            for step in result.get("steps", [])
+        ]
+
+        # 構造情報を構築
+        structure = VisualizeStructure(
+            variables=result.get("final_variables", {}),
+            flow_edges=result.get("flow_edges", []),
+        )
+
+        # 説明を生成
+        explanation_parts = [f"行{exp['line']}: {exp['explanation']}" for exp in result.get("explanations", [])]
+
+        return cls(
+            success=True,
+            steps=steps,
+            structure=structure,
+            flow_diagram=result.get("flowchart", ""),
+            explanation="\n".join(explanation_parts) if explanation_parts else "コードの説明",
+            error=None,
+        )
+
+    @classmethod
+    def failure(cls, error: str) -> "VisualizeResponse":
+        """可視化に失敗した場合のレスポンス."""
+        return cls(
+            success=False,
+            steps=[],
+            structure=VisualizeStructure(),
+            flow_diagram="",
+            explanation="",
+            error=error,
+        )
@@ -1,46 +1,35 @@
 """コード解析エンドポイント."""
 
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
+from fastapi import APIRouter, HTTPException, Request, Response
 
-from ..services.analyzer import analyze_code
+from ..models.analysis import AnalyzeRequest, AnalyzeResponse
+from ..serialization import model_response, not_modified_response
+from ..services.cache import cache_key, cached_call
 
 router = APIRouter()
 
 
-class AnalyzeRequest(BaseModel):
-    """コード解析リクエストモデル."""
-
-    code: str
-    options: dict | None = None
-
-
-class AnalyzeResponse(BaseModel):
-    """コード解析レスポンスモデル."""
-
-    success: bool
-    error: str | None = None
-    message: str | None = None
-    line: int | None = None
-    offset: int | None = None
-    text: str | None = None
-    structure: dict | None = None
-    style_issues: list[dict] | None = None
-    improvements: list[dict] | None = None
-    stats: dict | None = None
-    summary: dict | None = None
-
-
-@router.post("/analyze")
-async def analyze_python_code(request: AnalyzeRequest) -> AnalyzeResponse:
+@router.post("/analyze", response_model=AnalyzeResponse)
+async def analyze_python_code(request: AnalyzeRequest, http_request: Request) -> Response:
     """Pythonコードを静的解析.
 
     - ASTによる構文解析
     - コード構造の抽出
     - 警告の生成
+
+    If-None-Match が前回の ETag に一致すれば、解析せずに 304 を返す.
     """
+    params = {"code": request.code}
+    key = cache_key("analyze", params)
+    not_modified = not_modified_response(http_request, key)
+    if not_modified is not None:
+        return not_modified
+
+    # サービスは初回のリクエスト時に読み込む (コールドスタートの短縮)
+    from ..services.analyzer import analyze_code  # noqa: PLC0415
+
     try:
-        result = await analyze_code(request.code)
-        return AnalyzeResponse(**result)
+        result = await cached_call("analyze", params, lambda: analyze_code(request.code), key=key)
+        return model_response(http_request, AnalyzeResponse(**result), etag_key=key)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e)) from e
@@ -0,0 +1,23 @@
+"""キャッシュ統計エンドポイント."""
+
+import os
+
+from fastapi import APIRouter, Request, Response
+
+from ..models.cache import CacheStatsResponse
+from ..serialization import model_response
+from ..services.cache import cache_stats
+
+router = APIRouter()
+
+
+@router.get("/cache/stats", response_model=CacheStatsResponse)
+async def get_cache_stats(http_request: Request) -> Response:
+    """解析結果キャッシュと single-flight の統計を取得.
+
+    - キャッシュのヒット率
+    - 永続キャッシュ (有効な場合) の結果の数・サイズとヒット率
+    - 同時に届いた同じリクエストがまとめられた割合
+    - 値はリクエストを処理したワーカープロセスでの集計
+    """
+    return model_response(http_request, CacheStatsResponse(pid=os.getpid(), **cache_stats()))
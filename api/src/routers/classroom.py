@@ -0,0 +1,29 @@
+"""クラス統計エンドポイント."""
+
+from typing import Annotated
+
+from fastapi import APIRouter, Query, Request, Response
+
+from ..models.classroom import ClassroomErrorsResponse
+from ..serialization import model_response
+
+router = APIRouter()
+
+
+@router.get("/classroom/{class_id}/errors", response_model=ClassroomErrorsResponse)
+async def get_classroom_errors(
+    class_id: str,
+    http_request: Request,
+    window_seconds: Annotated[int, Query(ge=1)] = 300,
+    limit: Annotated[int, Query(ge=1, le=50)] = 10,
+) -> Response:
+    """クラスで今発生しているエラーの統計を取得.
+
+    - 直近 window_seconds 秒のスライディングウィンドウで集計
+    - エラー種別・メッセージのシグネチャ・行パターンのランキング
+    - エラーを出した生徒数の推定
+    """
+    # サービスは初回のリクエスト時に読み込む (コールドスタートの短縮)
+    from ..services.classroom_stats import query_class_errors  # noqa: PLC0415
+
+    return model_response(http_request, ClassroomErrorsResponse(**query_class_errors(class_id, window_seconds, limit)))
@@ -1,53 +1,127 @@
 """エラー解析エンドポイント."""
 
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
+from fastapi import APIRouter, HTTPException, Request, Response
 
-from ..services.error_analyzer import analyze_error
+from ..models.error_analysis import (
+    ErrorAnalyzeRequest,
+    ErrorAnalyzeResponse,
+    ErrorDiagnosis,
+    ErrorLogAnalyzeRequest,
+    ErrorLogAnalyzeResponse,
+)
+from ..serialization import model_response, not_modified_response
+from ..services.cache import cache_key, cached_call
 
 router = APIRouter()
 
 
-class ErrorAnalyzeRequest(BaseModel):
-    """エラー解析リクエストモデル."""
+@router.post("/analyze-error", response_model=ErrorAnalyzeResponse)
+async def analyze_python_error(request: ErrorAnalyzeRequest, http_request: Request) -> Response:
+    """Pythonエラーを教育的に解析.
 
-    code: str
-    error_message: str
+    - エラーの分類と説明
+    - 修正提案
+    - 学習リソースの提供
 
+    If-None-Match が前回の ETag に一致すれば、解析せずに 304 を返す
+    (class_id がある場合はクラス統計に記録してから返す).
+    """
+    # サービスは初回のリクエスト時に読み込む (コールドスタートの短縮)
+    from ..services.classroom_stats import record_error_result  # noqa: PLC0415
+    from ..services.error_analyzer import analyze_error  # noqa: PLC0415
+    from ..services.knowledge_base import get_catalog  # noqa: PLC0415
 
-class SimilarExample(BaseModel):
-    """類似例モデル."""
+    # 説明文は知識ベースから作るため、知識ベースのバージョンもキーに含める
+    params = {"code": request.code, "error_message": request.error_message, "catalog": get_catalog().version}
+    key = cache_key("analyze-error", params)
+    not_modified = not_modified_response(http_request, key)
+    if not_modified is not None and not request.class_id:
+        return not_modified
 
-    wrong: str
-    correct: str
-    explanation: str
+    try:
+        result = await cached_call(
+            "analyze-error",
+            params,
+            lambda: analyze_error(request.code, request.error_message),
+            key=key,
+        )
+        if request.class_id:
+            record_error_result(
+                result,
+                request.error_message,
+                class_id=request.class_id,
+                student_id=request.student_id,
+            )
+        if not_modified is not None:
+            return not_modified
+        return model_response(http_request, ErrorAnalyzeResponse(success=True, **result), etag_key=key)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e)) from e
 
 
-class ErrorAnalyzeResponse(BaseModel):
-    """エラー解析レスポンスモデル."""
+@router.post("/analyze-errors", response_model=ErrorLogAnalyzeResponse)
+async def analyze_python_errors(request: ErrorLogAnalyzeRequest, http_request: Request) -> Response:
+    """同じコードに対する複数のエラーをまとめて解析.
 
-    success: bool
-    error_type: str
-    line_number: int
-    column_number: int
-    simple_explanation: str
-    detailed_explanation: str
-    common_causes: list[str]
-    fix_suggestions: list[str]
-    similar_examples: list[SimilarExample]
-    learning_resources: list[str]
+    - テスト実行ログからエラーを抽出
+    - コードのパースは一度だけ
+    - 同じ診断は出現回数付きでまとめる
 
+    If-None-Match が前回の ETag に一致すれば、解析せずに 304 を返す
+    (class_id がある場合はクラス統計に記録してから返す).
+    """
+    # サービスは初回のリクエスト時に読み込む (コールドスタートの短縮)
+    from ..services.classroom_stats import record_error_result  # noqa: PLC0415
+    from ..services.error_analyzer import analyze_errors, split_error_log  # noqa: PLC0415
+    from ..services.knowledge_base import get_catalog  # noqa: PLC0415
 
-@router.post("/analyze-error")
-async def analyze_python_error(request: ErrorAnalyzeRequest) -> ErrorAnalyzeResponse:
-    """Pythonエラーを教育的に解析.
+    error_messages = list(request.error_messages)
+    if request.log:
+        error_messages.extend(split_error_log(request.log, request.filename))
+    if not error_messages:
+        raise HTTPException(status_code=422, detail="log または error_messages にエラーが含まれていません")
+
+    params = {"code": request.code, "error_messages": error_messages, "catalog": get_catalog().version}
+    key = cache_key("analyze-errors", params)
+    not_modified = not_modified_response(http_request, key)
+    if not_modified is not None and not request.class_id:
+        return not_modified
 
-    - エラーの分類と説明
-    - 修正提案
-    - 学習リソースの提供
-    """
     try:
-        result = await analyze_error(request.code, request.error_message)
-        return ErrorAnalyzeResponse(success=True, **result)
+        result = await cached_call(
+            "analyze-errors",
+            params,
+            lambda: analyze_errors(request.code, error_messages),
+            key=key,
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e)) from e
+
+    if request.class_id:
+        for diagnosis in result["diagnoses"]:
+            for _ in range(diagnosis["occurrences"]):
+                record_error_result(
+                    diagnosis["result"],
+                    diagnosis["error_message"],
+                    class_id=request.class_id,
+                    student_id=request.student_id,
+                )
+    if not_modified is not None:
+        return not_modified
+
+    response = ErrorLogAnalyzeResponse(
+        success=True,
+        error_count=result["error_count"],
+        unique_count=result["unique_count"],
+        error_messages=error_messages,
+        diagnoses=[
+            ErrorDiagnosis(
+                error_message=diagnosis["error_message"],
+                occurrences=diagnosis["occurrences"],
+                indices=diagnosis["indices"],
+                analysis=ErrorAnalyzeResponse(success=True, **diagnosis["result"]),
+            )
+            for diagnosis in result["diagnoses"]
+        ],
+    )
+    return model_response(http_request, response, etag_key=key)
@@ -0,0 +1,48 @@
+"""実行・診断エンドポイント."""
+
+from fastapi import APIRouter, HTTPException, Request, Response
+
+from ..models.error_analysis import ErrorAnalyzeResponse
+from ..models.execution import RunRequest, RunResponse
+from ..serialization import model_response
+
+router = APIRouter()
+
+
+@router.post("/run-and-diagnose", response_model=RunResponse)
+async def run_python_code(request: RunRequest, http_request: Request) -> Response:
+    """Pythonコードをサンドボックスで実行し、エラーを診断.
+
+    - 資源制限付きのワーカーで実行
+    - 例外とトレースバックの取得
+    - 例外をそのままエラー解析にかける
+    """
+    # サービスは初回のリクエスト時に読み込む (コールドスタートの短縮)
+    from ..services.classroom_stats import record_error_result  # noqa: PLC0415
+    from ..services.sandbox import run_and_diagnose  # noqa: PLC0415
+
+    try:
+        result = await run_and_diagnose(request.code, request.stdin)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e)) from e
+
+    exception = result.get("exception")
+    diagnosis = result.get("diagnosis")
+    if diagnosis and request.class_id:
+        record_error_result(
+            diagnosis,
+            result["error_message"],
+            class_id=request.class_id,
+            student_id=request.student_id,
+        )
+    response = RunResponse(
+        success=result["status"] == "ok",
+        status=result["status"],
+        stdout=result["stdout"],
+        stdout_truncated=result["stdout_truncated"],
+        elapsed_ms=result["elapsed_ms"],
+        error_message=result.get("error_message"),
+        traceback=exception["traceback"] if exception else None,
+        diagnosis=ErrorAnalyzeResponse(success=True, **diagnosis) if diagnosis else None,
+    )
+    return model_response(http_request, response)
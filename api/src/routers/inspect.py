@@ -0,0 +1,55 @@
+"""総合解析エンドポイント."""
+
+from fastapi import APIRouter, HTTPException, Request, Response
+
+from ..models.inspect import InspectRequest, InspectResponse
+from ..serialization import model_response, not_modified_response
+from ..services.cache import cache_key
+
+router = APIRouter()
+
+
+@router.post("/inspect", response_model=InspectResponse)
+async def inspect_python_code(request: InspectRequest, http_request: Request) -> Response:
+    """解析・可視化・エラー解析をまとめて実行.
+
+    - コードのパースとスコープ解析は一度だけ行い、各処理で共有
+    - 各処理は並行して実行
+    - 結果は /analyze・/visualize・/analyze-error と同じキャッシュを使う
+
+    If-None-Match が前回の ETag に一致すれば、解析せずに 304 を返す
+    (エラー解析で class_id がある場合はクラス統計に記録してから返す).
+    """
+    # サービスは初回のリクエスト時に読み込む (コールドスタートの短縮)
+    from ..services.classroom_stats import record_error_result  # noqa: PLC0415
+    from ..services.inspector import inspect_code  # noqa: PLC0415
+    from ..services.knowledge_base import get_catalog  # noqa: PLC0415
+
+    sections = request.sections()
+    if "error" in sections and not request.error_message:
+        raise HTTPException(status_code=422, detail="エラー解析には error_message が必要です")
+
+    params = {"code": request.code, "sections": sorted(sections), **request.section_options()}
+    if "error" in sections:
+        params["catalog"] = get_catalog().version
+    key = cache_key("inspect", params)
+    records_error = "error" in sections and bool(request.class_id)
+    not_modified = not_modified_response(http_request, key)
+    if not_modified is not None and not records_error:
+        return not_modified
+
+    try:
+        results = await inspect_code(request.code, sections, **request.section_options())
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e)) from e
+
+    if records_error:
+        record_error_result(
+            results["error"],
+            request.error_message,
+            class_id=request.class_id,
+            student_id=request.student_id,
+        )
+    if not_modified is not None:
+        return not_modified
+    return model_response(http_request, InspectResponse.from_results(results), etag_key=key)
@@ -0,0 +1,98 @@
+"""ライブ解析エンドポイント (WebSocket)."""
+
+import asyncio
+import logging
+from typing import Any
+
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, status
+from pydantic import BaseModel, ValidationError
+
+from ..middleware import rate_limit
+from ..models.inspect import InspectResponse
+from ..models.live import LiveEditMessage, LiveErrorMessage, LiveResultMessage
+from ..serialization import encode_model
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+def _admit(client: str) -> str | None:
+    """接続を受け付けるか確認し、受け付けた場合はクライアントのセッションとして数える.
+
+    Returns:
+        受け付けた場合は None、断った場合はその理由
+    """
+    # サービスは初回のリクエスト時に読み込む (コールドスタートの短縮)
+    from ..services.live import MAX_SESSIONS_PER_CLIENT, open_client_session  # noqa: PLC0415
+
+    if rate_limit.ENABLED and rate_limit.limiter.acquire(client) > 0:
+        return "rate_limit"
+    if not open_client_session(client, MAX_SESSIONS_PER_CLIENT if rate_limit.ENABLED else 0):
+        return "live_sessions"
+    return None
+
+
+@router.websocket("/live")
+async def live_analysis(websocket: WebSocket) -> None:
+    """エディタのセッションごとのライブ解析.
+
+    - 編集が途切れるまで待ってから解析 (デバウンス)
+    - 新しい版が届いたら古い版の解析を打ち切る
+    - 結果は処理ごとに、コードの版を付けて送る
+
+    WebSocket にはレート制限のミドルウェアが効かないため、レート制限が有効な場合はここで
+    接続ごとにトークンを 1 個消費し、クライアントごとのセッション数を制限する. 解析ごとに
+    HTTP のリクエストと同じ同時実行数の制御と締め切りを受ける.
+    """
+    # サービスは初回のリクエスト時に読み込む (コールドスタートの短縮)
+    from ..services.live import LiveEdit, LiveSession, close_client_session  # noqa: PLC0415
+
+    client = rate_limit.client_id(websocket.scope)
+    reason = _admit(client)
+    if reason is not None:
+        rate_limit.REJECTED.inc(reason)
+        logger.info("Live session rejected (%s): %s", reason, client)
+        await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+        return
+
+    send_lock = asyncio.Lock()
+
+    async def send(message: BaseModel) -> None:
+        async with send_lock:
+            await websocket.send_text(encode_model(message).decode())
+
+    async def publish(message: dict[str, Any]) -> None:
+        if message["type"] == "result":
+            await send(
+                LiveResultMessage(
+                    version=message["version"],
+                    section=message["section"],
+                    final=message["final"],
+                    result=InspectResponse.from_results({message["section"]: message["result"]}),
+                ),
+            )
+        else:
+            await send(LiveErrorMessage(version=message["version"], message=message["message"]))
+
+    session = LiveSession(publish, admission=rate_limit.admission if rate_limit.ENABLED else None)
+    runner = asyncio.create_task(session.run())
+    try:
+        await websocket.accept()
+        while True:
+            data = await websocket.receive_text()
+            try:
+                edit = LiveEditMessage.model_validate_json(data)
+            except ValidationError as e:
+                await send(LiveErrorMessage(message=str(e)))
+                continue
+            sections = edit.sections()
+            if "error" in sections and not edit.error_message:
+                await send(LiveErrorMessage(version=edit.version, message="エラー解析には error_message が必要です"))
+                continue
+            session.submit(LiveEdit(edit.version, edit.code, sections, edit.section_options()))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        runner.cancel()
+        close_client_session(client)
@@ -0,0 +1,20 @@
+"""メトリクスエンドポイント."""
+
+from fastapi import APIRouter, Response
+
+from ..services.metrics import REGISTRY
+
+router = APIRouter()
+
+PROMETHEUS_MEDIA_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+@router.get("/metrics", response_class=Response)
+async def get_metrics() -> Response:
+    """Prometheus のテキスト形式でメトリクスを取得.
+
+    - ルートごとの処理時間・レスポンスサイズ・処理中のリクエスト数
+    - 解析の段階ごとの処理時間と AST のノード数
+    - 結果キャッシュ・single-flight・サンドボックスのキューの統計
+    """
+    return Response(content=REGISTRY.render(), media_type=PROMETHEUS_MEDIA_TYPE)
@@ -0,0 +1,93 @@
+"""類似度 (コピーの検出) エンドポイント."""
+
+import asyncio
+from typing import Annotated
+
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+
+from ..models.similarity import (
+    SimilarityDeleteResponse,
+    SimilarityPairsResponse,
+    SimilarityRegisterRequest,
+    SimilarityResponse,
+    SimilaritySearchRequest,
+)
+from ..serialization import model_response
+
+router = APIRouter()
+
+
+@router.post("/similarity/submissions", response_model=SimilarityResponse)
+async def register_submission(request: SimilarityRegisterRequest, http_request: Request) -> Response:
+    """提出を登録し、登録済みの提出から似ているものを探す.
+
+    - 識別子とリテラルの値を捨てた AST からフィンガープリントを作る (名前の付け替えでは変わらない)
+    - MinHash の LSH 索引で候補だけを取り出すため、登録数が多くても総当たりで比べない
+    - 同じ submission_id で登録し直すと置き換える
+    """
+    # サービスは初回のリクエスト時に読み込む (コールドスタートの短縮)
+    from ..services.similarity import register_submission  # noqa: PLC0415
+
+    try:
+        result = await asyncio.to_thread(
+            register_submission,
+            request.submission_id,
+            request.code,
+            class_id=request.class_id,
+            label=request.label,
+            threshold=request.threshold,
+            limit=request.limit,
+        )
+        return model_response(http_request, SimilarityResponse(**result))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e)) from e
+
+
+@router.post("/similarity/search", response_model=SimilarityResponse)
+async def search_similar(request: SimilaritySearchRequest, http_request: Request) -> Response:
+    """登録せずに、登録済みの提出から似ているものを探す.
+
+    - class_id を指定するとそのクラスの提出だけを探す (省略時は年度をまたいですべて)
+    """
+    # サービスは初回のリクエスト時に読み込む (コールドスタートの短縮)
+    from ..services.similarity import find_similar  # noqa: PLC0415
+
+    try:
+        result = await asyncio.to_thread(
+            find_similar,
+            request.code,
+            class_id=request.class_id,
+            threshold=request.threshold,
+            limit=request.limit,
+        )
+        return model_response(http_request, SimilarityResponse(**result))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e)) from e
+
+
+@router.get("/similarity/classes/{class_id}/pairs", response_model=SimilarityPairsResponse)
+async def get_similar_pairs(
+    class_id: str,
+    http_request: Request,
+    threshold: Annotated[float, Query(ge=0.0, le=1.0)] = 0.6,
+    limit: Annotated[int, Query(ge=1, le=1000)] = 100,
+) -> Response:
+    """クラスの中で似ている提出の組を、類似度の高い順に取得.
+
+    - 同じ LSH のバケットに入った提出の組だけを比べる
+    """
+    # サービスは初回のリクエスト時に読み込む (コールドスタートの短縮)
+    from ..services.similarity import find_class_pairs  # noqa: PLC0415
+
+    result = await asyncio.to_thread(find_class_pairs, class_id, threshold=threshold, limit=limit)
+    return model_response(http_request, SimilarityPairsResponse(**result))
+
+
+@router.delete("/similarity/submissions/{submission_id}", response_model=SimilarityDeleteResponse)
+async def delete_submission(submission_id: str, http_request: Request) -> Response:
+    """登録した提出を削除."""
+    # サービスは初回のリクエスト時に読み込む (コールドスタートの短縮)
+    from ..services.similarity import get_similarity_index  # noqa: PLC0415
+
+    removed = await asyncio.to_thread(get_similarity_index().remove, submission_id)
+    return model_response(http_request, SimilarityDeleteResponse(submission_id=submission_id, removed=removed))
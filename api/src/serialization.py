@@ -0,0 +1,141 @@
+"""レスポンスのシリアライズ.
+
+レスポンスモデルを pydantic-core (Rust 実装) の JSON エンコーダーで直接バイト列にする.
+FastAPI 標準の経路 (辞書へ変換してから json.dumps) を通らないため、大きな解析結果でも速い.
+クライアントが Accept ヘッダーで application/msgpack を要求した場合は MessagePack で返す
+(msgpack は依存関係に含まれる. インストールされていない環境では JSON で返す).
+
+解析結果のレスポンスには、結果のキャッシュキー (コードのハッシュ・パラメータ・解析ロジックの
+バージョンから作る) とメディアタイプから強い ETag を付ける. If-None-Match が一致するリクエストには、
+コードをパースせずに 304 を返す.
+"""
+
+from fastapi import Request, Response
+from pydantic import BaseModel
+
+try:
+    import msgpack
+except ImportError:  # 依存関係を同期していない環境でも JSON は返せるようにする
+    msgpack = None
+
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+# 圧縮ミドルウェアが ETag に付ける圧縮方式の接尾辞
+ETAG_ENCODING_SUFFIXES = ("-br", "-gzip")
+
+
+def negotiate_media_type(request: Request) -> str:
+    """Accept ヘッダーから返すメディアタイプを決める.
+
+    MessagePack は明示的に要求され、かつ JSON より優先度が低くない場合のみ使う.
+    """
+    accept = request.headers.get("accept", "")
+    if msgpack is None or "msgpack" not in accept:
+        return JSON_MEDIA_TYPE
+
+    best_type, best_quality = JSON_MEDIA_TYPE, -1.0
+    for part in accept.split(","):
+        media_type, _, params = part.strip().partition(";")
+        media_type = media_type.strip().lower()
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if media_type in MSGPACK_MEDIA_TYPES and quality > best_quality:
+            best_type, best_quality = media_type, quality
+        elif media_type in (JSON_MEDIA_TYPE, "*/*", "application/*") and quality > best_quality:
+            best_type, best_quality = JSON_MEDIA_TYPE, quality
+    return best_type if best_quality > 0 else JSON_MEDIA_TYPE
+
+
+def encode_model(model: BaseModel, media_type: str = JSON_MEDIA_TYPE) -> bytes:
+    """モデルを指定のメディアタイプでエンコード."""
+    if media_type in MSGPACK_MEDIA_TYPES and msgpack is not None:
+        return msgpack.packb(model.model_dump(mode="json", by_alias=True), use_bin_type=True)
+    return model.__pydantic_serializer__.to_json(model, by_alias=True)
+
+
+def entity_tag(key: bytes, media_type: str) -> str:
+    """結果のキャッシュキーとメディアタイプから強い ETag を作る."""
+    suffix = "" if media_type == JSON_MEDIA_TYPE else "-msgpack"
+    return f'"{key.hex()}{suffix}"'
+
+
+def matching_entity_tag(if_none_match: str, etag: str) -> str | None:
+    """If-None-Match の中から ETag に一致するタグを探す.
+
+    圧縮ミドルウェアが付けた圧縮方式の接尾辞は取り除いて比べる (内容は同じため).
+
+    Returns:
+        一致したタグ (304 の ETag にはこれをそのまま返す). 一致しなければ None
+    """
+    for candidate in if_none_match.split(","):
+        tag = candidate.strip()
+        if tag == "*":
+            return etag
+        opaque = tag.removeprefix("W/")
+        for suffix in ETAG_ENCODING_SUFFIXES:
+            if opaque.endswith(f'{suffix}"'):
+                opaque = opaque[: -len(suffix) - 1] + '"'
+                break
+        if opaque == etag:
+            return tag.removeprefix("W/")
+    return None
+
+
+def not_modified_response(request: Request, key: bytes) -> Response | None:
+    """If-None-Match が結果の ETag に一致すれば 304 レスポンスを作る.
+
+    解析結果を返す POST は内容を変更しない問い合わせのため、GET と同じく 304 を返す.
+
+    Args:
+        request: FastAPIリクエストオブジェクト
+        key: 結果のキャッシュキー
+
+    Returns:
+        304 レスポンス (一致しなければ None)
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return None
+    matched = matching_entity_tag(if_none_match, entity_tag(key, negotiate_media_type(request)))
+    if matched is None:
+        return None
+    return Response(status_code=304, headers={"ETag": matched, "Vary": "Accept, Accept-Encoding"})
+
+
+def model_response(
+    request: Request,
+    model: BaseModel,
+    *,
+    status_code: int = 200,
+    headers: dict[str, str] | None = None,
+    etag_key: bytes | None = None,
+) -> Response:
+    """リクエストの Accept ヘッダーに合わせてモデルをエンコードしたレスポンスを作る.
+
+    Args:
+        request: FastAPIリクエストオブジェクト
+        model: レスポンスモデル
+        status_code: ステータスコード
+        headers: 追加のレスポンスヘッダー
+        etag_key: ETag を付ける場合は結果のキャッシュキー
+
+    Returns:
+        エンコード済みのレスポンス
+    """
+    media_type = negotiate_media_type(request)
+    response = Response(
+        content=encode_model(model, media_type),
+        status_code=status_code,
+        headers=headers,
+        media_type=media_type,
+    )
+    if etag_key is not None:
+        response.headers["etag"] = entity_tag(etag_key, media_type)
+    response.headers.setdefault("vary", "Accept")
+    return response
@@ -8,8 +8,16 @@ import logging
 import traceback
 from typing import Any
 
+from .deadline import CHECK_INTERVAL, check_deadline
+from .duplicates import find_duplicates
+from .metrics import AST_NODES, stage
+from .parsing import ParsedCode
+
 logger = logging.getLogger(__name__)
 
+# 重複したコードの改善提案に書く出現箇所の数
+MAX_DUPLICATE_PLACES = 5
+
 
 class CodeStructureAnalyzer(ast.NodeVisitor):
     """コード構造を解析するASTビジター.
@@ -19,8 +27,12 @@ class CodeStructureAnalyzer(ast.NodeVisitor):
         current_scope: 現在のスコープ
     """
 
-    def __init__(self) -> None:
-        """コンストラクタ."""
+    def __init__(self, scopes: dict[str, Any] | None = None) -> None:
+        """コンストラクタ.
+
+        Args:
+            scopes: analyze_scopes によるスコープ解析結果
+        """
         self.structure: dict[str, Any] = {
             "imports": [],
             "functions": [],
@@ -29,8 +41,19 @@ class CodeStructureAnalyzer(ast.NodeVisitor):
             "loops": [],
             "conditionals": [],
             "complexity": 0,
+            "scopes": scopes["scopes"] if scopes else [],
+            "undefined_names": scopes["undefined"] if scopes else [],
+            "duplicates": [],
         }
         self.current_scope = []
+        self.node_count = 0
+
+    def visit(self, node: ast.AST) -> Any:  # noqa: ANN401
+        """ノードを訪問 (訪問したノード数を数え、一定数ごとに締め切りを確認する)."""
+        self.node_count += 1
+        if self.node_count % CHECK_INTERVAL == 0:
+            check_deadline()
+        return super().visit(node)
 
     def visit_Import(self, node: ast.Import) -> None:
         """Import 文を処理."""
@@ -253,6 +276,8 @@ def check_style_issues(code: str) -> list[dict[str, Any]]:
     lines = code.split("\n")
 
     for i, line in enumerate(lines, 1):
+        if i % CHECK_INTERVAL == 0:
+            check_deadline()
         # 行の長さチェック
         if len(line) > 79:
             issues.append(
@@ -330,6 +355,18 @@ def suggest_improvements(structure: dict[str, Any]) -> list[dict[str, str]]:
                 },
             )
 
+    # 未定義の名前のチェック
+    suggestions.extend(
+        {
+            "type": "undefined_name",
+            "message": f"名前 '{name}' はどこにも定義されていません。スペルミスや定義し忘れがないか確認してください。",
+        }
+        for name in structure.get("undefined_names", [])
+    )
+
+    # 重複したコードのチェック
+    suggestions.extend(_duplicate_suggestion(duplicate) for duplicate in structure.get("duplicates", []))
+
     # 変数名のチェック
     for var in structure["variables"]:
         if len(var["name"]) == 1 and var["name"] not in ["i", "j", "k", "n", "x", "y", "z"]:
@@ -343,34 +380,73 @@ def suggest_improvements(structure: dict[str, Any]) -> list[dict[str, str]]:
     return suggestions
 
 
-async def analyze_code(code: str) -> dict:
+def _format_lines(occurrence: dict[str, int]) -> str:
+    """重複の出現箇所を「3〜7行目」の形にする."""
+    if occurrence["start_line"] == occurrence["end_line"]:
+        return f"{occurrence['start_line']}行目"
+    return f"{occurrence['start_line']}〜{occurrence['end_line']}行目"
+
+
+def _duplicate_suggestion(duplicate: dict[str, Any]) -> dict[str, str]:
+    """重複したコードのリファクタリングの提案."""
+    occurrences = duplicate["occurrences"]
+    places = "、".join(_format_lines(occurrence) for occurrence in occurrences[:MAX_DUPLICATE_PLACES])
+    if len(occurrences) > MAX_DUPLICATE_PLACES:
+        places += f" ほか {len(occurrences) - MAX_DUPLICATE_PLACES} 箇所"
+    if duplicate["type"] in ("FunctionDef", "AsyncFunctionDef"):
+        message = f"{places} の関数は同じ処理です。1 つの関数にまとめ、違う部分は引数で渡すことを検討してください。"
+    else:
+        message = (
+            f"{places} にほぼ同じコードがあります。"
+            "共通部分を関数にまとめ、違う部分 (変数名や値) を引数にすることを検討してください。"
+        )
+    return {"type": "duplicate_code", "message": message}
+
+
+async def analyze_code(code: str, parsed: ParsedCode | None = None) -> dict:
     """コードを解析.
 
     Args:
         code: Pythonコード
+        parsed: パース済みのコード (ほかのサービスと AST・スコープ解析を共有する場合)
 
     Returns:
         解析結果
     """
     logger.info("Starting code analysis")
     logger.debug("Code to analyze: %s", code)
+    if parsed is None:
+        parsed = ParsedCode(code)
 
     try:
         # ASTの解析
         logger.debug("Parsing AST...")
-        tree = ast.parse(code)
+        tree = parsed.tree()
         logger.debug("AST parsed successfully")
 
+        # スコープ解析
+        logger.debug("Analyzing scopes...")
+        scopes = parsed.scopes()
+
         # 構造解析
         logger.debug("Analyzing code structure...")
-        analyzer = CodeStructureAnalyzer()
-        analyzer.visit(tree)
+        analyzer = CodeStructureAnalyzer(scopes)
+        with stage("structure_visit"):
+            analyzer.visit(tree)
+        AST_NODES.observe(analyzer.node_count)
         structure = analyzer.structure
         logger.debug("Structure analysis complete: %s", structure)
 
+        # 重複したコードの検出
+        logger.debug("Detecting duplicate code...")
+        with stage("duplicates"):
+            structure["duplicates"] = find_duplicates(tree)
+        logger.debug("Duplicates found: %d", len(structure["duplicates"]))
+
         # スタイルチェック
         logger.debug("Checking style issues...")
-        style_issues = check_style_issues(code)
+        with stage("style_check"):
+            style_issues = check_style_issues(code)
         logger.debug("Style issues found: %d", len(style_issues))
 
         # 改善提案
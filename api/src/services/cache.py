@@ -0,0 +1,481 @@
+"""解析結果の共有キャッシュ.
+
+複数の uvicorn ワーカーで 1 つのキャッシュを共有するため、結果をメモリマップしたファイル
+(Linux では /dev/shm 上の共有メモリ) に保存する. あるワーカーが計算した結果は、
+ほかのすべてのワーカーでもヒットする.
+
+キャッシュは固定サイズのスロットを並べたダイレクトマップ方式で、ファイルの大きさ
+(スロット数 x スロットサイズ) がそのままワーカー全体でのメモリ使用量の上限になる.
+
+- 書き込み: スロットの範囲を fcntl.lockf でロックし、シーケンス番号を奇数にしてから書き込み、
+  偶数に戻す
+- 読み込み: ロックを取らず、読む前後のシーケンス番号が同じ偶数であれば一貫した内容とみなす
+  (seqlock). 書き込み中のスロットはミスとして扱う
+
+キャッシュにない結果は、同じキーの計算を 1 つにまとめて (single-flight) 計算する.
+永続キャッシュ (persistent_cache.py) が有効な場合は、計算する前にそちらを探し (read-through)、
+計算した結果はそちらにも書き込む (write-behind).
+"""
+
+import asyncio
+import hashlib
+import inspect
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import zlib
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+from pydantic_core import from_json, to_json
+
+from .deadline import Deadline, current_deadline, set_deadline
+from .metrics import REGISTRY
+from .persistent_cache import PersistentCacheStats, PersistentResultCache, get_persistent_cache
+
+try:
+    import fcntl
+except ImportError:  # Windows ではプロセス間のロックを使わない (単一ワーカーのみ)
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# 解析ロジックのバージョン. 結果が変わる変更をしたら更新する (古いキャッシュが使われなくなる)
+ANALYZER_VERSION = "2026.10.2"
+
+CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "true").lower() == "true"
+CACHE_SLOTS = int(os.getenv("RESULT_CACHE_SLOTS", "2048"))
+CACHE_SLOT_KB = int(os.getenv("RESULT_CACHE_SLOT_KB", "32"))
+_SHM_DIR = Path("/dev/shm")  # noqa: S108
+CACHE_PATH = Path(
+    os.getenv(
+        "RESULT_CACHE_PATH",
+        str((_SHM_DIR if _SHM_DIR.is_dir() else Path(tempfile.gettempdir())) / "hsp-result-cache.bin"),
+    ),
+)
+
+# スロットのヘッダー: シーケンス番号, キー (16 バイト), 本文の長さ, フラグ
+_HEADER = struct.Struct("<Q16sIB")
+_HEADER_SIZE = 32
+_FLAG_ZLIB = 1
+# これより大きい本文は圧縮して保存する
+_COMPRESS_THRESHOLD = 1024
+_READ_RETRIES = 3
+
+
+@dataclass
+class CacheStats:
+    """キャッシュの統計 (このプロセスでの値)."""
+
+    hits: int = 0
+    misses: int = 0
+    stores: int = 0
+    too_large: int = 0
+
+
+class SharedResultCache:
+    """メモリマップしたファイル上のダイレクトマップ方式のキャッシュ."""
+
+    def __init__(self, path: Path, slots: int = CACHE_SLOTS, slot_size: int = CACHE_SLOT_KB * 1024) -> None:
+        """コンストラクタ.
+
+        Args:
+            path: キャッシュファイルのパス (ワーカー間で同じパスを使う)
+            slots: スロット数
+            slot_size: 1 スロットのバイト数 (ヘッダーを含む)
+        """
+        self.path = path
+        self.slots = slots
+        self.slot_size = slot_size
+        self.stats = CacheStats()
+        size = slots * slot_size
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self._fd).st_size < size:
+            os.ftruncate(self._fd, size)
+        self._mm = mmap.mmap(self._fd, size)
+        # 同じプロセス内のスレッド間の排他 (lockf はプロセス単位のロックのため)
+        self._thread_lock = threading.Lock()
+
+    @property
+    def capacity(self) -> int:
+        """1 スロットに保存できる本文の最大バイト数."""
+        return self.slot_size - _HEADER_SIZE
+
+    def _offset(self, key: bytes) -> int:
+        """キーのスロットの先頭位置."""
+        return (int.from_bytes(key[:8], "little") % self.slots) * self.slot_size
+
+    def get(self, key: bytes) -> bytes | None:
+        """キーに対応する本文を取得 (なければ None)."""
+        offset = self._offset(key)
+        for _ in range(_READ_RETRIES):
+            seq, stored_key, length, flags = _HEADER.unpack_from(self._mm, offset)
+            if seq & 1:
+                continue
+            if stored_key != key or length > self.capacity:
+                return None
+            start = offset + _HEADER_SIZE
+            payload = self._mm[start : start + length]
+            if _HEADER.unpack_from(self._mm, offset)[0] != seq:
+                continue
+            try:
+                return zlib.decompress(payload) if flags & _FLAG_ZLIB else payload
+            except zlib.error:
+                return None
+        return None
+
+    def set(self, key: bytes, value: bytes) -> bool:
+        """本文を保存 (スロットに収まらない場合は保存せず False)."""
+        flags = 0
+        if len(value) > _COMPRESS_THRESHOLD:
+            value = zlib.compress(value, 1)
+            flags |= _FLAG_ZLIB
+        if len(value) > self.capacity:
+            return False
+
+        offset = self._offset(key)
+        with self._thread_lock:
+            if fcntl is not None:
+                fcntl.lockf(self._fd, fcntl.LOCK_EX, self.slot_size, offset, os.SEEK_SET)
+            try:
+                seq = _HEADER.unpack_from(self._mm, offset)[0]
+                # 書き込み中であることを示す (奇数)
+                struct.pack_into("<Q", self._mm, offset, seq | 1)
+                start = offset + _HEADER_SIZE
+                self._mm[start : start + len(value)] = value
+                _HEADER.pack_into(self._mm, offset, seq | 1, key, len(value), flags)
+                struct.pack_into("<Q", self._mm, offset, (seq | 1) + 1)
+            finally:
+                if fcntl is not None:
+                    fcntl.lockf(self._fd, fcntl.LOCK_UN, self.slot_size, offset, os.SEEK_SET)
+        return True
+
+    def close(self) -> None:
+        """メモリマップを閉じる."""
+        self._mm.close()
+        os.close(self._fd)
+
+
+_cache: SharedResultCache | None = None
+_cache_disabled = not CACHE_ENABLED
+_cache_lock = threading.Lock()
+
+
+def get_result_cache() -> SharedResultCache | None:
+    """プロセス共通の結果キャッシュを取得 (無効または開けない場合は None)."""
+    global _cache, _cache_disabled  # noqa: PLW0603
+
+    if _cache is None and not _cache_disabled:
+        with _cache_lock:
+            if _cache is None and not _cache_disabled:
+                try:
+                    _cache = SharedResultCache(CACHE_PATH)
+                    logger.info(
+                        "Result cache opened at %s (%d slots x %d KB)",
+                        CACHE_PATH,
+                        _cache.slots,
+                        _cache.slot_size // 1024,
+                    )
+                except OSError:
+                    logger.warning("Result cache disabled: cannot open %s", CACHE_PATH, exc_info=True)
+                    _cache_disabled = True
+    return _cache
+
+
+def cache_key(kind: str, params: dict[str, Any]) -> bytes:
+    """処理の種類とパラメータからキャッシュキーを作る."""
+    payload = to_json({"kind": kind, "version": ANALYZER_VERSION, "params": params})
+    return hashlib.blake2b(payload, digest_size=16).digest()
+
+
+@dataclass
+class SingleFlightStats:
+    """single-flight の統計 (このプロセスでの値).
+
+    Attributes:
+        leaders: 実際に計算した回数
+        coalesced: 実行中の計算にまとめられた回数
+    """
+
+    leaders: int = 0
+    coalesced: int = 0
+
+
+@dataclass
+class _Flight:
+    """実行中の計算.
+
+    Attributes:
+        future: 計算のタスク
+        deadline: 計算の締め切り (待っている側の締め切りのうち最も遅いもの)
+        waiters: 結果を待っているリクエストの数
+    """
+
+    future: asyncio.Future[Any]
+    deadline: Deadline
+    waiters: int = 0
+
+
+class SingleFlight:
+    """同じキーの計算が同時に走らないようにまとめる (single-flight).
+
+    キャッシュに結果が入る前に同じリクエストが大量に届いた場合 (授業で全員が同じコードを
+    貼り付けて実行した場合など)、最初のリクエストだけが計算し、残りはその結果を待つ.
+    計算は独立したタスクで行うため、最初のリクエストが切断されても待っている側には影響しない.
+
+    計算には待っている側の締め切りのうち最も遅いものを設定し、待っている側が
+    (締め切り・切断で) 1 つもいなくなった場合は計算を取り消す (deadline.py).
+    """
+
+    def __init__(self) -> None:
+        """コンストラクタ."""
+        self.stats = SingleFlightStats()
+        self._calls: dict[bytes, _Flight] = {}
+
+    @property
+    def in_flight(self) -> int:
+        """実行中の計算の数."""
+        return len(self._calls)
+
+    async def do(self, key: bytes, compute: Callable[[], Awaitable[Any]]) -> Any:  # noqa: ANN401
+        """キーの計算を実行 (同じキーの計算が実行中ならその結果を待つ).
+
+        Args:
+            key: 計算のキー
+            compute: 結果を計算するコルーチン関数
+
+        Returns:
+            計算結果 (まとめられたリクエストには同じオブジェクトを返すため、変更しないこと)
+
+        Raises:
+            DeadlineExceeded: 結果を待つ間に現在のコンテキストの締め切りを過ぎた場合
+        """
+        deadline = current_deadline()
+        flight = self._calls.get(key)
+        if flight is None or flight.deadline.cancelled:
+            # 取り消した計算 (待っている側がいなくなり、打ち切るのを待っているもの) には合流しない
+            flight_deadline = Deadline(deadline.expires_at if deadline is not None else None)
+            future = asyncio.ensure_future(_run_with_deadline(flight_deadline, compute))
+            flight = self._calls[key] = _Flight(future, flight_deadline)
+            future.add_done_callback(lambda done: self._finish(key, done))
+            self.stats.leaders += 1
+        else:
+            flight.deadline.extend(deadline)
+            self.stats.coalesced += 1
+
+        flight.waiters += 1
+        try:
+            async with asyncio.timeout(deadline.remaining() if deadline is not None else None):
+                return await asyncio.shield(flight.future)
+        except TimeoutError:
+            if deadline is None or flight.future.done():
+                raise
+            deadline.abort("expired")
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.future.done():
+                flight.deadline.cancel()
+
+    def _finish(self, key: bytes, future: asyncio.Future[Any]) -> None:
+        """計算の完了時に登録を外す."""
+        flight = self._calls.get(key)
+        if flight is not None and flight.future is future:
+            del self._calls[key]
+        if not future.cancelled():
+            # 待っている側がすべて切断していても「例外が取得されなかった」警告を出さない
+            future.exception()
+
+
+async def _run_with_deadline(deadline: Deadline, compute: Callable[[], Awaitable[Any]]) -> Any:  # noqa: ANN401
+    """計算のタスクに締め切りを設定して実行 (タスクごとのコンテキストなので呼び出し元には影響しない)."""
+    set_deadline(deadline)
+    return await compute()
+
+
+single_flight = SingleFlight()
+_thread_state = threading.local()
+
+
+def _call_blocking(compute: Callable[[], Any | Awaitable[Any]]) -> Any:  # noqa: ANN401
+    """計算をワーカースレッドで実行 (コルーチンはスレッドごとのイベントループで動かす)."""
+    result = compute()
+    if inspect.isawaitable(result):
+        loop = getattr(_thread_state, "loop", None)
+        if loop is None:
+            loop = _thread_state.loop = asyncio.new_event_loop()
+        result = loop.run_until_complete(result)
+    return result
+
+
+async def cached_call(
+    kind: str,
+    params: dict[str, Any],
+    compute: Callable[[], Any | Awaitable[Any]],
+    *,
+    key: bytes | None = None,
+) -> Any:  # noqa: ANN401
+    """キャッシュを使って結果を取得し、なければ計算して保存.
+
+    計算はイベントループを止めないようワーカースレッドで行い、同じキーの計算が
+    実行中であれば single-flight でその結果を待つ.
+
+    Args:
+        kind: 処理の種類 (analyze, visualize など)
+        params: 結果を決めるパラメータ (JSON にできる値)
+        compute: 結果を計算する関数 (コルーチンを返してもよい)
+        key: 計算済みのキャッシュキー (ETag の確認などで先に求めた場合)
+
+    Returns:
+        計算結果 (キャッシュから取得した場合は JSON から復元した値)
+    """
+    if key is None:
+        key = cache_key(kind, params)
+    cache = get_result_cache()
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            try:
+                value = from_json(cached)
+            except ValueError:
+                pass
+            else:
+                cache.stats.hits += 1
+                return value
+        cache.stats.misses += 1
+
+    async def compute_and_store() -> Any:  # noqa: ANN401
+        return await asyncio.to_thread(_read_through, key, compute, cache)
+
+    return await single_flight.do(key, compute_and_store)
+
+
+def _read_through(key: bytes, compute: Callable[[], Any | Awaitable[Any]], cache: SharedResultCache | None) -> Any:  # noqa: ANN401
+    """永続キャッシュを探し、なければ計算して両方のキャッシュに保存 (ワーカースレッドで実行)."""
+    persistent = get_persistent_cache()
+    payload = persistent.get(key) if persistent is not None else None
+    result: Any = None
+    if payload is not None:
+        try:
+            result = from_json(payload)
+        except ValueError:
+            payload = None
+    if payload is None:
+        result = _call_blocking(compute)
+        if cache is None and persistent is None:
+            return result
+        payload = to_json(result)
+        if persistent is not None:
+            persistent.put(key, payload)
+    if cache is not None:
+        if cache.set(key, payload):
+            cache.stats.stores += 1
+        else:
+            cache.stats.too_large += 1
+    return result
+
+
+def cache_stats() -> dict[str, Any]:
+    """キャッシュと single-flight の統計 (このプロセスでの値) を取得."""
+    cache = get_result_cache()
+    persistent = get_persistent_cache()
+    lookups = cache.stats.hits + cache.stats.misses if cache is not None else 0
+    requests = single_flight.stats.leaders + single_flight.stats.coalesced
+    return {
+        "cache": {
+            "enabled": cache is not None,
+            "path": str(cache.path) if cache is not None else None,
+            "slots": cache.slots if cache is not None else 0,
+            "slot_kb": cache.slot_size // 1024 if cache is not None else 0,
+            "hits": cache.stats.hits if cache is not None else 0,
+            "misses": cache.stats.misses if cache is not None else 0,
+            "stores": cache.stats.stores if cache is not None else 0,
+            "too_large": cache.stats.too_large if cache is not None else 0,
+            "hit_rate": cache.stats.hits / lookups if lookups else 0.0,
+        },
+        "persistent": persistent_stats(persistent),
+        "single_flight": {
+            "leaders": single_flight.stats.leaders,
+            "coalesced": single_flight.stats.coalesced,
+            "in_flight": single_flight.in_flight,
+            "coalesce_rate": single_flight.stats.coalesced / requests if requests else 0.0,
+        },
+    }
+
+
+def persistent_stats(persistent: PersistentResultCache | None) -> dict[str, Any]:
+    """永続キャッシュの統計 (件数とサイズはファイル全体、それ以外はこのプロセスでの値)."""
+    entries, size = persistent.entries() if persistent is not None else (0, 0)
+    stats = persistent.stats if persistent is not None else PersistentCacheStats()
+    lookups = stats.hits + stats.misses
+    return {
+        "enabled": persistent is not None,
+        "path": str(persistent.path) if persistent is not None else None,
+        "entries": entries,
+        "size_bytes": size,
+        "hits": stats.hits,
+        "misses": stats.misses,
+        "writes": stats.writes,
+        "dropped": stats.dropped,
+        "evicted": stats.evicted,
+        "hit_rate": stats.hits / lookups if lookups else 0.0,
+    }
+
+
+def _collect_metrics() -> list[tuple[str, str, str, list[tuple[dict[str, str], float]]]]:
+    """/metrics 用のキャッシュと single-flight の値."""
+    stats = cache_stats()
+    cache, persistent, flight = stats["cache"], stats["persistent"], stats["single_flight"]
+    return [
+        ("result_cache_hits_total", "counter", "結果キャッシュのヒット数", [({}, cache["hits"])]),
+        ("result_cache_misses_total", "counter", "結果キャッシュのミス数", [({}, cache["misses"])]),
+        ("result_cache_stores_total", "counter", "結果キャッシュへの保存数", [({}, cache["stores"])]),
+        (
+            "result_cache_too_large_total",
+            "counter",
+            "スロットに収まらず保存しなかった結果の数",
+            [({}, cache["too_large"])],
+        ),
+        ("persistent_cache_hits_total", "counter", "永続キャッシュのヒット数", [({}, persistent["hits"])]),
+        ("persistent_cache_misses_total", "counter", "永続キャッシュのミス数", [({}, persistent["misses"])]),
+        (
+            "persistent_cache_writes_total",
+            "counter",
+            "永続キャッシュに書き込んだ結果の数",
+            [({}, persistent["writes"])],
+        ),
+        (
+            "persistent_cache_dropped_total",
+            "counter",
+            "書き込み待ちがあふれて書き込まなかった結果の数",
+            [({}, persistent["dropped"])],
+        ),
+        (
+            "persistent_cache_evicted_total",
+            "counter",
+            "期限切れ・サイズ超過で削除した結果の数",
+            [({}, persistent["evicted"])],
+        ),
+        ("persistent_cache_entries", "gauge", "永続キャッシュの結果の数", [({}, persistent["entries"])]),
+        (
+            "persistent_cache_size_bytes",
+            "gauge",
+            "永続キャッシュの結果の合計サイズ (圧縮後)",
+            [({}, persistent["size_bytes"])],
+        ),
+        ("single_flight_leaders_total", "counter", "single-flight で実際に計算した回数", [({}, flight["leaders"])]),
+        (
+            "single_flight_coalesced_total",
+            "counter",
+            "実行中の計算にまとめられたリクエスト数",
+            [({}, flight["coalesced"])],
+        ),
+        ("single_flight_in_flight", "gauge", "実行中の計算の数", [({}, flight["in_flight"])]),
+    ]
+
+
+REGISTRY.add_collector(_collect_metrics)
@@ -0,0 +1,291 @@
+"""クラス単位のエラー統計サービス.
+
+エラー解析の結果をストリームとして受け取り、メモリ使用量が一定の確率的データ構造で集計する.
+
+- Count-Min Sketch: 項目ごとの出現回数の推定
+- Space-Saving: 出現回数の多い項目 (Top-K) の追跡
+- HyperLogLog: エラーを出した生徒数 (異なり数) の推定
+
+時間は固定長のバケットに区切ってリングバッファで保持し、スライディングウィンドウの
+集計はウィンドウに含まれるバケットだけを合成する. 集計コストはバケット数とスケッチの
+大きさだけで決まり、取り込んだイベント数には依存しない.
+
+統計はプロセスのメモリ上に持つため、マルチワーカー (WEB_CONCURRENCY > 1) ではワーカーごとに分かれる.
+"""
+
+import builtins
+import hashlib
+import keyword
+import math
+import os
+import re
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import Any
+
+# バケットの長さ (秒) と保持するバケット数 (デフォルトで 1 時間分)
+BUCKET_SECONDS = int(os.getenv("CLASSROOM_STATS_BUCKET_SECONDS", "60"))
+BUCKET_COUNT = int(os.getenv("CLASSROOM_STATS_BUCKET_COUNT", "60"))
+# 同時に追跡するクラス数の上限 (超えたら最も古いクラスを捨てる)
+MAX_CLASSES = int(os.getenv("CLASSROOM_STATS_MAX_CLASSES", "256"))
+
+CMS_WIDTH = 256
+CMS_DEPTH = 4
+TOP_K_CAPACITY = 32
+HLL_PRECISION = 8
+
+# 集計するディメンション
+DIMENSIONS = ("error_type", "signature", "line_pattern")
+
+_QUOTED = re.compile(r"('[^']*'|\"[^\"]*\")")
+_NUMBER = re.compile(r"\b\d+(\.\d+)?\b")
+_IDENTIFIER = re.compile(r"[A-Za-z_]\w*")
+_BUILTIN_NAMES = frozenset(dir(builtins))
+
+
+def _hash64(value: str) -> int:
+    """文字列の 64 ビットハッシュ (プロセスをまたいでも安定)."""
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "little")
+
+
+def normalize_message(error_type: str, error_message: str) -> str:
+    """エラーメッセージから変数名や数値を取り除いたシグネチャを作る.
+
+    例: "NameError: name 'x' is not defined (line 3)" → "NameError: name '_' is not defined"
+    """
+    message = error_message.strip().splitlines()[-1] if error_message.strip() else ""
+    message = re.sub(r"\s*\(?(?:at )?line \d+(?:, column \d+)?\)?", "", message)
+    message = _QUOTED.sub("'_'", message)
+    message = _NUMBER.sub("N", message)
+    if not message.startswith(error_type):
+        message = f"{error_type}: {message}"
+    return message[:200]
+
+
+def normalize_line(line: str) -> str:
+    """コード行のパターンを作る (キーワードと組み込み関数以外の名前、リテラルを抽象化)."""
+    pattern = _QUOTED.sub('""', line.strip())
+    pattern = _NUMBER.sub("0", pattern)
+
+    def _replace(match: re.Match[str]) -> str:
+        word = match.group(0)
+        return word if keyword.iskeyword(word) or word in _BUILTIN_NAMES else "_"
+
+    return _IDENTIFIER.sub(_replace, pattern)[:200]
+
+
+class CountMinSketch:
+    """Count-Min Sketch."""
+
+    def __init__(self, width: int = CMS_WIDTH, depth: int = CMS_DEPTH) -> None:
+        """コンストラクタ."""
+        self.width = width
+        self.depth = depth
+        self.table = array("I", bytes(4 * width * depth))
+
+    def _indexes(self, item_hash: int) -> list[int]:
+        """各行のカウンタ位置 (ダブルハッシングで depth 個作る)."""
+        h1 = item_hash & 0xFFFFFFFF
+        h2 = (item_hash >> 32) | 1
+        return [row * self.width + (h1 + row * h2) % self.width for row in range(self.depth)]
+
+    def add(self, item_hash: int, count: int = 1) -> None:
+        """出現回数を加算."""
+        for index in self._indexes(item_hash):
+            self.table[index] += count
+
+    def estimate(self, item_hash: int) -> int:
+        """出現回数を推定 (過大評価はあっても過小評価はしない)."""
+        return min(self.table[index] for index in self._indexes(item_hash))
+
+
+class SpaceSaving:
+    """Space-Saving アルゴリズムによる Top-K の追跡."""
+
+    def __init__(self, capacity: int = TOP_K_CAPACITY) -> None:
+        """コンストラクタ."""
+        self.capacity = capacity
+        self.counts: dict[str, int] = {}
+
+    def add(self, item: str) -> None:
+        """項目を 1 件追加."""
+        if item in self.counts:
+            self.counts[item] += 1
+        elif len(self.counts) < self.capacity:
+            self.counts[item] = 1
+        else:
+            # 最小の項目を置き換え、そのカウントを引き継ぐ
+            victim = min(self.counts, key=self.counts.__getitem__)
+            self.counts[item] = self.counts.pop(victim) + 1
+
+
+class HyperLogLog:
+    """HyperLogLog による異なり数の推定."""
+
+    def __init__(self, precision: int = HLL_PRECISION) -> None:
+        """コンストラクタ."""
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, item_hash: int) -> None:
+        """項目を追加."""
+        index = item_hash >> (64 - self.precision)
+        rest = item_hash & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - rest.bit_length() + 1
+        self.registers[index] = max(self.registers[index], rank)
+
+    @staticmethod
+    def estimate_registers(registers: bytearray) -> int:
+        """レジスタから異なり数を推定."""
+        m = len(registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / sum(2.0**-r for r in registers)
+        zeros = registers.count(0)
+        if raw <= 2.5 * m and zeros:
+            # 小さい値は線形カウンティングで補正
+            return round(m * math.log(m / zeros))
+        return round(raw)
+
+
+class _Bucket:
+    """1 つの時間バケットの集計."""
+
+    def __init__(self, epoch: int) -> None:
+        """コンストラクタ."""
+        self.epoch = epoch
+        self.events = 0
+        self.sketch = CountMinSketch()
+        self.top = {dimension: SpaceSaving() for dimension in DIMENSIONS}
+        self.students = HyperLogLog()
+
+
+class ClassroomErrorStats:
+    """1 クラス分のスライディングウィンドウ統計."""
+
+    def __init__(self) -> None:
+        """コンストラクタ."""
+        self.buckets: list[_Bucket | None] = [None] * BUCKET_COUNT
+        self.total_events = 0
+        self._lock = threading.Lock()
+
+    def _bucket(self, epoch: int) -> _Bucket:
+        """エポック (BUCKET_SECONDS 単位の時刻) のバケットを取得 (古いものは再利用)."""
+        slot = epoch % BUCKET_COUNT
+        bucket = self.buckets[slot]
+        if bucket is None or bucket.epoch != epoch:
+            bucket = _Bucket(epoch)
+            self.buckets[slot] = bucket
+        return bucket
+
+    def record(self, values: dict[str, str], student_id: str | None, now: float) -> None:
+        """イベントを 1 件記録."""
+        with self._lock:
+            bucket = self._bucket(int(now) // BUCKET_SECONDS)
+            bucket.events += 1
+            self.total_events += 1
+            for dimension, value in values.items():
+                bucket.sketch.add(_hash64(f"{dimension}\0{value}"))
+                bucket.top[dimension].add(value)
+            if student_id:
+                bucket.students.add(_hash64(student_id))
+
+    def query(self, window_seconds: int, limit: int, now: float) -> dict[str, Any]:
+        """直近 window_seconds 秒の集計を返す."""
+        current = int(now) // BUCKET_SECONDS
+        span = min(BUCKET_COUNT, max(1, -(-window_seconds // BUCKET_SECONDS)))
+        with self._lock:
+            buckets = [b for b in self.buckets if b is not None and current - span < b.epoch <= current]
+
+            events = sum(b.events for b in buckets)
+            registers = bytearray(1 << HLL_PRECISION)
+            for b in buckets:
+                registers = bytearray(map(max, registers, b.students.registers))
+
+            top: dict[str, list[dict[str, Any]]] = {}
+            for dimension in DIMENSIONS:
+                # Space-Saving のカウントで候補を絞り込み、Count-Min Sketch で回数を推定し直す
+                candidates: dict[str, int] = {}
+                for b in buckets:
+                    for item, count in b.top[dimension].counts.items():
+                        candidates[item] = candidates.get(item, 0) + count
+                shortlist = sorted(candidates, key=candidates.__getitem__, reverse=True)[: limit * 2]
+                scored = []
+                for item in shortlist:
+                    item_hash = _hash64(f"{dimension}\0{item}")
+                    scored.append((sum(b.sketch.estimate(item_hash) for b in buckets), item))
+                scored.sort(key=lambda pair: (-pair[0], pair[1]))
+                top[dimension] = [{"value": item, "count": count} for count, item in scored[:limit]]
+
+        return {
+            "window_seconds": span * BUCKET_SECONDS,
+            "events": events,
+            "distinct_students": HyperLogLog.estimate_registers(registers) if events else 0,
+            "top_error_types": top["error_type"],
+            "top_signatures": top["signature"],
+            "top_line_patterns": top["line_pattern"],
+        }
+
+
+_classes: OrderedDict[str, ClassroomErrorStats] = OrderedDict()
+_classes_lock = threading.Lock()
+
+
+def _get_class(class_id: str, *, create: bool) -> ClassroomErrorStats | None:
+    """クラスの統計を取得 (上限を超えたら最も使われていないクラスを捨てる)."""
+    with _classes_lock:
+        stats = _classes.get(class_id)
+        if stats is not None:
+            _classes.move_to_end(class_id)
+        elif create:
+            stats = _classes[class_id] = ClassroomErrorStats()
+            while len(_classes) > MAX_CLASSES:
+                _classes.popitem(last=False)
+        return stats
+
+
+def record_error_result(
+    result: dict[str, Any],
+    error_message: str,
+    *,
+    class_id: str,
+    student_id: str | None = None,
+    now: float | None = None,
+) -> None:
+    """analyze_error の結果を統計に取り込む.
+
+    Args:
+        result: analyze_error の結果
+        error_message: 解析したエラーメッセージ
+        class_id: クラス ID
+        student_id: 生徒 ID (異なり数の推定に使う)
+        now: 記録時刻 (UNIX 時間、省略時は現在時刻)
+    """
+    error_type = result.get("error_type", "UnknownError")
+    values = {
+        "error_type": error_type,
+        "signature": normalize_message(error_type, error_message),
+        "line_pattern": normalize_line(result.get("context", {}).get("problematic_line", "")) or "<不明>",
+    }
+    stats = _get_class(class_id, create=True)
+    stats.record(values, student_id, time.time() if now is None else now)
+
+
+def query_class_errors(class_id: str, window_seconds: int = 300, limit: int = 10, now: float | None = None) -> dict:
+    """クラスの直近のエラー統計を取得.
+
+    Args:
+        class_id: クラス ID
+        window_seconds: 集計するウィンドウの長さ (秒、バケット単位に切り上げ)
+        limit: 各ランキングの最大件数
+        now: 集計時刻 (UNIX 時間、省略時は現在時刻)
+
+    Returns:
+        ウィンドウ内のイベント数、生徒数、エラー種別・シグネチャ・行パターンのランキング
+    """
+    stats = _get_class(class_id, create=False)
+    now = time.time() if now is None else now
+    if stats is None:
+        stats = ClassroomErrorStats()
+    return {"class_id": class_id, **stats.query(window_seconds, limit, now)}
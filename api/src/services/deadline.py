@@ -0,0 +1,135 @@
+"""リクエストの締め切りと取り消し.
+
+大きなコードの解析は数秒かかることがあり、クライアントがタイムアウトした後や接続を切った後も
+計算を続けるとワーカースレッドを無駄に占有する. リクエストごとに締め切り (Deadline) を
+コンテキスト変数で持ち回り、AST の走査などの長いループで check_deadline() を呼んで、
+締め切りを過ぎた場合や取り消された場合に DeadlineExceeded で処理を打ち切る.
+
+締め切りは HTTP の X-Request-Deadline-Ms ヘッダー (middleware/deadline.py) や
+MCP サーバーの埋め込みモードから設定する. コンテキスト変数は asyncio.to_thread で
+ワーカースレッドにも引き継がれる.
+"""
+
+import contextvars
+import os
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from typing import NoReturn
+
+from .metrics import REGISTRY, Counter
+
+# 締め切りの既定値と上限 (秒. 0 で締め切りなし)
+DEFAULT_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "30"))
+# 長いループで締め切りを確認する間隔 (反復回数). 確認の負担をループの 1 回より十分小さくする
+CHECK_INTERVAL = 64
+
+ABORTED = REGISTRY.register(
+    Counter("deadline_aborts_total", "締め切り・取り消しで打ち切った処理の数", ("reason",)),
+)
+
+
+class DeadlineExceeded(BaseException):
+    """締め切りを過ぎた、または取り消された処理の打ち切り.
+
+    サービスの「Exception を捕まえて結果として返す」処理で解析結果として
+    キャッシュされないよう、asyncio.CancelledError と同じく BaseException を継承する.
+    """
+
+
+class Deadline:
+    """処理の締め切り (time.monotonic() の時刻) と取り消しの状態.
+
+    single-flight でまとめた計算では、待っている側の締め切りに合わせて延ばす (extend) ことがある.
+    """
+
+    def __init__(self, expires_at: float | None = None) -> None:
+        """コンストラクタ.
+
+        Args:
+            expires_at: 締め切りの時刻 (time.monotonic() の値. None で締め切りなし)
+        """
+        self.expires_at = expires_at
+        self.cancelled = False
+        self._aborted = False
+
+    @classmethod
+    def after(cls, seconds: float | None) -> "Deadline":
+        """今から seconds 秒後を締め切りにする (None または 0 以下で締め切りなし)."""
+        if seconds is None or seconds <= 0:
+            return cls()
+        return cls(time.monotonic() + seconds)
+
+    def remaining(self) -> float | None:
+        """締め切りまでの秒数 (締め切りがない場合は None)."""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def extend(self, other: "Deadline | None") -> None:
+        """締め切りを other の締め切りまで延ばす (other に締め切りがなければ締め切りをなくす)."""
+        if other is None or other.expires_at is None:
+            self.expires_at = None
+        elif self.expires_at is not None:
+            self.expires_at = max(self.expires_at, other.expires_at)
+
+    def cancel(self) -> None:
+        """取り消す (次の check() で打ち切る)."""
+        self.cancelled = True
+
+    def check(self) -> None:
+        """締め切りを過ぎているか取り消されていれば DeadlineExceeded を送出."""
+        if self.cancelled:
+            self.abort("cancelled")
+        if self.expires_at is not None and time.monotonic() >= self.expires_at:
+            self.abort("expired")
+
+    def abort(self, reason: str) -> NoReturn:
+        """打ち切りを記録して DeadlineExceeded を送出.
+
+        Args:
+            reason: 理由 (expired: 締め切りを過ぎた, cancelled: 取り消された)
+        """
+        if not self._aborted:
+            self._aborted = True
+            ABORTED.inc(reason)
+        msg = "処理が取り消されました" if reason == "cancelled" else "処理が締め切りまでに終わりませんでした"
+        raise DeadlineExceeded(msg)
+
+
+_current: contextvars.ContextVar[Deadline | None] = contextvars.ContextVar("deadline", default=None)
+
+
+def current_deadline() -> Deadline | None:
+    """現在のコンテキストの締め切り (なければ None)."""
+    return _current.get()
+
+
+def set_deadline(deadline: Deadline | None) -> contextvars.Token[Deadline | None]:
+    """現在のコンテキストの締め切りを設定 (戻り値は reset_deadline に渡す)."""
+    return _current.set(deadline)
+
+
+def reset_deadline(token: contextvars.Token[Deadline | None]) -> None:
+    """set_deadline で設定した締め切りを元に戻す."""
+    _current.reset(token)
+
+
+@contextmanager
+def use_deadline(deadline: Deadline | None) -> Iterator[Deadline | None]:
+    """締め切りを with 文の中だけ設定."""
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
+
+
+def check_deadline() -> None:
+    """現在のコンテキストの締め切りを確認 (締め切りがなければ何もしない).
+
+    長いループの中から呼ぶ. 締め切りを過ぎているか取り消されていれば DeadlineExceeded を送出する.
+    """
+    deadline = _current.get()
+    if deadline is not None:
+        deadline.check()
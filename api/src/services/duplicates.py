@@ -0,0 +1,103 @@
+"""1 つのコードの中の重複 (コピー & ペースト) の検出.
+
+ブロックどうしを総当たりで比べる代わりに、AST の部分木のハッシュを葉から順に 1 回の走査で求め
+(子のハッシュからノードのハッシュを作る)、同じハッシュになった文をまとめて重複として報告する.
+
+- 識別子 (変数名・関数名・属性名) とリテラルの値はハッシュに含めない (リテラルは型だけ残す)
+  ため、コピーした後に名前や値だけを書き換えたブロックも重複として見つかる
+- MIN_NODES 個より小さい文は定型の短いコードどうしが一致しすぎるため報告しない
+- 重複したブロックの中の小さな重複は、外側のブロックとしてまとめて 1 回だけ報告する
+"""
+
+import ast
+from collections import defaultdict
+from typing import Any
+
+from .deadline import CHECK_INTERVAL, check_deadline
+
+# 重複として報告する文の最小のノード数 (Load/Store などの文脈のノードは数えない)
+MIN_NODES = 15
+
+
+def _fingerprint(node: ast.AST, children: dict[int, tuple[int, int]]) -> tuple[int, int]:
+    """子のハッシュとノード数から、ノードのハッシュとノード数を求める."""
+    parts: list[Any] = [type(node).__name__]
+    size = 1
+    for field in node._fields:
+        value = getattr(node, field, None)
+        if isinstance(value, ast.AST):
+            child_hash, child_size = children[id(value)]
+            parts.append(child_hash)
+            size += child_size
+        elif isinstance(value, list):
+            hashes = []
+            for item in value:
+                if isinstance(item, ast.AST):
+                    child_hash, child_size = children[id(item)]
+                    hashes.append(child_hash)
+                    size += child_size
+            parts.append(tuple(hashes))
+        else:
+            # 識別子・リテラルの値・None は捨てる (フィールドの位置だけ残す)
+            parts.append(None)
+    if isinstance(node, ast.Constant):
+        parts.append(type(node.value).__name__)
+    return hash(tuple(parts)), size
+
+
+def find_duplicates(tree: ast.AST, min_nodes: int = MIN_NODES) -> list[dict[str, Any]]:
+    """重複している文のまとまりを探す.
+
+    Args:
+        tree: コードの AST
+        min_nodes: 報告する文の最小のノード数
+
+    Returns:
+        重複のリスト (大きいものから順). 各要素は文の種類 (type)、ノード数 (nodes)、
+        出現箇所の行の範囲 (occurrences) を持つ
+    """
+    # 後順 (子が先) にたどり、各ノードのハッシュとノード数を 1 回だけ求める
+    children: dict[int, tuple[int, int]] = {}
+    groups: defaultdict[int, list[ast.stmt]] = defaultdict(list)
+    stack: list[tuple[ast.AST, bool]] = [(tree, False)]
+    visited = 0
+    while stack:
+        node, expanded = stack.pop()
+        if isinstance(node, ast.expr_context):
+            children[id(node)] = (0, 0)
+            continue
+        if not expanded:
+            stack.append((node, True))
+            stack.extend((child, False) for child in ast.iter_child_nodes(node))
+            continue
+        visited += 1
+        if visited % CHECK_INTERVAL == 0:
+            check_deadline()
+        node_hash, size = _fingerprint(node, children)
+        children[id(node)] = (node_hash, size)
+        if isinstance(node, ast.stmt) and size >= min_nodes:
+            groups[node_hash].append(node)
+
+    candidates = [nodes for nodes in groups.values() if len(nodes) > 1]
+    candidates.sort(key=lambda nodes: (-children[id(nodes[0])][1], nodes[0].lineno))
+
+    # 大きい重複から順に報告し、報告済みのブロックの中にある小さな重複は除く
+    covered: set[int] = set()
+    duplicates = []
+    for nodes in candidates:
+        remaining = [node for node in nodes if id(node) not in covered]
+        if len(remaining) <= 1:
+            continue
+        for node in remaining:
+            covered.update(id(inner) for inner in ast.walk(node) if isinstance(inner, ast.stmt))
+        duplicates.append(
+            {
+                "type": type(remaining[0]).__name__,
+                "nodes": children[id(remaining[0])][1],
+                "occurrences": [
+                    {"start_line": node.lineno, "end_line": node.end_lineno or node.lineno}
+                    for node in sorted(remaining, key=lambda node: node.lineno)
+                ],
+            },
+        )
+    return duplicates
@@ -3,10 +3,14 @@
 静的解析によるエラーの教育的説明を提供.
 """
 
-import ast
 import re
+from functools import cache
 from typing import Any
 
+from .knowledge_base import get_catalog
+from .metrics import stage
+from .parsing import ParsedCode
+
 
 def parse_error_location(error_message: str) -> tuple[int, int]:
     """エラーメッセージから行番号と列番号を抽出."""
@@ -28,116 +32,40 @@ def parse_error_location(error_message: str) -> tuple[int, int]:
 
 def get_educational_explanation(error_type: str, context: dict[str, Any]) -> dict[str, Any]:
     """エラータイプに応じた教育的説明を生成."""
-    explanations = {
-        "SyntaxError": {
-            "simple": "コードの書き方に間違いがあります",
-            "detail": "Pythonの文法ルールに従っていない部分があります。括弧の対応やコロンの位置を確認してください。",
-            "tips": [
-                "括弧 (), [], {} の対応を確認",
-                "if文やfor文の後にコロン(:)があるか確認",
-                "インデントが正しいか確認",
-                "文字列のクォートが閉じているか確認",
-                "予約語（if, for, def等）のスペルを確認",
-            ],
-            "concept": "構文エラーは、Pythonがコードを理解できない時に発生します。料理のレシピのように、正しい順序と形式が必要です。",
-            "difficulty_level": 1,
-        },
-        "NameError": {
-            "simple": "存在しない名前を使っています",
-            "detail": f"'{context.get('name', '変数')}' という名前が定義されていません。変数名のスペルミスか、定義し忘れの可能性があります。",
-            "tips": [
-                "変数名のスペルを確認",
-                "変数を使う前に定義しているか確認",
-                "大文字・小文字の違いに注意",
-                "変数のスコープ（有効範囲）を確認",
-                "インポートし忘れていないか確認",
-            ],
-            "concept": "変数は値を保存する箱のようなものです。使う前に必ず箱を用意（定義）する必要があります。",
-            "difficulty_level": 1,
-        },
-        "TypeError": {
-            "simple": "データの種類が合っていません",
-            "detail": "異なる種類のデータを一緒に使おうとしています。数値と文字列など、種類の違うデータは直接計算できません。",
-            "tips": [
-                "int()やstr()で型変換を行う",
-                "変数の中身を確認する",
-                "関数の引数の数や種類を確認",
-                "演算子が使えるデータ型か確認",
-                "type()関数でデータ型を調べる",
-            ],
-            "concept": "Pythonでは数値は数値同士、文字列は文字列同士でしか計算できません。りんご＋みかんは計算できないのと同じです。",
-            "difficulty_level": 2,
-        },
-        "IndentationError": {
-            "simple": "インデント（字下げ）が正しくありません",
-            "detail": "Pythonではインデントでコードのブロックを表現します。スペースの数を揃えましょう。",
-            "tips": [
-                "同じブロック内では同じ数のスペースを使う",
-                "タブとスペースを混在させない",
-                "通常は4つのスペースを使う",
-                "エディタの空白文字表示機能を使う",
-                "自動インデント機能を活用する",
-            ],
-            "concept": "インデントは段落のようなものです。同じ話題（ブロック）は同じ深さで書く必要があります。",
-            "difficulty_level": 1,
-        },
-        "IndexError": {
-            "simple": "リストの範囲外にアクセスしています",
-            "detail": "存在しない位置の要素を取得しようとしています。リストの長さを確認してください。",
-            "tips": [
-                "リストのインデックスは0から始まる",
-                "len()関数でリストの長さを確認",
-                "負のインデックスは後ろから数える",
-                "スライスを使って安全にアクセス",
-                "try-exceptで例外処理を行う",
-            ],
-            "concept": "リストは0番から始まる番号付きの箱です。3個の箱がある場合、番号は0, 1, 2となります。",
-            "difficulty_level": 2,
-        },
-        "ValueError": {
-            "simple": "値が適切ではありません",
-            "detail": "関数に渡された値が期待される形式と異なります。値の内容や形式を確認してください。",
-            "tips": [
-                "入力値の形式を確認",
-                "空文字列や特殊文字に注意",
-                "数値変換時は数字のみか確認",
-                "範囲外の値でないか確認",
-                "ドキュメントで正しい使い方を確認",
-            ],
-            "concept": "関数は特定の形式の入力を期待します。自動販売機にお札を入れる向きが決まっているのと同じです。",
-            "difficulty_level": 2,
-        },
-        "AttributeError": {
-            "simple": "そのオブジェクトにその属性やメソッドはありません",
-            "detail": "オブジェクトに存在しない属性やメソッドにアクセスしようとしています。",
-            "tips": [
-                "属性名・メソッド名のスペルを確認",
-                "dir()関数で利用可能な属性を確認",
-                "オブジェクトの型を確認",
-                "ドキュメントを参照",
-                "IDEの自動補完を活用",
-            ],
-            "concept": "オブジェクトはそれぞれ異なる機能（メソッド）を持っています。車には走る機能がありますが、飛ぶ機能はありません。",
-            "difficulty_level": 3,
-        },
-    }
+    return get_catalog().explanation(error_type, name=context.get("name", "変数"))
 
-    error_info = explanations.get(
-        error_type,
-        {
-            "simple": "エラーが発生しました",
-            "detail": "コードに問題があります。エラーメッセージを確認してください。",
-            "tips": ["エラーメッセージを読んで原因を特定する"],
-            "concept": "プログラミングのエラーは学習のチャンスです。エラーメッセージは問題を解決するヒントを教えてくれます。",
-            "difficulty_level": 1,
-        },
-    )
 
-    return error_info
+def prepare_code(code: str, parsed: ParsedCode | None = None) -> dict[str, Any]:
+    """エラーに依存しないコードの情報 (行とスコープ解析) を一度だけ計算.
 
+    同じコードに対する複数のエラーを解析するときは、この結果を共有して再パースを避ける.
 
-def analyze_code_context(code: str, line: int, error_type: str) -> dict[str, Any]:
+    Args:
+        code: Pythonコード
+        parsed: パース済みのコード (ほかのサービスとスコープ解析を共有する場合)
+
+    Returns:
+        行のリストとスコープ解析結果 (構文エラーの場合は None)
+    """
+    if parsed is None:
+        parsed = ParsedCode(code)
+    try:
+        scopes = parsed.scopes()
+    except (SyntaxError, ValueError):
+        scopes = None  # パースエラーの場合は無視
+    return {"lines": parsed.lines, "scopes": scopes}
+
+
+def analyze_code_context(
+    code: str,
+    line: int,
+    error_type: str,
+    prepared: dict[str, Any] | None = None,
+) -> dict[str, Any]:
     """コードのコンテキストを解析して詳細な情報を取得."""
+    if prepared is None:
+        prepared = prepare_code(code)
+
     context = {
         "problematic_line": "",
         "surrounding_lines": [],
@@ -149,7 +77,7 @@ def analyze_code_context(code: str, line: int, error_type: str) -> dict[str, Any
         "defined_vars": set(),
     }
 
-    lines = code.split("\n")
+    lines = prepared["lines"]
     if 0 < line <= len(lines):
         context["problematic_line"] = lines[line - 1]
 
@@ -161,38 +89,29 @@ def analyze_code_context(code: str, line: int, error_type: str) -> dict[str, Any
         # インデントレベルを計算
         context["indentation_level"] = len(context["problematic_line"]) - len(context["problematic_line"].lstrip())
 
-    # ASTを使った詳細解析
-    try:
-        tree = ast.parse(code)
-
-        # 定義された変数を収集
-        for node in ast.walk(tree):
-            if isinstance(node, ast.Assign):
-                for target in node.targets:
-                    if isinstance(target, ast.Name):
-                        context["defined_vars"].add(target.id)
-            elif isinstance(node, ast.FunctionDef):
-                context["defined_vars"].add(node.name)
-                # 関数の引数も定義済み変数として追加
-                for arg in node.args.args:
-                    context["defined_vars"].add(arg.arg)
+    # スコープ解析で定義済みの名前と未定義の名前を取得
+    scopes = prepared["scopes"]
+    if scopes is not None:
+        context["defined_vars"] = set(scopes["defined"])
 
         # 使用されている未定義変数を検出
         if error_type == "NameError":
-            for node in ast.walk(tree):
-                if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load):
-                    if node.id not in context["defined_vars"] and node.id not in __builtins__:
-                        context["undefined_vars"].append(node.id)
-    except:
-        pass  # パースエラーの場合は無視
+            context["undefined_vars"] = scopes["undefined"]
 
     return context
 
 
-def suggest_fix(code: str, error_type: str, line: int, error_message: str = "") -> list[str]:
+def suggest_fix(
+    code: str,
+    error_type: str,
+    line: int,
+    error_message: str = "",
+    context: dict[str, Any] | None = None,
+) -> list[str]:
     """エラーに対する修正提案を生成."""
     suggestions = []
-    context = analyze_code_context(code, line, error_type)
+    if context is None:
+        context = analyze_code_context(code, line, error_type)
 
     if error_type == "SyntaxError":
         problem_line = context["problematic_line"]
@@ -320,51 +239,63 @@ def suggest_fix(code: str, error_type: str, line: int, error_message: str = "")
     return suggestions
 
 
-async def analyze_error(code: str, error_message: str) -> dict:
+# 一般的なPythonエラーのパターン (上から順に照合)
+ERROR_PATTERNS = {
+    r"SyntaxError": "SyntaxError",
+    r"NameError": "NameError",
+    r"TypeError": "TypeError",
+    r"IndentationError": "IndentationError",
+    r"IndexError": "IndexError",
+    r"ValueError": "ValueError",
+    r"AttributeError": "AttributeError",
+    r"KeyError": "KeyError",
+    r"ZeroDivisionError": "ZeroDivisionError",
+    r"ImportError": "ImportError",
+    r"EOFError": "EOFError",
+    r"invalid syntax": "SyntaxError",
+    r"unexpected indent": "IndentationError",
+    r"unindent does not match": "IndentationError",
+    r"list index out of range": "IndexError",
+    r"string index out of range": "IndexError",
+    # 特定のSyntaxErrorパターン
+    r"expected an indented block": "IndentationError",
+    r"expected ':'": "SyntaxError",
+    r"was never closed": "SyntaxError",
+    r"unexpected EOF while parsing": "SyntaxError",
+    r"unterminated string": "SyntaxError",
+}
+
+
+@cache
+def _compiled_error_patterns() -> tuple[tuple[re.Pattern[str], str], ...]:
+    """ERROR_PATTERNS をコンパイル (起動時ではなく最初の判定時に 1 回だけ)."""
+    return tuple((re.compile(pattern, re.IGNORECASE), etype) for pattern, etype in ERROR_PATTERNS.items())
+
+
+def classify_error(error_message: str) -> str:
+    """エラーメッセージからエラータイプを判定."""
+    for pattern, etype in _compiled_error_patterns():
+        if pattern.search(error_message):
+            return etype
+    return "UnknownError"
+
+
+async def analyze_error(code: str, error_message: str, prepared: dict[str, Any] | None = None) -> dict:
     """エラーを解析して教育的な説明を提供.
 
     Args:
         code: エラーが発生したコード
         error_message: エラーメッセージ
+        prepared: prepare_code の結果 (同じコードのエラーをまとめて解析する場合に共有)
 
     Returns:
         解析結果
     """
     # エラータイプの抽出（より柔軟に）
-    error_type = "UnknownError"
+    with stage("error_classification"):
+        error_type = classify_error(error_message)
     error_detail = ""
 
-    # 一般的なPythonエラーのパターンをチェック
-    error_patterns = {
-        r"SyntaxError": "SyntaxError",
-        r"NameError": "NameError",
-        r"TypeError": "TypeError",
-        r"IndentationError": "IndentationError",
-        r"IndexError": "IndexError",
-        r"ValueError": "ValueError",
-        r"AttributeError": "AttributeError",
-        r"KeyError": "KeyError",
-        r"ZeroDivisionError": "ZeroDivisionError",
-        r"ImportError": "ImportError",
-        r"EOFError": "EOFError",
-        r"invalid syntax": "SyntaxError",
-        r"unexpected indent": "IndentationError",
-        r"unindent does not match": "IndentationError",
-        r"list index out of range": "IndexError",
-        r"string index out of range": "IndexError",
-        # 特定のSyntaxErrorパターン
-        r"expected an indented block": "IndentationError",
-        r"expected ':'": "SyntaxError",
-        r"was never closed": "SyntaxError",
-        r"unexpected EOF while parsing": "SyntaxError",
-        r"unterminated string": "SyntaxError",
-    }
-
-    for pattern, etype in error_patterns.items():
-        if re.search(pattern, error_message, re.IGNORECASE):
-            error_type = etype
-            break
-
     # エラーの詳細部分を抽出
     if ":" in error_message:
         parts = error_message.split(":", 1)
@@ -375,7 +306,7 @@ async def analyze_error(code: str, error_message: str) -> dict:
     line, column = parse_error_location(error_message)
 
     # コンテキスト情報の抽出
-    context = analyze_code_context(code, line, error_type)
+    context = analyze_code_context(code, line, error_type, prepared)
 
     # NameErrorの場合、未定義変数名を特定
     if error_type == "NameError":
@@ -387,7 +318,7 @@ async def analyze_error(code: str, error_message: str) -> dict:
     explanation = get_educational_explanation(error_type, context)
 
     # 修正提案の生成（エラーメッセージも渡す）
-    suggestions = suggest_fix(code, error_type, line, error_message)
+    suggestions = suggest_fix(code, error_type, line, error_message, context)
 
     # 関連する学習リソース
     resources = [
@@ -398,140 +329,46 @@ async def analyze_error(code: str, error_message: str) -> dict:
     ]
 
     # 類似例の生成（エラーに応じてより具体的に）
+    catalog = get_catalog()
     similar_examples = []
     if error_type == "SyntaxError":
         # expected ':' のエラー
         if "expected ':'" in error_message:
-            similar_examples.append(
-                {
-                    "wrong": "if x > 5\n    print('大きい')",
-                    "correct": "if x > 5:\n    print('大きい')",
-                    "explanation": "if文の後にはコロン(:)が必要です",
-                },
-            )
-            similar_examples.append(
-                {
-                    "wrong": "for i in range(10)\n    print(i)",
-                    "correct": "for i in range(10):\n    print(i)",
-                    "explanation": "for文の後にもコロン(:)が必要です",
-                },
-            )
+            similar_examples.extend(catalog.examples("SyntaxError.expected_colon"))
         # was never closed のエラー
         elif "was never closed" in error_message:
             if "'('" in error_message:
-                similar_examples.append(
-                    {
-                        "wrong": "print('Hello World'",
-                        "correct": "print('Hello World')",
-                        "explanation": "開き括弧には必ず対応する閉じ括弧が必要です",
-                    },
-                )
-                similar_examples.append(
-                    {
-                        "wrong": "result = (1 + 2\nprint(result)",
-                        "correct": "result = (1 + 2)\nprint(result)",
-                        "explanation": "複数行にまたがる場合も括弧を閉じる必要があります",
-                    },
-                )
+                similar_examples.extend(catalog.examples("SyntaxError.paren_never_closed"))
         # unexpected EOF
         elif "unexpected EOF" in error_message:
-            similar_examples.append(
-                {
-                    "wrong": "if True:\n    print('開始'",
-                    "correct": "if True:\n    print('開始')",
-                    "explanation": "文字列やブロックが完成していません",
-                },
-            )
+            similar_examples.extend(catalog.examples("SyntaxError.unexpected_eof"))
         # 従来の一般的な例
         elif ":" not in context.get("problematic_line", "") and any(
             kw in context.get("problematic_line", "") for kw in ["if", "for", "while", "def", "class"]
         ):
-            similar_examples.append(
-                {
-                    "wrong": "if x > 5\n    print('大きい')",
-                    "correct": "if x > 5:\n    print('大きい')",
-                    "explanation": "制御構造の後にはコロン(:)が必要です",
-                },
-            )
+            similar_examples.extend(catalog.examples("SyntaxError.missing_colon"))
 
     elif error_type == "NameError":
         if context.get("name"):
-            var_name = context["name"]
-            similar_examples.append(
-                {
-                    "wrong": f"print({var_name})\n{var_name} = 10",
-                    "correct": f"{var_name} = 10\nprint({var_name})",
-                    "explanation": "変数は使用する前に定義する必要があります",
-                },
-            )
+            similar_examples.extend(catalog.examples("NameError.use_before_define", name=context["name"]))
         # 組み込み関数のタイポ
         if context.get("name") in ["pirnt", "prnt", "prin"]:
-            similar_examples.append(
-                {
-                    "wrong": "pirnt('Hello')",
-                    "correct": "print('Hello')",
-                    "explanation": "組み込み関数名のスペルに注意してください",
-                },
-            )
+            similar_examples.extend(catalog.examples("NameError.builtin_typo"))
 
     elif error_type == "IndentationError":
         if "expected an indented block" in error_message:
-            similar_examples.append(
-                {
-                    "wrong": "if x > 5:\nprint('大きい')",
-                    "correct": "if x > 5:\n    print('大きい')",
-                    "explanation": "if文の後のブロックはインデントが必要です",
-                },
-            )
-            similar_examples.append(
-                {
-                    "wrong": "def hello():\nprint('Hello')",
-                    "correct": "def hello():\n    print('Hello')",
-                    "explanation": "関数定義の後のブロックもインデントが必要です",
-                },
-            )
+            similar_examples.extend(catalog.examples("IndentationError.expected_block"))
         else:
-            similar_examples.append(
-                {
-                    "wrong": "if x > 5:\n  print('大きい')\n    print('とても大きい')",
-                    "correct": "if x > 5:\n    print('大きい')\n    print('とても大きい')",
-                    "explanation": "同じブロック内では同じインデントレベルを保ってください",
-                },
-            )
-            similar_examples.append(
-                {
-                    "wrong": "def func():\n\treturn 1  # タブ\n    return 2  # スペース",
-                    "correct": "def func():\n    return 1\n    return 2",
-                    "explanation": "タブとスペースを混在させないでください",
-                },
-            )
+            similar_examples.extend(catalog.examples("IndentationError.inconsistent"))
 
     elif error_type == "TypeError":
         if "unsupported operand" in error_message:
-            similar_examples.append(
-                {
-                    "wrong": "result = '5' + 3",
-                    "correct": "result = int('5') + 3  # または '5' + str(3)",
-                    "explanation": "異なる型の値を演算する場合は型変換が必要です",
-                },
-            )
+            similar_examples.extend(catalog.examples("TypeError.unsupported_operand"))
         elif "missing" in error_message and "argument" in error_message:
-            similar_examples.append(
-                {
-                    "wrong": "print()",
-                    "correct": "print('Hello')",
-                    "explanation": "関数には必要な引数を渡す必要があります",
-                },
-            )
+            similar_examples.extend(catalog.examples("TypeError.missing_argument"))
 
     elif error_type == "IndexError":
-        similar_examples.append(
-            {
-                "wrong": "lst = [1, 2, 3]\nprint(lst[3])",
-                "correct": "lst = [1, 2, 3]\nprint(lst[2])  # 最後の要素",
-                "explanation": "リストのインデックスは0から始まり、長さ-1で終わります",
-            },
-        )
+        similar_examples.extend(catalog.examples("IndexError.out_of_range"))
 
     # 学習リソースの整形
     learning_resources = [resource["title"] for resource in resources]
@@ -566,142 +403,111 @@ async def analyze_error(code: str, error_message: str) -> dict:
 
 def generate_step_by_step_guide(error_type: str, context: dict[str, Any], line: int) -> list[dict[str, Any]]:
     """エラー解決のステップバイステップガイドを生成."""
-    guides = {
-        "SyntaxError": [
-            {"step": 1, "action": "エラーメッセージの行番号を確認", "detail": f"{line}行目を見てください"},
-            {"step": 2, "action": "その行の文法をチェック", "detail": "コロン、括弧、クォートなどを確認"},
-            {"step": 3, "action": "前後の行も確認", "detail": "前の行から続く構文エラーの可能性もあります"},
-            {"step": 4, "action": "修正して再実行", "detail": "一つずつ修正して動作を確認"},
-        ],
-        "NameError": [
-            {
-                "step": 1,
-                "action": "エラーで表示された名前を確認",
-                "detail": f"'{context.get('name', '変数')}'というキーワードを探す",
-            },
-            {
-                "step": 2,
-                "action": "その名前が定義されているか確認",
-                "detail": "変数の定義、関数の定義、インポート文を探す",
-            },
-            {"step": 3, "action": "スペルミスをチェック", "detail": "大文字・小文字の違いも確認"},
-            {"step": 4, "action": "定義の位置を確認", "detail": "使用する前に定義されているか"},
-        ],
-        "TypeError": [
-            {"step": 1, "action": "エラーが発生した演算や関数呼び出しを特定", "detail": f"{line}行目の演算を確認"},
-            {"step": 2, "action": "関係する変数の型を確認", "detail": "type()関数やprint()で中身を確認"},
-            {"step": 3, "action": "必要な型変換を特定", "detail": "int(), str(), float()などの使用を検討"},
-            {"step": 4, "action": "型変換を適用", "detail": "適切な場所で型変換を行う"},
-        ],
-        "IndentationError": [
-            {"step": 1, "action": "エラー行のインデントを確認", "detail": f"{line}行目の空白を数える"},
-            {"step": 2, "action": "前後の行と比較", "detail": "同じブロックは同じインデント"},
-            {"step": 3, "action": "タブとスペースの混在を確認", "detail": "エディタの空白文字表示をONに"},
-            {"step": 4, "action": "一貫したインデントに修正", "detail": "通常は4スペースに統一"},
-        ],
-        "IndexError": [
-            {"step": 1, "action": "リストやタプルのアクセス部分を特定", "detail": f"{line}行目の[]を探す"},
-            {"step": 2, "action": "リストの長さを確認", "detail": "len()関数で要素数を調べる"},
-            {"step": 3, "action": "インデックスの値を確認", "detail": "0から始まることを忘れずに"},
-            {"step": 4, "action": "範囲チェックを追加", "detail": "if文で範囲内かチェック"},
-        ],
-    }
-
-    return guides.get(
-        error_type,
-        [
-            {"step": 1, "action": "エラーメッセージを読む", "detail": "エラーの種類と発生場所を確認"},
-            {"step": 2, "action": "該当行を確認", "detail": "問題のあるコードを特定"},
-            {"step": 3, "action": "修正を試みる", "detail": "エラーメッセージのヒントに従う"},
-        ],
-    )
+    return get_catalog().guide(error_type, name=context.get("name", "変数"), line=line)
 
 
 def generate_visual_explanation(error_type: str, context: dict[str, Any]) -> dict[str, str]:
     """エラーの視覚的な説明を生成."""
-    visuals = {
-        "SyntaxError": {
-            "type": "diagram",
-            "content": """
-構文エラーの例：
-─────────────────────────
-❌ if x > 5
-     print("大きい")
-
-✅ if x > 5:  ← コロンが必要
-     print("大きい")
-─────────────────────────
-""",
-        },
-        "NameError": {
-            "type": "flow",
-            "content": f"""
-変数の使用フロー：
-─────────────────────────
-1. 定義 → x = 10
-2. 使用 → print(x)  ✅
-
-❌ 使用 → print({context.get("name", "y")})
-   定義 → {context.get("name", "y")} = 20
-─────────────────────────
-""",
-        },
-        "TypeError": {
-            "type": "comparison",
-            "content": """
-型の不一致：
-─────────────────────────
-❌ "5" + 3
-   文字列 + 数値 = エラー！
-
-✅ int("5") + 3 = 8
-   数値 + 数値 = OK!
-
-✅ "5" + str(3) = "53"
-   文字列 + 文字列 = OK!
-─────────────────────────
-""",
-        },
-        "IndentationError": {
-            "type": "alignment",
-            "content": """
-インデントの例：
-─────────────────────────
-❌ 不揃いなインデント
-if True:
-  x = 1
-    y = 2  ← 揃っていない！
-
-✅ 正しいインデント
-if True:
-    x = 1
-    y = 2  ← 揃っている！
-─────────────────────────
-""",
-        },
-        "IndexError": {
-            "type": "array",
-            "content": """
-リストのインデックス：
-─────────────────────────
-lst = ["A", "B", "C"]
-      [0]  [1]  [2]
-
-✅ lst[0] = "A"
-✅ lst[2] = "C"
-❌ lst[3] = エラー！
-
-長さ: len(lst) = 3
-有効な範囲: 0〜2
-─────────────────────────
-""",
-        },
-    }
+    return get_catalog().visual(error_type, name=context.get("name", "y"))
 
-    return visuals.get(
-        error_type,
-        {
-            "type": "text",
-            "content": "エラーの詳細な視覚的説明は準備中です。",
-        },
-    )
+
+_TRACEBACK_HEADER = "Traceback (most recent call last):"
+_FRAME_LINE = re.compile(r'^\s*File "(?P<file>[^"]*)", line (?P<line>\d+)')
+_EXCEPTION_LINE = re.compile(r"^(?:E\s+)?(?P<message>(?:[\w.]+\.)?\w*(?:Error|Exception|Exit|Interrupt)\b.*)$")
+# pytest の短い位置表示 (例: "main.py:5: ZeroDivisionError")
+_PYTEST_LOCATION = re.compile(r"^(?P<file>\S+):(?P<line>\d+): (?P<type>\w+)$")
+
+
+def split_error_log(log: str, filename: str | None = None) -> list[str]:
+    """テスト実行ログなどから個々のエラーメッセージを取り出す.
+
+    トレースバックは、解析対象のファイル (filename、省略時は最も内側) のフレーム行と
+    例外の行を組み合わせた 1 つのメッセージにする. トレースバック外の例外行 (pytest の "E   ..." など) も拾う.
+
+    Args:
+        log: ログ全体
+        filename: 解析対象のコードのファイル名
+
+    Returns:
+        エラーメッセージのリスト (ログに現れた順)
+    """
+    messages = []
+    frame = None
+    in_traceback = False
+    for raw in log.splitlines():
+        line = raw.rstrip()
+        if line.strip() == _TRACEBACK_HEADER:
+            in_traceback = True
+            frame = None
+            continue
+        frame_match = _FRAME_LINE.match(line)
+        if frame_match:
+            if filename is None or frame_match.group("file").endswith(filename):
+                frame = line.strip()
+            continue
+        if in_traceback and line.startswith((" ", "\t")):
+            continue  # ソース行やキャレットの行
+        location_match = _PYTEST_LOCATION.match(line.strip())
+        if location_match:
+            # 直前の例外行に位置を補う
+            if (
+                messages
+                and "\n" not in messages[-1]
+                and messages[-1].startswith(location_match.group("type"))
+                and (filename is None or location_match.group("file").endswith(filename))
+            ):
+                messages[-1] = (
+                    f'File "{location_match.group("file")}", line {location_match.group("line")}\n{messages[-1]}'
+                )
+            continue
+        exception_match = _EXCEPTION_LINE.match(line.strip())
+        if exception_match:
+            message = exception_match.group("message")
+            messages.append(f"{frame}\n{message}" if in_traceback and frame else message)
+        in_traceback = False
+        frame = None
+    return messages
+
+
+async def analyze_errors(code: str, error_messages: list[str]) -> dict[str, Any]:
+    """同じコードに対する複数のエラーをまとめて解析.
+
+    コードのパースとスコープ解析は一度だけ行い、すべてのエラーで共有する.
+    同じメッセージは一度だけ解析し、同じ内容になった診断はまとめて返す.
+
+    Args:
+        code: エラーが発生したコード
+        error_messages: エラーメッセージのリスト
+
+    Returns:
+        エラー件数、重複を除いた件数、診断のリスト (出現回数と元の位置付き)
+    """
+    prepared = prepare_code(code)
+
+    by_message: dict[str, dict[str, Any]] = {}
+    diagnoses: dict[tuple, dict[str, Any]] = {}
+    for index, error_message in enumerate(error_messages):
+        result = by_message.get(error_message)
+        if result is None:
+            result = await analyze_error(code, error_message, prepared)
+            by_message[error_message] = result
+
+        # 解析結果が同じなら (メッセージの表記が違っても) 同じ診断とみなす
+        key = (
+            result["error_type"],
+            result["line_number"],
+            result["column_number"],
+            tuple(result["fix_suggestions"]),
+            result["detailed_explanation"],
+        )
+        entry = diagnoses.get(key)
+        if entry is None:
+            entry = diagnoses[key] = {"error_message": error_message, "occurrences": 0, "indices": [], "result": result}
+        entry["occurrences"] += 1
+        entry["indices"].append(index)
+
+    return {
+        "error_count": len(error_messages),
+        "unique_count": len(diagnoses),
+        "diagnoses": list(diagnoses.values()),
+    }
@@ -0,0 +1,82 @@
+"""総合解析サービス.
+
+解析・可視化・エラー解析を同じコードに対して実行する. パース結果 (ParsedCode) を共有し、
+各処理は個別のエンドポイントと同じキーで結果キャッシュを使う.
+"""
+
+import asyncio
+from typing import Any
+
+from .analyzer import analyze_code
+from .cache import cached_call
+from .error_analyzer import analyze_error, prepare_code
+from .knowledge_base import get_catalog
+from .parsing import ParsedCode
+from .visualizer import visualize_code
+
+# 処理を実行する順序 (順に実行する場合は、結果を早く表示できるものから)
+SECTIONS = ("analysis", "visualization", "error")
+
+
+async def run_section(
+    section: str,
+    parsed: ParsedCode,
+    *,
+    highlight_line: int = 0,
+    show_flow: bool = True,
+    error_message: str | None = None,
+) -> dict[str, Any]:
+    """1 つの処理を結果キャッシュを使って実行.
+
+    Args:
+        section: 処理 (analysis, visualization, error)
+        parsed: パース済みのコード
+        highlight_line: 可視化でハイライトする行
+        show_flow: 可視化でフロー図を生成するか
+        error_message: エラー解析するエラーメッセージ
+
+    Returns:
+        各サービスの結果 (/analyze・/visualize・/analyze-error と同じ)
+    """
+    code = parsed.code
+    if section == "analysis":
+        return await cached_call("analyze", {"code": code}, lambda: analyze_code(code, parsed))
+    if section == "visualization":
+        return await cached_call(
+            "visualize",
+            {"code": code, "highlight_line": highlight_line, "show_flow": show_flow},
+            lambda: visualize_code(code, highlight_line=highlight_line, show_flow=show_flow, parsed=parsed),
+        )
+    if section == "error":
+        # 説明文は知識ベースから作るため、知識ベースのバージョンもキーに含める
+        return await cached_call(
+            "analyze-error",
+            {"code": code, "error_message": error_message, "catalog": get_catalog().version},
+            lambda: analyze_error(code, error_message, prepare_code(code, parsed)),
+        )
+    msg = f"Unknown section: {section}"
+    raise ValueError(msg)
+
+
+def ordered_sections(sections: set[str]) -> list[str]:
+    """処理を実行する順に並べる."""
+    return [section for section in SECTIONS if section in sections]
+
+
+async def inspect_code(code: str, sections: set[str], **options: Any) -> dict[str, dict[str, Any]]:  # noqa: ANN401
+    """複数の処理を並行して実行.
+
+    コードのパースとスコープ解析は、キャッシュにない処理が最初に必要としたときに一度だけ行う.
+
+    Args:
+        code: Pythonコード
+        sections: 実行する処理
+        **options: run_section のオプション
+
+    Returns:
+        処理ごとの結果
+    """
+    parsed = ParsedCode(code)
+    names = ordered_sections(sections)
+    results = await asyncio.gather(*(run_section(name, parsed, **options) for name in names))
+    return dict(zip(names, results, strict=True))
@@ -0,0 +1,167 @@
+"""エラー知識ベース.
+
+エラーの説明・ヒント・ガイド・図解・類似例をロケールごとのカタログファイルから提供.
+カタログは初回アクセス時に読み込まれ、ファイルが更新されると自動で再読み込みされる.
+"""
+
+import json
+import logging
+import mmap
+import os
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+# カタログファイルの配置場所 (ロケールごとに <locale>.json を置く)
+CATALOG_DIR = Path(os.getenv("ERROR_CATALOG_DIR", str(Path(__file__).resolve().parent.parent / "catalogs" / "errors")))
+DEFAULT_LOCALE = os.getenv("ERROR_CATALOG_LOCALE", "ja")
+# ファイル更新の確認間隔 (秒)
+RELOAD_INTERVAL = float(os.getenv("ERROR_CATALOG_RELOAD_INTERVAL", "2.0"))
+
+# 該当するエラータイプがない場合に使うキー
+DEFAULT_KEY = "_default"
+
+_PLACEHOLDER = re.compile(r"\{(\w+)\}")
+
+
+def render(value: Any, params: dict[str, Any]) -> Any:  # noqa: ANN401
+    """カタログの値に含まれる {name} 形式のプレースホルダーを置換.
+
+    params にないプレースホルダー (例: "{}") はそのまま残す.
+    """
+    if isinstance(value, str):
+        if "{" not in value:
+            return value
+        return _PLACEHOLDER.sub(lambda m: str(params[m.group(1)]) if m.group(1) in params else m.group(0), value)
+    if isinstance(value, list):
+        return [render(item, params) for item in value]
+    if isinstance(value, dict):
+        return {key: render(item, params) for key, item in value.items()}
+    return value
+
+
+class ErrorCatalog:
+    """ロケール 1 つ分のエラーカタログ.
+
+    読み込んだ内容は不変の辞書として保持し、再読み込み時は参照を丸ごと差し替える.
+    そのため読み取り側はロックを取らず、再読み込み中も古い内容で処理を続けられる.
+
+    Attributes:
+        path: カタログファイルのパス
+    """
+
+    def __init__(self, path: Path) -> None:
+        """コンストラクタ."""
+        self.path = path
+        self._data: dict[str, Any] | None = None
+        self._signature: tuple[int, int, int] | None = None
+        self._checked_at = 0.0
+        self._reload_lock = threading.Lock()
+
+    @property
+    def version(self) -> str:
+        """カタログのバージョン."""
+        return self._snapshot().get("version", "unknown")
+
+    def explanation(self, error_type: str, **params: Any) -> dict[str, Any]:  # noqa: ANN401
+        """エラータイプの説明を取得."""
+        return self._lookup("explanations", error_type, params)
+
+    def guide(self, error_type: str, **params: Any) -> list[dict[str, Any]]:  # noqa: ANN401
+        """ステップバイステップガイドを取得."""
+        return self._lookup("guides", error_type, params)
+
+    def visual(self, error_type: str, **params: Any) -> dict[str, str]:  # noqa: ANN401
+        """視覚的な説明を取得."""
+        return self._lookup("visuals", error_type, params)
+
+    def examples(self, key: str, **params: Any) -> list[dict[str, str]]:  # noqa: ANN401
+        """類似例を取得 (キーは "<エラータイプ>.<状況>" 形式)."""
+        return render(self._snapshot()["examples"].get(key, []), params)
+
+    def _lookup(self, section: str, error_type: str, params: dict[str, Any]) -> Any:  # noqa: ANN401
+        """セクションからエラータイプの項目を取得し、なければデフォルトを返す."""
+        entries = self._snapshot()[section]
+        return render(entries.get(error_type, entries[DEFAULT_KEY]), params)
+
+    def _snapshot(self) -> dict[str, Any]:
+        """現在のカタログ内容を取得 (必要なら読み込み・再読み込みする)."""
+        data = self._data
+        if data is None:
+            with self._reload_lock:
+                if self._data is None:
+                    self._load(self._stat())
+                data = self._data
+        elif time.monotonic() - self._checked_at >= RELOAD_INTERVAL:
+            self._maybe_reload()
+            data = self._data
+        return data
+
+    def _maybe_reload(self) -> None:
+        """ファイルが変更されていれば再読み込み.
+
+        別スレッドが再読み込み中の場合は待たずに古い内容を使う.
+        """
+        if not self._reload_lock.acquire(blocking=False):
+            return
+        try:
+            self._checked_at = time.monotonic()
+            try:
+                signature = self._stat()
+            except OSError as e:
+                logger.warning("Error catalog is not accessible, keeping loaded version: %s", e)
+                return
+            if signature == self._signature:
+                return
+            try:
+                self._load(signature)
+            except (OSError, ValueError) as e:
+                # 書き込み途中のファイルなどは無視し、次の確認で再試行する
+                logger.warning("Failed to reload error catalog %s: %s", self.path, e)
+        finally:
+            self._reload_lock.release()
+
+    def _stat(self) -> tuple[int, int, int]:
+        """ファイルの変更検知に使う (inode, サイズ, 更新時刻) を取得."""
+        st = self.path.stat()
+        return st.st_ino, st.st_size, st.st_mtime_ns
+
+    def _load(self, signature: tuple[int, int, int]) -> None:
+        """カタログファイルを読み込んで差し替える."""
+        with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:  # noqa: PTH123
+            data = json.loads(mm[:])
+        for section in ("explanations", "guides", "visuals"):
+            if DEFAULT_KEY not in data.get(section, {}):
+                msg = f"section '{section}' must define '{DEFAULT_KEY}'"
+                raise ValueError(msg)
+        data.setdefault("examples", {})
+
+        self._data = data
+        self._signature = signature
+        self._checked_at = time.monotonic()
+        logger.info("Loaded error catalog %s (version %s)", self.path.name, data.get("version", "unknown"))
+
+
+_catalogs: dict[str, ErrorCatalog] = {}
+_catalogs_lock = threading.Lock()
+
+
+def get_catalog(locale: str | None = None) -> ErrorCatalog:
+    """ロケールのカタログを取得.
+
+    Args:
+        locale: ロケール (省略時は ERROR_CATALOG_LOCALE)
+
+    Returns:
+        エラーカタログ
+    """
+    locale = locale or DEFAULT_LOCALE
+    catalog = _catalogs.get(locale)
+    if catalog is None:
+        with _catalogs_lock:
+            catalog = _catalogs.setdefault(locale, ErrorCatalog(CATALOG_DIR / f"{locale}.json"))
+    return catalog
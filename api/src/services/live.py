@@ -0,0 +1,236 @@
+"""ライブ解析のセッション.
+
+エディタの編集ごとに HTTP リクエストを送ると、生徒が入力を続けている間も古いコードの解析に
+CPU を使い続けてしまう. エディタのセッションごとに 1 つの LiveSession を作り、次のように
+最新のコードだけを解析する.
+
+- デバウンス: 編集が DEBOUNCE_SECONDS 秒途切れるまで解析を始めない
+  (入力が続いていても、最初の編集から MAX_WAIT_SECONDS 秒たてば解析する)
+- キャンセル: 解析中に新しい版が届いたら、古い版の解析をキャンセルする
+- 版の付与: 結果にはコードの版 (クライアントが付ける番号) を付けて送る. 古い版の結果は送らない
+
+各処理 (解析・可視化・エラー解析) は順に実行し、終わったものから送る. 処理の合間にも
+新しい版が届いていないかを確認し、届いていれば残りの処理を行わない.
+
+WebSocket には HTTP のミドルウェア (レート制限・同時実行数の制御・締め切り) が効かないため、
+同じ制御をここで行う.
+
+- クライアントごとのセッション数を LIVE_MAX_SESSIONS_PER_CLIENT までに制限する
+- 1 つの版の解析ごとに同時実行数の制御の実行枠を確保する (HTTP のリクエストと同じ枠を使う)
+- 1 つの版の解析に REQUEST_DEADLINE_SECONDS の締め切りを設定する
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from typing import Any
+
+from ..middleware.rate_limit import REJECTED, AdmissionController
+from .deadline import DEFAULT_SECONDS, Deadline, DeadlineExceeded, use_deadline
+from .inspector import ordered_sections, run_section
+from .metrics import REGISTRY, Counter, Gauge
+from .parsing import ParsedCode
+
+logger = logging.getLogger(__name__)
+
+# 編集が途切れてから解析を始めるまでの時間 (秒)
+DEBOUNCE_SECONDS = float(os.getenv("LIVE_DEBOUNCE_MS", "300")) / 1000
+# 入力が続いている場合に、解析を待たせる最大時間 (秒)
+MAX_WAIT_SECONDS = float(os.getenv("LIVE_MAX_WAIT_MS", "2000")) / 1000
+# クライアント (API キーまたは IP アドレス) ごとのセッション数の上限 (0 で無制限).
+# 学校の NAT の後ろではクラス全員が同じ IP アドレスになるため、2 クラス (80 人) 分にする
+MAX_SESSIONS_PER_CLIENT = int(os.getenv("LIVE_MAX_SESSIONS_PER_CLIENT", "80"))
+
+SESSIONS = REGISTRY.register(Gauge("live_sessions", "接続中のライブ解析のセッション数"))
+VERSIONS = REGISTRY.register(
+    Counter(
+        "live_versions_total",
+        "ライブ解析で受け取ったコードの版の数 (outcome: received, analyzed, superseded)",
+        ("outcome",),
+    ),
+)
+
+# 送信するメッセージ (辞書) を受け取るコルーチン関数
+Publisher = Callable[[dict[str, Any]], Awaitable[None]]
+
+# クライアント -> 接続中のセッション数
+_client_sessions: dict[str, int] = {}
+_client_sessions_lock = threading.Lock()
+
+
+def open_client_session(client: str, limit: int = MAX_SESSIONS_PER_CLIENT) -> bool:
+    """クライアントのセッションを 1 つ数える.
+
+    Returns:
+        受け付けた場合は True (上限に達している場合は False)
+    """
+    with _client_sessions_lock:
+        count = _client_sessions.get(client, 0)
+        if 0 < limit <= count:
+            return False
+        _client_sessions[client] = count + 1
+        return True
+
+
+def close_client_session(client: str) -> None:
+    """open_client_session で数えたセッションを 1 つ減らす."""
+    with _client_sessions_lock:
+        count = _client_sessions.pop(client, 0) - 1
+        if count > 0:
+            _client_sessions[client] = count
+
+
+@dataclass
+class LiveEdit:
+    """コードの 1 つの版.
+
+    Attributes:
+        version: クライアントが付けた版の番号 (大きいほど新しい)
+        code: Pythonコード
+        sections: 実行する処理
+        options: run_section のオプション (highlight_line など)
+    """
+
+    version: int
+    code: str
+    sections: set[str]
+    options: dict[str, Any] = field(default_factory=dict)
+
+
+class LiveSession:
+    """エディタの 1 セッション分のライブ解析."""
+
+    def __init__(
+        self,
+        publish: Publisher,
+        *,
+        debounce: float = DEBOUNCE_SECONDS,
+        max_wait: float = MAX_WAIT_SECONDS,
+        deadline_seconds: float = DEFAULT_SECONDS,
+        admission: AdmissionController | None = None,
+    ) -> None:
+        """コンストラクタ.
+
+        Args:
+            publish: 結果やエラーのメッセージを送るコルーチン関数
+            debounce: 編集が途切れてから解析を始めるまでの時間 (秒)
+            max_wait: 入力が続いている場合に、解析を待たせる最大時間 (秒)
+            deadline_seconds: 1 つの版の解析の締め切り (秒、0 以下で締め切りなし)
+            admission: 解析ごとに実行枠を確保する同時実行数の制御 (None で制御しない)
+        """
+        self.publish = publish
+        self.debounce = debounce
+        self.max_wait = max_wait
+        self.deadline_seconds = deadline_seconds
+        self.admission = admission
+        self._latest: LiveEdit | None = None
+        self._changed = asyncio.Event()
+        self._task: asyncio.Task[None] | None = None
+
+    def submit(self, edit: LiveEdit) -> bool:
+        """新しい版を受け取る.
+
+        Returns:
+            受け付けた場合は True (受け取り済みの版より古い場合は False)
+        """
+        if self._latest is not None and edit.version <= self._latest.version:
+            return False
+        VERSIONS.inc("received")
+        self._latest = edit
+        self._changed.set()
+        if self._task is not None and not self._task.done():
+            # 古い版の解析は結果を待たずに打ち切る
+            self._task.cancel()
+        return True
+
+    async def run(self) -> None:
+        """版を受け取るたびに、デバウンスしてから解析する (セッションが終わるまで続く)."""
+        SESSIONS.inc()
+        try:
+            while True:
+                await self._changed.wait()
+                # 編集が debounce 秒途切れるまで (最大 max_wait 秒) 待つ
+                deadline = time.monotonic() + self.max_wait
+                while True:
+                    self._changed.clear()
+                    timeout = min(self.debounce, deadline - time.monotonic())
+                    if timeout <= 0:
+                        break
+                    try:
+                        await asyncio.wait_for(self._changed.wait(), timeout)
+                    except TimeoutError:
+                        break
+
+                edit = self._latest
+                if edit is None:
+                    continue
+                VERSIONS.inc("analyzed")
+                self._task = asyncio.create_task(self._analyze(edit))
+                await asyncio.wait({self._task})
+                if self._task.cancelled():
+                    VERSIONS.inc("superseded")
+                    logger.debug("Live analysis of version %d was superseded", edit.version)
+                elif self._task.exception() is not None:
+                    # 結果を送れなかった (送信中に接続が切れたなど) 場合はセッションを終える
+                    logger.warning("Live session ended: %r", self._task.exception())
+                    return
+        finally:
+            SESSIONS.dec()
+            if self._task is not None:
+                self._task.cancel()
+
+    def _superseded(self, edit: LiveEdit) -> bool:
+        """新しい版が届いているか."""
+        return self._latest is not edit
+
+    async def _analyze(self, edit: LiveEdit) -> None:
+        """実行枠を確保し、締め切りを設定して 1 つの版を解析する."""
+        if self.admission is not None:
+            reason = await self.admission.acquire()
+            if reason is not None:
+                REJECTED.inc(reason)
+                logger.warning("Live analysis rejected (%s)", reason)
+                await self.publish(
+                    {
+                        "type": "error",
+                        "version": edit.version,
+                        "message": "サーバーが混み合っています。しばらく待ってから再度お試しください",
+                    },
+                )
+                return
+        try:
+            with use_deadline(Deadline.after(self.deadline_seconds)):
+                await self._run_sections(edit)
+        except DeadlineExceeded as e:
+            await self.publish({"type": "error", "version": edit.version, "message": str(e)})
+        finally:
+            if self.admission is not None:
+                self.admission.release()
+
+    async def _run_sections(self, edit: LiveEdit) -> None:
+        """1 つの版を解析し、処理ごとに結果を送る."""
+        parsed = ParsedCode(edit.code)
+        sections = ordered_sections(edit.sections)
+        for index, section in enumerate(sections):
+            try:
+                result = await run_section(section, parsed, **edit.options)
+            except Exception as e:
+                logger.exception("Live analysis failed")
+                await self.publish({"type": "error", "version": edit.version, "message": str(e)})
+                return
+            if self._superseded(edit):
+                VERSIONS.inc("superseded")
+                return
+            await self.publish(
+                {
+                    "type": "result",
+                    "version": edit.version,
+                    "section": section,
+                    "final": index == len(sections) - 1,
+                    "result": result,
+                },
+            )
@@ -0,0 +1,249 @@
+"""メトリクスの収集.
+
+Prometheus のテキスト形式で公開するカウンター・ゲージ・ヒストグラムを提供する.
+
+本番環境で常に有効にしておけるよう、記録時にロックを取らない. 値はスレッドごとの
+シャードに書き込み、/metrics の取得時にすべてのシャードを合計する
+(シャードの登録時だけロックを取る). 値はワーカープロセスごとの集計になる.
+"""
+
+import bisect
+import threading
+import time
+from collections.abc import Callable, Iterable, Iterator
+from typing import Any
+
+# リクエスト・処理段階の所要時間のバケット (秒)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+# レスポンスサイズのバケット (バイト)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+# AST のノード数のバケット
+NODE_COUNT_BUCKETS = (10, 50, 100, 500, 1000, 5000, 10000, 50000)
+
+# 収集時に値を返す関数: (メトリクス名, 種類, 説明, [(ラベル, 値)]) を返す
+Collector = Callable[[], Iterable[tuple[str, str, str, list[tuple[dict[str, str], float]]]]]
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    """ラベルを Prometheus の形式に整形."""
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values, strict=True)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    """ラベル値をエスケープ."""
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    """値を整形 (整数はそのまま)."""
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class _Metric:
+    """スレッドごとのシャードに値を持つメトリクスの基底クラス."""
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, label_names: tuple[str, ...] = ()) -> None:
+        """コンストラクタ."""
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self._local = threading.local()
+        self._shards: list[dict[tuple[str, ...], Any]] = []
+        self._shards_lock = threading.Lock()
+
+    def _shard(self) -> dict[tuple[str, ...], Any]:
+        """このスレッドのシャードを取得."""
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._shards_lock:
+                self._shards.append(shard)
+        return shard
+
+    def _snapshot(self) -> list[dict[tuple[str, ...], Any]]:
+        """全シャードのコピー."""
+        with self._shards_lock:
+            shards = list(self._shards)
+        return [dict(shard) for shard in shards]
+
+    def render(self) -> Iterator[str]:
+        """Prometheus のテキスト形式で出力."""
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.kind}"
+
+
+class Counter(_Metric):
+    """単調増加するカウンター."""
+
+    kind = "counter"
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        """値を加算."""
+        shard = self._shard()
+        shard[labels] = shard.get(labels, 0) + amount
+
+    def render(self) -> Iterator[str]:
+        """Prometheus のテキスト形式で出力."""
+        yield from super().render()
+        totals: dict[tuple[str, ...], float] = {}
+        for shard in self._snapshot():
+            for labels, value in shard.items():
+                totals[labels] = totals.get(labels, 0) + value
+        for labels, value in sorted(totals.items()):
+            yield f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}"
+
+
+class Gauge(_Metric):
+    """増減する値 (イベントループなど単一のスレッドから更新する)."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, label_names: tuple[str, ...] = ()) -> None:
+        """コンストラクタ."""
+        super().__init__(name, documentation, label_names)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        """値を加算."""
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        """値を減算."""
+        self._values[labels] = self._values.get(labels, 0) - amount
+
+    def render(self) -> Iterator[str]:
+        """Prometheus のテキスト形式で出力."""
+        yield from super().render()
+        values = dict(self._values) or {(): 0}
+        for labels, value in sorted(values.items()):
+            yield f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}"
+
+
+class Histogram(_Metric):
+    """値の分布を数えるヒストグラム."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        label_names: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ) -> None:
+        """コンストラクタ."""
+        super().__init__(name, documentation, label_names)
+        self.buckets = buckets
+
+    def observe(self, value: float, *labels: str) -> None:
+        """値を記録."""
+        shard = self._shard()
+        series = shard.get(labels)
+        if series is None:
+            # バケットごとの件数 (最後は +Inf), 合計, 件数
+            series = shard[labels] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self) -> Iterator[str]:
+        """Prometheus のテキスト形式で出力."""
+        yield from super().render()
+        totals: dict[tuple[str, ...], list[float]] = {}
+        for shard in self._snapshot():
+            for labels, series in shard.items():
+                total = totals.setdefault(labels, [0] * len(series))
+                for index, value in enumerate(series):
+                    total[index] += value
+        for labels, series in sorted(totals.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), series, strict=False):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _format_value(bound)
+                bucket_labels = _format_labels(self.label_names, labels, 'le="' + le + '"')
+                yield f"{self.name}_bucket{bucket_labels} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.label_names, labels)} {_format_value(series[-2])}"
+            yield f"{self.name}_count{_format_labels(self.label_names, labels)} {int(series[-1])}"
+
+
+class Registry:
+    """メトリクスと収集関数の登録先."""
+
+    def __init__(self) -> None:
+        """コンストラクタ."""
+        self._metrics: list[_Metric] = []
+        self._collectors: list[Collector] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        """メトリクスを登録."""
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Collector) -> None:
+        """取得時に値を計算する関数を登録 (キャッシュやプールの統計など)."""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        """すべてのメトリクスを Prometheus のテキスト形式で出力."""
+        lines: list[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            for name, kind, documentation, samples in collector():
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    names = tuple(labels)
+                    lines.append(
+                        f"{name}{_format_labels(names, tuple(labels[n] for n in names))} {_format_value(value)}"
+                    )
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+REQUESTS = REGISTRY.register(
+    Counter("http_requests_total", "HTTP リクエスト数", ("route", "method", "status")),
+)
+REQUEST_DURATION = REGISTRY.register(
+    Histogram("http_request_duration_seconds", "HTTP リクエストの処理時間 (秒)", ("route", "method")),
+)
+RESPONSE_SIZE = REGISTRY.register(
+    Histogram("http_response_size_bytes", "レスポンス本文の大きさ (圧縮後, バイト)", ("route",), SIZE_BUCKETS),
+)
+IN_FLIGHT = REGISTRY.register(Gauge("http_requests_in_flight", "処理中の HTTP リクエスト数"))
+STAGE_DURATION = REGISTRY.register(
+    Histogram("analysis_stage_duration_seconds", "解析の段階ごとの処理時間 (秒)", ("stage",)),
+)
+AST_NODES = REGISTRY.register(
+    Histogram("analysis_ast_nodes", "解析したコードの AST ノード数", (), NODE_COUNT_BUCKETS),
+)
+
+
+class stage:  # noqa: N801 (with 文で使うため関数風の名前にする)
+    """処理段階の所要時間を記録するコンテキストマネージャー.
+
+    例:
+        with stage("parse"):
+            tree = ast.parse(code)
+    """
+
+    __slots__ = ("name", "started")
+
+    def __init__(self, name: str) -> None:
+        """コンストラクタ."""
+        self.name = name
+        self.started = 0.0
+
+    def __enter__(self) -> None:
+        """計測を開始."""
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc_info: object) -> None:
+        """計測を終了して記録."""
+        STAGE_DURATION.observe(time.perf_counter() - self.started, self.name)
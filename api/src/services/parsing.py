@@ -0,0 +1,64 @@
+"""コードのパース結果の共有.
+
+解析・可視化・エラー解析はどれも同じコードの AST とスコープ解析を必要とする.
+ParsedCode はそれぞれを最初に必要になったときに 1 回だけ計算して保持し、
+/inspect のように複数のサービスを同じコードに対して実行する場合に共有する.
+
+AST はどのサービスも読むだけなので、複数のスレッドから同時に使ってよい.
+"""
+
+import ast
+import threading
+from collections.abc import Callable
+from typing import Any
+
+from .metrics import stage
+from .scope_analyzer import analyze_scopes
+
+
+class ParsedCode:
+    """1 回だけパースしたコード.
+
+    パースやスコープ解析で発生した例外 (SyntaxError など) も保持し、取得するたびに送出する.
+
+    Attributes:
+        code: Pythonコード
+        lines: コードの行のリスト
+    """
+
+    def __init__(self, code: str) -> None:
+        """コンストラクタ."""
+        self.code = code
+        self.lines = code.split("\n")
+        self._lock = threading.Lock()
+        self._results: dict[str, Any] = {}
+
+    def _get(self, name: str, compute: Callable[[str], Any]) -> Any:  # noqa: ANN401
+        """結果を 1 回だけ計算して返す."""
+        with self._lock:
+            if name not in self._results:
+                with stage(name):
+                    try:
+                        self._results[name] = (compute(self.code), None)
+                    except Exception as e:  # noqa: BLE001 (取得するたびに同じ例外を送出する)
+                        self._results[name] = (None, e)
+            value, error = self._results[name]
+        if error is not None:
+            raise error
+        return value
+
+    def tree(self) -> ast.Module:
+        """AST を取得.
+
+        Raises:
+            SyntaxError: コードに構文エラーがある場合
+        """
+        return self._get("parse", ast.parse)
+
+    def scopes(self) -> dict[str, Any]:
+        """スコープ解析の結果を取得.
+
+        Raises:
+            SyntaxError: コードに構文エラーがある場合
+        """
+        return self._get("scope_analysis", analyze_scopes)
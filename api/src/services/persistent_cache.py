@@ -0,0 +1,299 @@
+"""解析結果の永続キャッシュ.
+
+共有メモリの結果キャッシュ (cache.py) は容量が小さく、プロセスの再起動で消える. その後ろに
+SQLite のファイルのキャッシュを置き、より多くの結果を残す. ローカルディスクが残る環境 (VM や
+Docker のボリューム) では、再起動やデプロイをまたいで結果が残る. Cloud Run ではコンテナの
+ファイルシステムがメモリ上にあり、インスタンスとともに消えるため、インスタンスの寿命の間だけ働き、
+その容量はコンテナのメモリから使う (Cloud Run での上限の既定値は小さくしてある).
+
+- 読み込み (read-through): 共有メモリのキャッシュにない結果をここから探し、あれば共有メモリにも入れる
+- 書き込み (write-behind): 計算した結果はキューに入れ、バックグラウンドのスレッドがまとめて書き込む.
+  リクエストはディスクへの書き込みを待たない
+- 結果は zlib で圧縮して保存する. キーは結果キャッシュと同じ (コードのハッシュ・パラメータ・解析ロジックの
+  バージョン) で、ANALYZER_VERSION を更新すると古い結果は使われなくなり、期限切れとともに消える
+- 有効期限 (TTL) を過ぎた結果と、合計サイズの上限を超えた分 (最後に使われた時刻が古いものから) を
+  定期的に削除する
+
+PERSISTENT_CACHE_PATH を設定した場合のみ有効. SQLite の WAL モードはファイルのロックと共有メモリ
+(-shm ファイル) をホストの中でしか共有できないため、パスはそのホストのローカルディスクに置き、
+同じファイルを使うのは同じホストのワーカーだけにする. NFS や Cloud Storage (gcsfuse) などの
+ネットワーク上のファイルシステムでは壊れるおそれがあるため、警告して永続キャッシュを使わない.
+"""
+
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+CACHE_PATH = os.getenv("PERSISTENT_CACHE_PATH", "")
+TTL_SECONDS = float(os.getenv("PERSISTENT_CACHE_TTL_HOURS", "720")) * 3600
+# 保存する結果の合計サイズの上限. Cloud Run (K_SERVICE が設定される) ではファイルがメモリ上に
+# 置かれ、共有メモリのキャッシュに加えてコンテナのメモリを使うため、既定値を小さくする
+MAX_BYTES = int(float(os.getenv("PERSISTENT_CACHE_MAX_MB", "64" if os.getenv("K_SERVICE") else "512")) * 1024 * 1024)
+# 書き込み待ちのキューの長さ (あふれた結果は書き込まない)
+QUEUE_SIZE = int(os.getenv("PERSISTENT_CACHE_QUEUE_SIZE", "1000"))
+# 期限切れ・サイズ超過の削除を行う間隔 (秒)
+EVICTION_INTERVAL = 60.0
+_BATCH_SIZE = 256
+_COMPRESS_LEVEL = 6
+
+# WAL モードのデータベースを置けないネットワーク上のファイルシステム (/proc/mounts の種類)
+_NETWORK_FILESYSTEMS = frozenset({"nfs", "nfs4", "cifs", "smb3", "smbfs", "ceph", "glusterfs", "lustre"})
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key BLOB PRIMARY KEY,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed);
+"""
+
+
+@dataclass
+class PersistentCacheStats:
+    """永続キャッシュの統計 (このプロセスでの値).
+
+    Attributes:
+        hits: ヒット数
+        misses: ミス数 (期限切れを含む)
+        writes: 書き込んだ結果の数
+        dropped: キューがあふれて書き込まなかった結果の数
+        evicted: 期限切れ・サイズ超過で削除した結果の数
+    """
+
+    hits: int = 0
+    misses: int = 0
+    writes: int = 0
+    dropped: int = 0
+    evicted: int = 0
+
+
+class PersistentResultCache:
+    """SQLite に結果を保存する永続キャッシュ."""
+
+    def __init__(
+        self,
+        path: Path,
+        *,
+        ttl_seconds: float = TTL_SECONDS,
+        max_bytes: int = MAX_BYTES,
+        queue_size: int = QUEUE_SIZE,
+    ) -> None:
+        """コンストラクタ.
+
+        Args:
+            path: データベースファイルのパス (同じホストのワーカー間で同じパスを使ってよい)
+            ttl_seconds: 結果の有効期限 (秒)
+            max_bytes: 保存する結果の合計サイズ (圧縮後) の上限
+            queue_size: 書き込み待ちのキューの長さ
+        """
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.stats = PersistentCacheStats()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._reader = self._connect()
+        self._reader_lock = threading.Lock()
+        self._queue: queue.Queue[tuple[str, bytes, bytes | None, float] | None] = queue.Queue(queue_size)
+        self._writer = threading.Thread(target=self._write_behind, name="persistent-cache-writer", daemon=True)
+        self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        """データベースに接続 (同じホストの複数のワーカーから同時に使えるよう WAL モードにする)."""
+        connection = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.executescript(_SCHEMA)
+        return connection
+
+    def get(self, key: bytes) -> bytes | None:
+        """キーに対応する本文を取得 (ないか期限切れなら None)."""
+        now = time.time()
+        try:
+            with self._reader_lock:
+                row = self._reader.execute("SELECT value, created FROM results WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error:
+            logger.warning("Persistent cache read failed", exc_info=True)
+            row = None
+        if row is None or now - row[1] > self.ttl_seconds:
+            self.stats.misses += 1
+            return None
+        try:
+            value = zlib.decompress(row[0])
+        except zlib.error:
+            self.stats.misses += 1
+            return None
+        self.stats.hits += 1
+        # 最後に使われた時刻の更新も書き込みスレッドに任せる
+        self._enqueue(("touch", key, None, now))
+        return value
+
+    def put(self, key: bytes, value: bytes) -> None:
+        """本文の書き込みを予約 (書き込みはバックグラウンドで行う)."""
+        self._enqueue(("put", key, zlib.compress(value, _COMPRESS_LEVEL), time.time()))
+
+    def _enqueue(self, item: tuple[str, bytes, bytes | None, float]) -> None:
+        """書き込みキューに入れる (あふれた場合は捨てる)."""
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            if item[0] == "put":
+                self.stats.dropped += 1
+
+    def _write_behind(self) -> None:
+        """キューの内容をまとめて書き込むスレッド."""
+        connection = self._connect()
+        last_eviction = 0.0
+        running = True
+        while running:
+            item = self._queue.get()
+            batch = []
+            while item is not None:
+                batch.append(item)
+                if len(batch) >= _BATCH_SIZE:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            running = item is not None
+            try:
+                self._write_batch(connection, batch)
+                if time.monotonic() - last_eviction > EVICTION_INTERVAL:
+                    last_eviction = time.monotonic()
+                    self.stats.evicted += self._evict(connection)
+            except sqlite3.Error:
+                logger.warning("Persistent cache write failed", exc_info=True)
+        connection.close()
+
+    def _write_batch(self, connection: sqlite3.Connection, batch: list[tuple[str, bytes, bytes | None, float]]) -> None:
+        """書き込みを 1 つのトランザクションで行う."""
+        if not batch:
+            return
+        puts = [(key, value, len(value), at, at) for kind, key, value, at in batch if kind == "put"]
+        touches = [(at, key) for kind, key, _, at in batch if kind == "touch"]
+        with connection:
+            connection.execute("BEGIN")
+            if puts:
+                connection.executemany(
+                    "INSERT OR REPLACE INTO results (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                    puts,
+                )
+            if touches:
+                connection.executemany("UPDATE results SET accessed = ? WHERE key = ?", touches)
+        self.stats.writes += len(puts)
+
+    def _evict(self, connection: sqlite3.Connection) -> int:
+        """期限切れの結果と、合計サイズの上限を超えた分を削除.
+
+        Returns:
+            削除した結果の数
+        """
+        with connection:
+            connection.execute("BEGIN")
+            removed = connection.execute(
+                "DELETE FROM results WHERE created < ?",
+                (time.time() - self.ttl_seconds,),
+            ).rowcount
+            total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+            if total > self.max_bytes:
+                # 最後に使われた時刻が古いものから、上限を下回るまで削除する
+                excess = total - self.max_bytes
+                victims = []
+                for key, size in connection.execute("SELECT key, size FROM results ORDER BY accessed"):
+                    victims.append((key,))
+                    excess -= size
+                    if excess <= 0:
+                        break
+                connection.executemany("DELETE FROM results WHERE key = ?", victims)
+                removed += len(victims)
+        return removed
+
+    def entries(self) -> tuple[int, int]:
+        """保存している結果の数と合計サイズ (圧縮後のバイト数)."""
+        with self._reader_lock:
+            return self._reader.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+
+    def close(self, timeout: float = 5.0) -> None:
+        """書き込み待ちの結果を書き込んでから閉じる."""
+        self._queue.put(None)
+        self._writer.join(timeout)
+        with self._reader_lock:
+            self._reader.close()
+
+
+def _filesystem_type(path: Path) -> str | None:
+    """パスが置かれたファイルシステムの種類 (/proc/mounts が読めない場合は None)."""
+    target = path.resolve()
+    try:
+        mounts = [line.split()[1:3] for line in Path("/proc/mounts").read_text(encoding="utf-8").splitlines()]
+    except OSError:
+        return None
+    best: tuple[int, str] | None = None
+    for mount_point, fs_type in mounts:
+        point = Path(mount_point.replace("\\040", " "))
+        if (target == point or point in target.parents) and (best is None or len(point.parts) > best[0]):
+            best = (len(point.parts), fs_type)
+    return best[1] if best else None
+
+
+def is_network_filesystem(path: Path) -> bool:
+    """WAL モードのデータベースを置けないネットワーク上のファイルシステムかどうか."""
+    fs_type = _filesystem_type(path)
+    if fs_type is None:
+        return False
+    return fs_type in _NETWORK_FILESYSTEMS or fs_type == "fuse" or fs_type.startswith("fuse.")
+
+
+_cache: PersistentResultCache | None = None
+_cache_disabled = not CACHE_PATH
+_cache_lock = threading.Lock()
+
+
+def get_persistent_cache() -> PersistentResultCache | None:
+    """プロセス共通の永続キャッシュを取得 (無効または開けない場合は None)."""
+    global _cache, _cache_disabled  # noqa: PLW0603
+
+    if _cache is None and not _cache_disabled:
+        with _cache_lock:
+            if _cache is None and not _cache_disabled:
+                if is_network_filesystem(Path(CACHE_PATH)):
+                    logger.warning(
+                        "Persistent cache disabled: %s is on a network filesystem; "
+                        "SQLite WAL needs a local disk shared only by workers on the same host",
+                        CACHE_PATH,
+                    )
+                    _cache_disabled = True
+                    return None
+                try:
+                    _cache = PersistentResultCache(Path(CACHE_PATH))
+                    logger.info(
+                        "Persistent cache opened at %s (TTL %.0f h, max %d MB)",
+                        CACHE_PATH,
+                        _cache.ttl_seconds / 3600,
+                        _cache.max_bytes // (1024 * 1024),
+                    )
+                except (OSError, sqlite3.Error):
+                    logger.warning("Persistent cache disabled: cannot open %s", CACHE_PATH, exc_info=True)
+                    _cache_disabled = True
+    return _cache
+
+
+def close_persistent_cache() -> None:
+    """書き込み待ちの結果を書き込んで閉じる (終了時に呼ぶ)."""
+    global _cache  # noqa: PLW0603
+
+    with _cache_lock:
+        if _cache is not None:
+            _cache.close()
+            _cache = None
@@ -0,0 +1,381 @@
+"""サンドボックス実行サービス.
+
+事前に起動しておいた (ウォームな) ワーカープロセスで生徒のコードを実行し、
+発生した例外とトレースバックを取得する. ワーカーは sandbox_worker.py を空の環境変数で
+起動したプロセスで、実行ごとに自身を fork した子プロセスで生徒のコードを実行する.
+
+各ワーカーには次の制限をかける:
+
+- 隔離: ネットワークなし・読み取り専用のファイルシステム・権限のないユーザー (OS の名前空間と
+  setuid で行う. コンテナの権限で行えない隔離は起動時に警告する)
+- CPU 時間: 1 回の実行ごとに SIGPROF タイマーで打ち切る (RLIMIT_CPU は暴走時の保険)
+- メモリ: RLIMIT_AS で仮想メモリの上限を設定
+- 実行時間 (壁時計): 親プロセスが応答を待つ時間の上限。超えたらワーカーを kill して補充
+- プロセス生成 / ファイル書き込み: RLIMIT_NPROC・RLIMIT_FSIZE・RLIMIT_NOFILE と監査フックで拒否
+
+ワーカーとのやり取りは長さ付きの JSON で、受け取った結果は大きさと形を確かめてから使う.
+やり取りに失敗したワーカーは壊れているものとして kill し、新しいものと交換する.
+"""
+
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from multiprocessing.connection import Connection
+from pathlib import Path
+from typing import Any
+
+from .metrics import REGISTRY
+from .sandbox_worker import STUDENT_FILENAME, max_result_bytes
+
+logger = logging.getLogger(__name__)
+
+# root で起動した場合にワーカーを切り替えるユーザーとグループ (既定は nobody / nogroup)
+SANDBOX_UID = int(os.getenv("SANDBOX_UID", "65534"))
+SANDBOX_GID = int(os.getenv("SANDBOX_GID", "65534"))
+
+# ワーカーの起動を待つ時間の上限 (秒)
+SPAWN_TIMEOUT = 10.0
+# ワーカーに渡す環境変数 (API のシークレットなどを引き継がない)
+_WORKER_ENV = {"LANG": "C.UTF-8"}
+_WORKER_SCRIPT = Path(__file__).with_name("sandbox_worker.py")
+# OS レベルで行いたい隔離 (sandbox_worker.isolate の戻り値の名前)
+_ISOLATION = ("network", "readonly_fs", "uid")
+_STATUSES = frozenset({"ok", "error", "cpu_limit", "memory_limit", "crashed"})
+
+
+@dataclass(frozen=True)
+class SandboxLimits:
+    """サンドボックスの資源制限.
+
+    Attributes:
+        cpu_seconds: 1 回の実行で使える CPU 時間 (秒)
+        memory_mb: 仮想メモリの上限 (MB)
+        wall_seconds: 1 回の実行の壁時計時間の上限 (秒)
+        max_output: 取得する標準出力の最大文字数
+        max_runs: ワーカーを入れ替えるまでの実行回数
+    """
+
+    cpu_seconds: float = float(os.getenv("SANDBOX_CPU_SECONDS", "1.0"))
+    memory_mb: int = int(os.getenv("SANDBOX_MEMORY_MB", "256"))
+    wall_seconds: float = float(os.getenv("SANDBOX_WALL_SECONDS", "3.0"))
+    max_output: int = int(os.getenv("SANDBOX_MAX_OUTPUT", "10000"))
+    max_runs: int = int(os.getenv("SANDBOX_MAX_RUNS", "100"))
+
+
+class SandboxProtocolError(Exception):
+    """ワーカーから受け取った結果が不正 (ワーカーは壊れているものとして扱う)."""
+
+
+def _validate_result(data: bytes) -> dict[str, Any]:
+    """ワーカーから受け取った結果の JSON を検証し、既知の項目だけの辞書にする.
+
+    Raises:
+        SandboxProtocolError: JSON でない場合や、項目の型が合わない場合
+    """
+    try:
+        raw = json.loads(data)
+    except (ValueError, UnicodeDecodeError) as e:
+        msg = "ワーカーの結果が JSON ではありません"
+        raise SandboxProtocolError(msg) from e
+    if not isinstance(raw, dict) or raw.get("status") not in _STATUSES:
+        msg = "ワーカーの結果の status が不正です"
+        raise SandboxProtocolError(msg)
+    if not isinstance(raw.get("stdout"), str) or not isinstance(raw.get("stdout_truncated"), bool):
+        msg = "ワーカーの結果の stdout が不正です"
+        raise SandboxProtocolError(msg)
+    exception = raw.get("exception")
+    if (exception is None) != (raw["status"] != "error"):
+        msg = "ワーカーの結果の exception が status と一致しません"
+        raise SandboxProtocolError(msg)
+    if exception is not None:
+        if not (
+            isinstance(exception, dict)
+            and all(isinstance(exception.get(key), str) for key in ("type", "message", "traceback"))
+            and type(exception.get("line")) is int
+        ):
+            msg = "ワーカーの結果の exception が不正です"
+            raise SandboxProtocolError(msg)
+        exception = {key: exception[key] for key in ("type", "message", "line", "traceback")}
+    return {
+        "status": raw["status"],
+        "exception": exception,
+        "stdout": raw["stdout"],
+        "stdout_truncated": raw["stdout_truncated"],
+    }
+
+
+@dataclass(eq=False)
+class _Worker:
+    """親プロセス側から見たワーカー."""
+
+    process: subprocess.Popen[bytes]
+    conn: Connection
+    runs: int = 0
+
+
+@dataclass
+class SandboxStats:
+    """サンドボックスプールの統計."""
+
+    runs: int = 0
+    errors: int = 0
+    timeouts: int = 0
+    crashes: int = 0
+    recycled: int = 0
+    waiting: int = 0
+    by_status: dict[str, int] = field(default_factory=dict)
+
+
+class SandboxPool:
+    """ウォームなサンドボックスワーカーのプール.
+
+    Attributes:
+        size: ワーカー数
+        limits: 資源制限
+    """
+
+    def __init__(self, size: int, limits: SandboxLimits | None = None) -> None:
+        """コンストラクタ."""
+        self.size = size
+        self.limits = limits or SandboxLimits()
+        self.stats = SandboxStats()
+        self._idle: asyncio.Queue[_Worker] | None = None
+        self._workers: set[_Worker] = set()
+        self._lock = threading.Lock()
+        self._warned_isolation = False
+
+    @property
+    def started(self) -> bool:
+        """プールが起動済みか."""
+        return self._idle is not None
+
+    async def start(self) -> None:
+        """ワーカーを事前に起動."""
+        if self._idle is not None:
+            return
+        self._idle = asyncio.Queue()
+        workers = await asyncio.gather(*(asyncio.to_thread(self._spawn) for _ in range(self.size)))
+        for worker in workers:
+            self._idle.put_nowait(worker)
+        logger.info("Sandbox pool started with %d workers", self.size)
+
+    async def close(self) -> None:
+        """すべてのワーカーを終了."""
+        with self._lock:
+            workers = list(self._workers)
+            self._workers.clear()
+        for worker in workers:
+            self._kill(worker)
+        self._idle = None
+
+    def idle_count(self) -> int:
+        """待機中のワーカー数."""
+        return self._idle.qsize() if self._idle is not None else 0
+
+    async def run(self, code: str, stdin: str = "") -> dict[str, Any]:
+        """コードをサンドボックスで実行.
+
+        Args:
+            code: Python コード
+            stdin: 標準入力として渡す文字列
+
+        Returns:
+            実行結果 (status, stdout, exception, elapsed_ms)
+        """
+        if self._idle is None:
+            await self.start()
+        idle = self._idle
+
+        self.stats.waiting += 1
+        try:
+            worker = await idle.get()
+        finally:
+            self.stats.waiting -= 1
+
+        # 呼び出し側が取り消されてもやり取りは最後まで行い、終わったワーカーだけをプールに戻す
+        task = asyncio.ensure_future(asyncio.to_thread(self._roundtrip, worker, code, stdin))
+        task.add_done_callback(lambda done: self._release(idle, done))
+        result, _ = await asyncio.shield(task)
+
+        self.stats.runs += 1
+        self.stats.by_status[result["status"]] = self.stats.by_status.get(result["status"], 0) + 1
+        if result["status"] == "error":
+            self.stats.errors += 1
+        return result
+
+    def _release(self, idle: asyncio.Queue[_Worker], task: asyncio.Future[Any]) -> None:
+        """やり取りを終えたワーカーをプールに戻す (交換に失敗した場合は補充をやり直す)."""
+        if task.cancelled() or task.exception() is not None:
+            logger.error("Sandbox worker replacement failed", exc_info=None if task.cancelled() else task.exception())
+            if idle is self._idle:
+                refill = asyncio.ensure_future(asyncio.to_thread(self._spawn))
+                refill.add_done_callback(lambda done: self._release_spawned(idle, done))
+            return
+        _, worker = task.result()
+        if idle is self._idle:
+            idle.put_nowait(worker)
+        else:
+            # プールを閉じた後に戻ってきたワーカー
+            self._kill(worker)
+
+    def _release_spawned(self, idle: asyncio.Queue[_Worker], task: asyncio.Future[Any]) -> None:
+        """補充したワーカーをプールに戻す."""
+        if task.cancelled() or task.exception() is not None:
+            logger.error("Sandbox worker refill failed", exc_info=None if task.cancelled() else task.exception())
+            return
+        worker = task.result()
+        if idle is self._idle:
+            idle.put_nowait(worker)
+        else:
+            self._kill(worker)
+
+    def _roundtrip(self, worker: _Worker, code: str, stdin: str) -> tuple[dict[str, Any], _Worker]:
+        """ワーカーにコードを送り結果を待つ (必要ならワーカーを入れ替える)."""
+        started = time.perf_counter()
+        broken = False
+        try:
+            worker.conn.send_bytes(json.dumps({"code": code, "stdin": stdin}).encode())
+            if worker.conn.poll(self.limits.wall_seconds):
+                result = _validate_result(worker.conn.recv_bytes(max_result_bytes(self.limits.max_output)))
+            else:
+                self.stats.timeouts += 1
+                result = {"status": "timeout", "exception": None, "stdout": "", "stdout_truncated": False}
+        except Exception:
+            # ワーカーの終了・大きすぎる結果・不正な結果. どれもワーカーが壊れているものとして扱う
+            logger.warning("Sandbox worker failed, replacing it", exc_info=True)
+            self.stats.crashes += 1
+            broken = True
+            result = {"status": "crashed", "exception": None, "stdout": "", "stdout_truncated": False}
+        result["elapsed_ms"] = (time.perf_counter() - started) * 1000
+
+        worker.runs += 1
+        if broken or result["status"] in ("timeout", "crashed") or worker.runs >= self.limits.max_runs:
+            # 状態が壊れている可能性のあるワーカーは新しいものと交換する
+            self._kill(worker)
+            self.stats.recycled += 1
+            worker = self._spawn()
+        return result, worker
+
+    def _spawn(self) -> _Worker:
+        """ワーカーを 1 つ起動 (空の環境変数で、API プロセスのメモリを引き継がない)."""
+        config = {"limits": asdict(self.limits), "uid": SANDBOX_UID, "gid": SANDBOX_GID}
+        parent_sock, child_sock = socket.socketpair()
+        with child_sock:
+            process = subprocess.Popen(  # noqa: S603 (引数は固定のスクリプトと設定のみ)
+                [sys.executable, "-I", str(_WORKER_SCRIPT), str(child_sock.fileno()), json.dumps(config)],
+                pass_fds=(child_sock.fileno(),),
+                env=_WORKER_ENV,
+                cwd="/",
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                start_new_session=True,
+            )
+        worker = _Worker(process=process, conn=Connection(parent_sock.detach()))
+        try:
+            ready = json.loads(worker.conn.recv_bytes(4096)) if worker.conn.poll(SPAWN_TIMEOUT) else None
+        except BaseException:
+            self._kill(worker)
+            raise
+        if not isinstance(ready, dict) or ready.get("ready") is not True:
+            self._kill(worker)
+            msg = "サンドボックスのワーカーが起動しませんでした"
+            raise RuntimeError(msg)
+        self._check_isolation(ready.get("isolation", []))
+        with self._lock:
+            self._workers.add(worker)
+        return worker
+
+    def _check_isolation(self, applied: list[str]) -> None:
+        """OS レベルの隔離が行えなかった場合に 1 回だけ警告する."""
+        missing = [name for name in _ISOLATION if name not in applied]
+        if missing and not self._warned_isolation:
+            self._warned_isolation = True
+            logger.warning(
+                "Sandbox workers run without OS isolation: %s (grant CAP_SYS_ADMIN or run as root to enable it)",
+                ", ".join(missing),
+            )
+
+    def _kill(self, worker: _Worker) -> None:
+        """ワーカーを終了 (実行中の子プロセスごとプロセスグループを kill する)."""
+        with self._lock:
+            self._workers.discard(worker)
+        worker.conn.close()
+        with contextlib.suppress(ProcessLookupError, PermissionError):
+            os.killpg(worker.process.pid, signal.SIGKILL)
+        try:
+            worker.process.wait(timeout=1)
+        except subprocess.TimeoutExpired:
+            logger.warning("Sandbox worker %d did not exit", worker.process.pid)
+
+
+_pool: SandboxPool | None = None
+
+
+def get_sandbox_pool() -> SandboxPool:
+    """プロセス共通のサンドボックスプールを取得 (サイズは SANDBOX_POOL_SIZE)."""
+    global _pool  # noqa: PLW0603
+
+    if _pool is None:
+        _pool = SandboxPool(size=max(1, int(os.getenv("SANDBOX_POOL_SIZE", "2"))))
+    return _pool
+
+
+def _collect_metrics() -> list[tuple[str, str, str, list[tuple[dict[str, str], float]]]]:
+    """/metrics 用のサンドボックスプールの値 (プールを作っていなければ何も返さない)."""
+    if _pool is None:
+        return []
+    stats = _pool.stats
+    return [
+        ("sandbox_workers", "gauge", "サンドボックスのワーカー数", [({}, _pool.size)]),
+        ("sandbox_idle_workers", "gauge", "待機中のサンドボックスワーカー数", [({}, _pool.idle_count())]),
+        ("sandbox_queue_waiting", "gauge", "ワーカーの空きを待っている実行の数", [({}, stats.waiting)]),
+        (
+            "sandbox_runs_total",
+            "counter",
+            "サンドボックスでの実行回数",
+            [({"status": status}, count) for status, count in sorted(stats.by_status.items())],
+        ),
+        ("sandbox_timeouts_total", "counter", "実行時間の上限で打ち切った回数", [({}, stats.timeouts)]),
+        ("sandbox_crashes_total", "counter", "ワーカーが異常終了した回数", [({}, stats.crashes)]),
+        ("sandbox_recycled_total", "counter", "ワーカーを入れ替えた回数", [({}, stats.recycled)]),
+    ]
+
+
+REGISTRY.add_collector(_collect_metrics)
+
+
+async def run_and_diagnose(code: str, stdin: str = "") -> dict[str, Any]:
+    """コードをサンドボックスで実行し、例外があればエラー解析にかける.
+
+    Args:
+        code: Python コード
+        stdin: 標準入力として渡す文字列
+
+    Returns:
+        実行結果と、例外が発生した場合はエラー解析結果
+    """
+    # サービスは初回のリクエスト時に読み込む (コールドスタートの短縮)
+    from .error_analyzer import analyze_error  # noqa: PLC0415
+
+    result = await get_sandbox_pool().run(code, stdin)
+    exception = result.get("exception")
+    result["error_message"] = None
+    result["diagnosis"] = None
+    if exception:
+        # 実際のトレースバックの最後のフレームと同じ形式にして解析に渡す
+        error_message = (
+            f'File "{STUDENT_FILENAME}", line {exception["line"]}\n{exception["type"]}: {exception["message"]}'
+        )
+        result["error_message"] = error_message
+        result["diagnosis"] = await analyze_error(code, error_message)
+    return result
@@ -0,0 +1,403 @@
+"""サンドボックスのワーカープロセス.
+
+API プロセスのモジュールやメモリを引き継がないよう、sandbox.py が空の環境変数と
+`python -I` でこのファイルを直接起動する (標準ライブラリだけを使い、パッケージ内の
+モジュールは読み込まない). ワーカーは親プロセスとのソケットで次のように動く.
+
+1. 授業でよく使うモジュールを読み込み、OS レベルの隔離をかける
+   - ネットワークとマウントの名前空間を分け (ネットワークなし)、ファイルシステムを読み取り専用にする
+   - root で起動された場合は権限のないユーザー (SANDBOX_UID / SANDBOX_GID) に切り替える
+   いずれもコンテナの権限で行えない場合は飛ばし、行えた隔離を準備完了の通知で親プロセスに伝える
+2. 実行の依頼ごとに自身を fork し、子プロセスで生徒のコードを 1 回だけ実行する.
+   生徒のコードが組み込み関数やモジュールを書き換えても、次の実行には残らない
+3. 子プロセスの結果を JSON で受け取り、大きさを確かめてから親プロセスに送る
+
+親プロセスとのやり取りは長さ付きの JSON (Connection.send_bytes / recv_bytes) で行い、
+pickle は使わない. 監査フックは多層防御の 1 つであり、隔離の境界は OS の機能で作る.
+"""
+
+import contextlib
+import ctypes
+import io
+import json
+import linecache
+import os
+import resource
+import signal
+import sys
+import time
+import traceback
+from collections.abc import Callable
+from multiprocessing.connection import Connection
+from typing import Any
+
+# トレースバック上で生徒のコードを示すファイル名
+STUDENT_FILENAME = "<student>"
+
+# 隔離をかける前に読み込んでおくモジュール (授業でよく使うもの)
+PRELOAD_MODULES = (
+    "collections",
+    "datetime",
+    "decimal",
+    "fractions",
+    "functools",
+    "itertools",
+    "json",
+    "math",
+    "random",
+    "re",
+    "statistics",
+    "string",
+)
+
+# 監査フックで拒否するイベント
+BLOCKED_AUDIT_EVENTS = frozenset(
+    {
+        "socket.__new__",
+        "socket.connect",
+        "socket.bind",
+        "socket.getaddrinfo",
+        "socket.gethostbyname",
+        "subprocess.Popen",
+        "os.system",
+        "os.exec",
+        "os.posix_spawn",
+        "os.spawn",
+        "os.fork",
+        "os.forkpty",
+        "os.kill",
+        "os.killpg",
+        "os.remove",
+        "os.rename",
+        "os.rmdir",
+        "os.mkdir",
+        "os.truncate",
+        "os.chmod",
+        "os.chown",
+        "os.chflags",
+        "os.link",
+        "os.symlink",
+        "os.utime",
+        "os.putenv",
+        "os.unsetenv",
+        "os.setxattr",
+        "os.removexattr",
+        "shutil.rmtree",
+        "ctypes.dlopen",
+        "ctypes.dlsym",
+        "ctypes.call_function",
+        # 監査フックの関数を探し出して書き換えられないようにする
+        "gc.get_objects",
+        "gc.get_referrers",
+        "gc.get_referents",
+    },
+)
+
+_WRITE_FLAGS = os.O_WRONLY | os.O_RDWR | os.O_APPEND | os.O_CREAT | os.O_TRUNC
+
+# 子プロセスから受け取る結果と、親プロセスから受け取る依頼の大きさの上限 (バイト)
+MAX_REQUEST_BYTES = 4 * 1024 * 1024
+
+# <sched.h> / <sys/mount.h> の定数 (Python からは参照できないため)
+_CLONE_NEWNS = 0x00020000
+_CLONE_NEWUSER = 0x10000000
+_CLONE_NEWNET = 0x40000000
+_MS_RDONLY = 1
+_MS_REMOUNT = 32
+_MS_BIND = 4096
+_MS_REC = 16384
+_MS_PRIVATE = 1 << 18
+# 読み取り専用にする際に引き継ぐマウントオプション (ユーザー名前空間では外せない)
+_MOUNT_FLAGS = {
+    "nosuid": 2,
+    "nodev": 4,
+    "noexec": 8,
+    "noatime": 1024,
+    "nodiratime": 2048,
+    "relatime": 1 << 21,
+    "strictatime": 1 << 24,
+}
+
+
+def max_result_bytes(max_output: int) -> int:
+    """結果の JSON の大きさの上限 (標準出力・メッセージ・トレースバックをそれぞれ max_output 文字まで).
+
+    JSON は ASCII でエンコードするため、1 文字は最大 12 バイト (サロゲートペアのエスケープ 2 つ) になる.
+    """
+    return 3 * 12 * max_output + 64 * 1024
+
+
+class _CpuLimitExceededError(BaseException):
+    """CPU 時間の上限に達した (生徒の except Exception で捕捉されないよう BaseException を継承)."""
+
+
+class _BoundedOutput(io.StringIO):
+    """上限を超えた出力を切り捨てる StringIO."""
+
+    def __init__(self, limit: int) -> None:
+        """コンストラクタ."""
+        super().__init__()
+        self.limit = limit
+        self.truncated = False
+
+    def write(self, s: str) -> int:
+        """上限までの出力を書き込む."""
+        remaining = self.limit - self.tell()
+        if remaining <= 0:
+            self.truncated = True
+            return len(s)
+        if len(s) > remaining:
+            self.truncated = True
+            super().write(s[:remaining])
+            return len(s)
+        return super().write(s)
+
+
+def _make_audit_hook(template_pid: int) -> Callable[[str, tuple], None]:
+    """ネットワーク・プロセス生成・ファイル書き込みを拒否する監査フックを作る.
+
+    拒否するイベントや関数はクロージャに閉じ込め、生徒のコードからモジュールの
+    グローバル変数を書き換えても方針が変わらないようにする. fork は生徒のコードを
+    実行しないテンプレートのプロセス (template_pid) にだけ許す.
+    """
+    blocked = BLOCKED_AUDIT_EVENTS
+    write_flags = _WRITE_FLAGS
+    getpid = os.getpid
+
+    def audit_hook(event: str, args: tuple) -> None:
+        if event == "os.fork" and getpid() == template_pid:
+            return
+        if event in blocked:
+            msg = f"この操作はサンドボックス内では使用できません ({event})"
+            raise PermissionError(msg)
+        if event == "open":
+            mode = args[1] if len(args) > 1 else None
+            flags = args[2] if len(args) > 2 else 0  # noqa: PLR2004
+            if (isinstance(mode, str) and any(c in mode for c in "wax+")) or (
+                isinstance(flags, int) and flags & write_flags
+            ):
+                msg = "サンドボックス内ではファイルに書き込めません"
+                raise PermissionError(msg)
+
+    return audit_hook
+
+
+def _remount_readonly(libc: ctypes.CDLL) -> bool:
+    """新しいマウント名前空間の中で、すべてのマウントを読み取り専用にする."""
+    if libc.mount(None, b"/", None, _MS_REC | _MS_PRIVATE, None) != 0:
+        return False
+    with open("/proc/self/mountinfo", "rb") as f:  # noqa: PTH123
+        lines = f.read().splitlines()
+    remounted = True
+    for line in lines:
+        fields = line.split()
+        # マウントポイントの空白などは 8 進数でエスケープされている
+        target = fields[4].decode("unicode_escape").encode("latin-1")
+        flags = _MS_REMOUNT | _MS_BIND | _MS_RDONLY
+        for option in fields[5].decode().split(","):
+            flags |= _MOUNT_FLAGS.get(option, 0)
+        if libc.mount(None, target, None, flags, None) != 0 and target == b"/":
+            remounted = False
+    return remounted
+
+
+def isolate(uid: int, gid: int) -> list[str]:
+    """OS レベルの隔離をかける (行えたものの名前のリストを返す).
+
+    - network: ネットワークの名前空間を分ける (ループバックも使えない)
+    - readonly_fs: マウントの名前空間を分け、ファイルシステムを読み取り専用にする
+    - uid: 権限のないユーザーに切り替える (root で起動された場合)
+    """
+    applied = []
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+    except OSError:
+        libc = None
+    if libc is not None:
+        flags = _CLONE_NEWNET | _CLONE_NEWNS
+        if os.geteuid() != 0:
+            # root でなければユーザー名前空間の中で分ける
+            flags |= _CLONE_NEWUSER
+        if libc.unshare(flags) == 0:
+            applied.append("network")
+            if _remount_readonly(libc):
+                applied.append("readonly_fs")
+    if os.geteuid() == 0:
+        try:
+            os.setgroups([])
+            os.setgid(gid)
+            os.setuid(uid)
+        except OSError:
+            pass
+        else:
+            applied.append("uid")
+    os.chdir("/")
+    return applied
+
+
+def apply_limits(limits: dict[str, Any]) -> None:
+    """テンプレートのプロセスに資源制限と監査フックをかける (子プロセスに引き継がれる)."""
+    memory = limits["memory_mb"] * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+    resource.setrlimit(resource.RLIMIT_FSIZE, (0, 0))
+    resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+    signal.signal(signal.SIGXFSZ, signal.SIG_IGN)
+
+    def _on_cpu_limit(signum: int, frame: object) -> None:  # noqa: ARG001
+        raise _CpuLimitExceededError
+
+    signal.signal(signal.SIGPROF, _on_cpu_limit)
+    sys.dont_write_bytecode = True
+    sys.addaudithook(_make_audit_hook(os.getpid()))
+
+
+def _limit_child(limits: dict[str, Any]) -> None:
+    """子プロセスだけにかける制限 (CPU 時間・プロセス生成・新しいファイルディスクリプタ)."""
+    # 1 回ごとの CPU 制限はタイマーで行い、RLIMIT_CPU は生徒のコードがタイマーの例外を握りつぶした場合の保険
+    cpu = int(limits["cpu_seconds"]) + 1
+    resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu + 1))
+    resource.setrlimit(resource.RLIMIT_NPROC, (0, 0))
+    # 現在使っているディスクリプタより大きな番号を開けないようにする
+    highest_fd = max(int(fd) for fd in os.listdir("/proc/self/fd")) if os.path.isdir("/proc/self/fd") else 16  # noqa: PTH112, PTH208
+    resource.setrlimit(resource.RLIMIT_NOFILE, (highest_fd + 1, highest_fd + 1))
+
+
+def _truncate(text: str, limit: int) -> str:
+    return text if len(text) <= limit else text[:limit] + "..."
+
+
+def _format_student_traceback(exc: BaseException) -> tuple[str, int]:
+    """生徒のコードのフレームだけを残したトレースバックと、エラー行を返す."""
+    te = traceback.TracebackException.from_exception(exc)
+    te.stack = traceback.StackSummary.from_list([f for f in te.stack if f.filename == STUDENT_FILENAME])
+    line = te.stack[-1].lineno if te.stack else 0
+    if isinstance(exc, SyntaxError):
+        line = exc.lineno or 0
+    return "".join(te.format()), line or 0
+
+
+def run_snippet(code: str, stdin: str, limits: dict[str, Any]) -> dict[str, Any]:
+    """コードを 1 回実行 (子プロセスの中で呼ぶ)."""
+    max_output = limits["max_output"]
+    stdout = _BoundedOutput(max_output)
+    linecache.cache[STUDENT_FILENAME] = (len(code), None, code.splitlines(keepends=True), STUDENT_FILENAME)
+    namespace: dict[str, Any] = {"__name__": "__main__"}
+    result: dict[str, Any] = {"status": "ok", "exception": None}
+
+    started = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stdout):
+            sys.stdin = io.StringIO(stdin)
+            signal.setitimer(signal.ITIMER_PROF, limits["cpu_seconds"])
+            try:
+                exec(compile(code, STUDENT_FILENAME, "exec"), namespace)  # noqa: S102
+            finally:
+                signal.setitimer(signal.ITIMER_PROF, 0)
+    except _CpuLimitExceededError:
+        result["status"] = "cpu_limit"
+    except MemoryError:
+        result["status"] = "memory_limit"
+        namespace.clear()
+    except BaseException as e:  # noqa: BLE001 (SystemExit なども生徒のコードの結果として扱う)
+        text, line = _format_student_traceback(e)
+        result["status"] = "error"
+        result["exception"] = {
+            "type": type(e).__name__,
+            "message": _truncate(str(e), max_output),
+            "line": line,
+            "traceback": _truncate(text, max_output),
+        }
+
+    result["elapsed_ms"] = (time.perf_counter() - started) * 1000
+    result["stdout"] = stdout.getvalue()
+    result["stdout_truncated"] = stdout.truncated
+    return result
+
+
+def _child_main(conn: Connection, write_fd: int, code: str, stdin: str, limits: dict[str, Any]) -> None:
+    """子プロセス: 親プロセスとのソケットを閉じてからコードを実行し、結果をパイプに書く."""
+    conn.close()
+    _limit_child(limits)
+    try:
+        result = run_snippet(code, stdin, limits)
+        data = json.dumps(result).encode()
+    except BaseException:  # noqa: BLE001 (結果を作れなければ異常終了として扱う)
+        data = b""
+    view = memoryview(data)
+    while view:
+        view = view[os.write(write_fd, view) :]
+
+
+def _status_result(status: str) -> bytes:
+    return json.dumps({"status": status, "exception": None, "stdout": "", "stdout_truncated": False}).encode()
+
+
+def run_in_child(conn: Connection, code: str, stdin: str, limits: dict[str, Any]) -> bytes:
+    """子プロセスを fork してコードを実行し、結果の JSON を返す."""
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        status = 1
+        try:
+            os.close(read_fd)
+            _child_main(conn, write_fd, code, stdin, limits)
+            status = 0
+        finally:
+            os._exit(status)
+
+    os.close(write_fd)
+    limit = max_result_bytes(limits["max_output"])
+    chunks = []
+    size = 0
+    try:
+        while chunk := os.read(read_fd, 65536):
+            size += len(chunk)
+            if size > limit:
+                os.kill(pid, signal.SIGKILL)
+                break
+            chunks.append(chunk)
+    finally:
+        os.close(read_fd)
+    _, wait_status = os.waitpid(pid, 0)
+    if size > limit:
+        return _status_result("crashed")
+    if os.WIFSIGNALED(wait_status) and os.WTERMSIG(wait_status) == signal.SIGXCPU:
+        return _status_result("cpu_limit")
+    if not os.WIFEXITED(wait_status) or os.WEXITSTATUS(wait_status) != 0 or not chunks:
+        return _status_result("crashed")
+    return b"".join(chunks)
+
+
+def _warm_up() -> None:
+    """トレースバックの整形が遅延して読み込むモジュール (tokenize など) を隔離の前に読み込んでおく."""
+    for source in ("undefined_name", "if True\n    pass"):
+        linecache.cache[STUDENT_FILENAME] = (len(source), None, source.splitlines(keepends=True), STUDENT_FILENAME)
+        try:
+            exec(compile(source, STUDENT_FILENAME, "exec"), {})  # noqa: S102
+        except (NameError, SyntaxError) as e:
+            _format_student_traceback(e)
+    linecache.cache.pop(STUDENT_FILENAME, None)
+
+
+def main() -> None:
+    """ワーカープロセスのメインループ (引数: ソケットのファイルディスクリプタ、設定の JSON)."""
+    conn = Connection(int(sys.argv[1]))
+    config = json.loads(sys.argv[2])
+    limits = config["limits"]
+    for name in PRELOAD_MODULES:
+        __import__(name)
+    _warm_up()
+    isolation = isolate(config["uid"], config["gid"])
+    apply_limits(limits)
+    # 準備完了を親プロセスに通知 (ここまで終わったワーカーだけが実行を受け付ける)
+    conn.send_bytes(json.dumps({"ready": True, "isolation": isolation}).encode())
+    while True:
+        try:
+            request = json.loads(conn.recv_bytes(MAX_REQUEST_BYTES))
+        except (EOFError, OSError):
+            break
+        conn.send_bytes(run_in_child(conn, request["code"], request["stdin"], limits))
+
+
+if __name__ == "__main__":
+    main()
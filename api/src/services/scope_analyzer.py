@@ -0,0 +1,93 @@
+"""スコープ解析サービス.
+
+C で実装された symtable モジュールでシンボルテーブルを 1 回だけ構築し、
+スコープ (モジュール・関数・クラス・内包表記・ラムダ) ごとの定義済み名、自由変数、未定義名を求める.
+import、for の変数、内包表記の変数、with ... as、except ... as、global 宣言もすべて扱える.
+"""
+
+import builtins
+import symtable
+from typing import Any
+
+from .deadline import CHECK_INTERVAL, check_deadline
+
+_BUILTIN_NAMES = frozenset(dir(builtins))
+
+
+def _is_defined(symbol: symtable.Symbol) -> bool:
+    """そのスコープで定義されている名前か (代入・import・引数・関数/クラス定義)."""
+    return symbol.is_local() and not symbol.get_name().startswith(".")
+
+
+def analyze_scopes(code: str) -> dict[str, Any]:
+    """コードのスコープを解析.
+
+    Args:
+        code: Pythonコード
+
+    Returns:
+        スコープごとの解析結果と、コード全体の定義済み名・未定義名
+
+    Raises:
+        SyntaxError: コードに構文エラーがある場合
+    """
+    top = symtable.symtable(code, "<string>", "exec")
+
+    # symtable の表を 1 回だけたどり、各スコープのシンボルを取り出す
+    tables: list[symtable.SymbolTable] = []
+    pending = [top]
+    while pending:
+        table = pending.pop()
+        tables.append(table)
+        pending.extend(reversed(table.get_children()))
+
+    # モジュールのグローバル名 (モジュールで定義された名前と、関数内で global 宣言して代入した名前)
+    module_globals = {symbol.get_name() for symbol in top.get_symbols() if _is_defined(symbol)}
+    for index, table in enumerate(tables):
+        if index % CHECK_INTERVAL == 0:
+            check_deadline()
+        module_globals.update(
+            symbol.get_name() for symbol in table.get_symbols() if symbol.is_declared_global() and symbol.is_assigned()
+        )
+
+    scopes = []
+    defined: set[str] = set()
+    undefined: list[str] = []
+    for index, table in enumerate(tables):
+        if index % CHECK_INTERVAL == 0:
+            check_deadline()
+        scope_defined = []
+        scope_free = []
+        scope_undefined = []
+        for symbol in table.get_symbols():
+            name = symbol.get_name()
+            if _is_defined(symbol):
+                scope_defined.append(name)
+            elif symbol.is_free():
+                scope_free.append(name)
+            elif (
+                symbol.is_referenced()
+                and symbol.is_global()
+                and name not in module_globals
+                and name not in _BUILTIN_NAMES
+            ):
+                scope_undefined.append(name)
+
+        defined.update(scope_defined)
+        undefined.extend(name for name in scope_undefined if name not in undefined)
+        scopes.append(
+            {
+                "name": table.get_name(),
+                "type": str(table.get_type()).lower().rsplit(".", 1)[-1],
+                "line": table.get_lineno(),
+                "defined": sorted(scope_defined),
+                "free": sorted(scope_free),
+                "undefined": sorted(scope_undefined),
+            },
+        )
+
+    return {
+        "scopes": scopes,
+        "defined": sorted(defined | module_globals),
+        "undefined": undefined,
+    }
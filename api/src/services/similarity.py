@@ -0,0 +1,486 @@
+"""提出コードの類似度 (コピーの検出).
+
+クラスの中や年度をまたいで、ほとんど同じコードの提出を見つける. 提出どうしを総当たりで
+比べる代わりに、次の手順で似ている可能性のある提出だけを索引から取り出す.
+
+1. 正規化: AST を前順にたどり、ノードの種類の列にする. 識別子 (変数名・関数名・属性名) と
+   リテラルの値は捨てる (リテラルは型だけ残す) ため、名前の付け替えや値の書き換えでは変わらない
+2. フィンガープリント: 列の k-gram のハッシュから winnowing で代表を選ぶ (Schleimer ら, 2003).
+   一部を並べ替えたり書き足したりしても、共通する部分のフィンガープリントは残る
+3. MinHash: フィンガープリントの集合を NUM_PERM 個の最小ハッシュ値 (署名) に縮める.
+   2 つの署名で値が一致する割合が、フィンガープリントの集合の Jaccard 係数の推定値になる
+4. LSH: 署名を BANDS 個の帯に分け、帯ごとのハッシュを SQLite の索引に入れる. 帯が 1 つでも一致した
+   提出だけを候補にするため、数万件を登録していても索引を BANDS 回引くだけで候補が見つかる
+
+署名は SIMILARITY_DB_PATH の SQLite に保存する (未設定の場合はワーカーごとのメモリ上に置き、再起動で消える.
+マルチワーカーでは索引を共有するため設定が必要).
+numpy があれば MinHash の計算に使う (どちらでも同じ署名になる).
+"""
+
+import ast
+import hashlib
+import itertools
+import logging
+import os
+import random
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+from .deadline import CHECK_INTERVAL, check_deadline
+from .parsing import ParsedCode
+
+try:
+    import numpy as np
+except ImportError:  # numpy は任意の依存関係 (なければ Python で計算する)
+    np = None
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = os.getenv("SIMILARITY_DB_PATH", "")
+
+# 以下の値を変えると保存済みの署名と比べられなくなる (変えた場合は索引を作り直す)
+# k-gram のトークン数と、winnowing の窓の大きさ (k-gram の数)
+KGRAM = 10
+WINDOW = 6
+# 署名の長さと、LSH の帯の数 (1 つの帯は NUM_PERM / BANDS 個の値)
+NUM_PERM = 128
+BANDS = 32
+ROWS = NUM_PERM // BANDS
+_SEED = 2026
+
+# フィンガープリントがこれより少ない短いコードは索引に入れない (定型の短いコードどうしが一致しすぎるため)
+MIN_FINGERPRINTS = 5
+# 似ているとみなす Jaccard 係数 (推定値) の既定値
+DEFAULT_THRESHOLD = 0.6
+
+# MinHash のハッシュ関数 (a * x + b) mod P. x は 32 ビットのため、a * x + b は 64 ビットに収まる
+_PRIME = (1 << 31) - 1
+_random = random.Random(_SEED)  # noqa: S311 (暗号用途ではない)
+_HASH_A = [_random.randrange(1, _PRIME) for _ in range(NUM_PERM)]
+_HASH_B = [_random.randrange(0, _PRIME) for _ in range(NUM_PERM)]
+if np is not None:
+    _HASH_A_ARRAY = np.array(_HASH_A, dtype=np.uint64)[:, None]
+    _HASH_B_ARRAY = np.array(_HASH_B, dtype=np.uint64)[:, None]
+
+_SIGNATURE_FORMAT = f"<{NUM_PERM}I"
+_ROWS_FORMAT = f"<{ROWS}I"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS submissions (
+    id TEXT PRIMARY KEY,
+    class_id TEXT,
+    label TEXT,
+    fingerprints INTEGER NOT NULL,
+    signature BLOB NOT NULL,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS submissions_class ON submissions (class_id);
+CREATE TABLE IF NOT EXISTS buckets (
+    band INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    submission_id TEXT NOT NULL,
+    PRIMARY KEY (band, bucket, submission_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS buckets_submission ON buckets (submission_id);
+"""
+
+
+@dataclass(frozen=True)
+class Fingerprint:
+    """1 つのコードのフィンガープリント.
+
+    Attributes:
+        tokens: 正規化したトークンの数
+        fingerprints: winnowing で選んだ k-gram のハッシュの数
+        signature: MinHash の署名 (NUM_PERM 個の値)
+    """
+
+    tokens: int
+    fingerprints: int
+    signature: tuple[int, ...]
+
+    @property
+    def indexable(self) -> bool:
+        """索引に入れられる長さのコードか."""
+        return self.fingerprints >= MIN_FINGERPRINTS
+
+
+def normalized_tokens(tree: ast.AST) -> list[str]:
+    """AST を前順にたどり、識別子とリテラルの値を捨てたノードの種類の列にする."""
+    tokens = []
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, ast.expr_context):
+            continue
+        if len(tokens) % CHECK_INTERVAL == 0:
+            check_deadline()
+        if isinstance(node, ast.Constant):
+            tokens.append(f"Constant:{type(node.value).__name__}")
+        else:
+            tokens.append(type(node).__name__)
+        stack.extend(reversed(list(ast.iter_child_nodes(node))))
+    return tokens
+
+
+def kgram_hashes(tokens: list[str], k: int = KGRAM) -> list[int]:
+    """トークン列の k-gram ごとの 32 ビットのハッシュ."""
+    if not tokens:
+        return []
+    encoded = struct.pack(f"<{len(tokens)}I", *(zlib.crc32(token.encode()) for token in tokens))
+    if len(tokens) < k:
+        return [zlib.crc32(encoded)]
+    return [zlib.crc32(encoded[i * 4 : (i + k) * 4]) for i in range(len(tokens) - k + 1)]
+
+
+def winnow(hashes: list[int], window: int = WINDOW) -> set[int]:
+    """ハッシュの代表を winnowing で選ぶ.
+
+    連続する window 個のハッシュごとに最小値 (同じ値なら右端) を選ぶ. window + k - 1 トークン以上
+    一致する部分は、必ず共通のフィンガープリントを持つ.
+    """
+    if len(hashes) <= window:
+        return {min(hashes)} if hashes else set()
+    selected = set()
+    last = -1
+    for start in range(len(hashes) - window + 1):
+        chunk = hashes[start : start + window]
+        smallest = min(chunk)
+        position = start + window - 1 - chunk[::-1].index(smallest)
+        if position != last:
+            selected.add(smallest)
+            last = position
+    return selected
+
+
+def minhash(fingerprints: set[int]) -> tuple[int, ...]:
+    """フィンガープリントの集合の MinHash 署名."""
+    if not fingerprints:
+        return (_PRIME,) * NUM_PERM
+    if np is not None:
+        values = np.fromiter(fingerprints, dtype=np.uint64, count=len(fingerprints))[None, :]
+        return tuple(int(value) for value in ((_HASH_A_ARRAY * values + _HASH_B_ARRAY) % _PRIME).min(axis=1))
+    return tuple(min((a * x + b) % _PRIME for x in fingerprints) for a, b in zip(_HASH_A, _HASH_B, strict=True))
+
+
+def fingerprint(code: str | ParsedCode) -> Fingerprint:
+    """コードのフィンガープリントを作る.
+
+    Raises:
+        SyntaxError: コードに構文エラーがある場合
+    """
+    parsed = code if isinstance(code, ParsedCode) else ParsedCode(code)
+    tokens = normalized_tokens(parsed.tree())
+    selected = winnow(kgram_hashes(tokens))
+    return Fingerprint(tokens=len(tokens), fingerprints=len(selected), signature=minhash(selected))
+
+
+def estimate_similarity(first: tuple[int, ...], second: tuple[int, ...]) -> float:
+    """2 つの署名から Jaccard 係数を推定."""
+    return sum(1 for a, b in zip(first, second, strict=True) if a == b) / NUM_PERM
+
+
+def band_buckets(signature: tuple[int, ...]) -> list[int]:
+    """署名の帯ごとのハッシュ (LSH のバケット)."""
+    buckets = []
+    for band in range(BANDS):
+        rows = struct.pack(_ROWS_FORMAT, *signature[band * ROWS : (band + 1) * ROWS])
+        digest = hashlib.blake2b(rows, digest_size=8).digest()
+        buckets.append(int.from_bytes(digest, "little", signed=True))
+    return buckets
+
+
+def _encode_signature(signature: tuple[int, ...]) -> bytes:
+    return struct.pack(_SIGNATURE_FORMAT, *signature)
+
+
+def _decode_signature(data: bytes) -> tuple[int, ...]:
+    return struct.unpack(_SIGNATURE_FORMAT, data)
+
+
+class SimilarityIndex:
+    """MinHash 署名の LSH 索引 (SQLite)."""
+
+    def __init__(self, path: Path | str = ":memory:") -> None:
+        """コンストラクタ.
+
+        Args:
+            path: SQLite のファイルのパス (":memory:" でメモリ上に置く)
+        """
+        self.path = str(path)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False, isolation_level=None)
+        if self.path != ":memory:":
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(_SCHEMA)
+
+    def add(
+        self,
+        submission_id: str,
+        fp: Fingerprint,
+        *,
+        class_id: str | None = None,
+        label: str | None = None,
+    ) -> bool:
+        """提出を登録 (同じ ID の提出は置き換える).
+
+        Returns:
+            索引に入れたか (短すぎるコードは入れない)
+        """
+        if not fp.indexable:
+            self.remove(submission_id)
+            return False
+        buckets = [(band, bucket, submission_id) for band, bucket in enumerate(band_buckets(fp.signature))]
+        with self._lock, self._connection:
+            self._connection.execute("BEGIN")
+            self._connection.execute("DELETE FROM buckets WHERE submission_id = ?", (submission_id,))
+            self._connection.execute(
+                "INSERT OR REPLACE INTO submissions (id, class_id, label, fingerprints, signature, created)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (submission_id, class_id, label, fp.fingerprints, _encode_signature(fp.signature), time.time()),
+            )
+            self._connection.executemany("INSERT INTO buckets (band, bucket, submission_id) VALUES (?, ?, ?)", buckets)
+        return True
+
+    def remove(self, submission_id: str) -> bool:
+        """提出を削除.
+
+        Returns:
+            削除したか (登録されていなければ False)
+        """
+        with self._lock, self._connection:
+            self._connection.execute("BEGIN")
+            self._connection.execute("DELETE FROM buckets WHERE submission_id = ?", (submission_id,))
+            removed = self._connection.execute("DELETE FROM submissions WHERE id = ?", (submission_id,)).rowcount
+        return removed > 0
+
+    def count(self, class_id: str | None = None) -> int:
+        """登録している提出の数 (class_id を指定した場合はそのクラスの数)."""
+        with self._lock:
+            if class_id is None:
+                return self._connection.execute("SELECT COUNT(*) FROM submissions").fetchone()[0]
+            return self._connection.execute(
+                "SELECT COUNT(*) FROM submissions WHERE class_id = ?",
+                (class_id,),
+            ).fetchone()[0]
+
+    def query(
+        self,
+        fp: Fingerprint,
+        *,
+        threshold: float = DEFAULT_THRESHOLD,
+        limit: int = 10,
+        class_id: str | None = None,
+        exclude: str | None = None,
+    ) -> list[dict[str, Any]]:
+        """似ている提出を探す.
+
+        Args:
+            fp: 探すコードのフィンガープリント
+            threshold: 似ているとみなす類似度 (Jaccard 係数の推定値)
+            limit: 返す件数
+            class_id: 指定した場合はそのクラスの提出だけを探す
+            exclude: 除く提出の ID (登録済みの提出自身など)
+
+        Returns:
+            類似度の高い順の提出 (submission_id, class_id, label, similarity)
+        """
+        if not fp.indexable:
+            return []
+        with self._lock:
+            candidates: set[str] = set()
+            for band, bucket in enumerate(band_buckets(fp.signature)):
+                rows = self._connection.execute(
+                    "SELECT submission_id FROM buckets WHERE band = ? AND bucket = ?",
+                    (band, bucket),
+                )
+                candidates.update(row[0] for row in rows)
+            candidates.discard(exclude)  # type: ignore[arg-type]
+            records = self._fetch(candidates)
+
+        matches = []
+        for submission_id, record_class, label, signature in records:
+            if class_id is not None and record_class != class_id:
+                continue
+            similarity = estimate_similarity(fp.signature, signature)
+            if similarity >= threshold:
+                matches.append(
+                    {
+                        "submission_id": submission_id,
+                        "class_id": record_class,
+                        "label": label,
+                        "similarity": similarity,
+                    },
+                )
+        matches.sort(key=lambda match: (-match["similarity"], match["submission_id"]))
+        return matches[:limit]
+
+    def pairs(self, class_id: str, *, threshold: float = DEFAULT_THRESHOLD, limit: int = 100) -> list[dict[str, Any]]:
+        """クラスの中で似ている提出の組を探す.
+
+        同じバケットに入った提出の組だけを比べるため、クラスの全組み合わせは比べない.
+
+        Returns:
+            類似度の高い順の組 (first_id, second_id, first_label, second_label, similarity)
+        """
+        with self._lock:
+            groups = self._connection.execute(
+                "SELECT group_concat(b.submission_id, char(31)) FROM buckets AS b"
+                " JOIN submissions AS s ON s.id = b.submission_id"
+                " WHERE s.class_id = ? GROUP BY b.band, b.bucket HAVING COUNT(*) > 1",
+                (class_id,),
+            ).fetchall()
+            candidates: set[tuple[str, str]] = set()
+            for (members,) in groups:
+                candidates.update(itertools.combinations(sorted(members.split("\x1f")), 2))
+            records = {row[0]: row for row in self._fetch({member for pair in candidates for member in pair})}
+
+        pairs = []
+        for first, second in candidates:
+            similarity = estimate_similarity(records[first][3], records[second][3])
+            if similarity >= threshold:
+                pairs.append(
+                    {
+                        "first_id": first,
+                        "second_id": second,
+                        "first_label": records[first][2],
+                        "second_label": records[second][2],
+                        "similarity": similarity,
+                    },
+                )
+        pairs.sort(key=lambda pair: (-pair["similarity"], pair["first_id"], pair["second_id"]))
+        return pairs[:limit]
+
+    def _fetch(self, submission_ids: set[str]) -> list[tuple[str, str | None, str | None, tuple[int, ...]]]:
+        """提出の ID・クラス・ラベル・署名を取得 (ロックを取ってから呼ぶ)."""
+        ids = sorted(submission_ids)
+        records = []
+        # SQLite のプレースホルダーの数の上限を超えないよう分けて取得する
+        for start in range(0, len(ids), 500):
+            chunk = ids[start : start + 500]
+            rows = self._connection.execute(
+                f"SELECT id, class_id, label, signature FROM submissions WHERE id IN ({','.join('?' * len(chunk))})",  # noqa: S608
+                chunk,
+            )
+            records.extend((row[0], row[1], row[2], _decode_signature(row[3])) for row in rows)
+        return records
+
+    def close(self) -> None:
+        """索引を閉じる."""
+        with self._lock:
+            self._connection.close()
+
+
+_index: SimilarityIndex | None = None
+_index_lock = threading.Lock()
+
+
+def get_similarity_index() -> SimilarityIndex:
+    """プロセス共通の類似度の索引を取得 (SIMILARITY_DB_PATH が開けない場合はメモリ上に置く)."""
+    global _index  # noqa: PLW0603
+
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                try:
+                    _index = SimilarityIndex(DB_PATH or ":memory:")
+                except (OSError, sqlite3.Error):
+                    logger.warning("Cannot open similarity index at %s, using memory", DB_PATH, exc_info=True)
+                    _index = SimilarityIndex()
+                logger.info("Similarity index opened at %s", _index.path)
+    return _index
+
+
+def close_similarity_index() -> None:
+    """類似度の索引を閉じる (終了時に呼ぶ)."""
+    global _index  # noqa: PLW0603
+
+    with _index_lock:
+        if _index is not None:
+            _index.close()
+            _index = None
+
+
+def _fingerprint_or_error(code: str) -> tuple[Fingerprint | None, dict[str, Any] | None]:
+    """フィンガープリントを作る (構文エラーの場合は解析と同じ形のエラーを返す)."""
+    try:
+        return fingerprint(code), None
+    except SyntaxError as e:
+        return None, {"success": False, "error": "syntax_error", "message": str(e), "line": e.lineno}
+
+
+def register_submission(  # noqa: PLR0913
+    submission_id: str,
+    code: str,
+    *,
+    class_id: str | None = None,
+    label: str | None = None,
+    threshold: float = DEFAULT_THRESHOLD,
+    limit: int = 10,
+) -> dict[str, Any]:
+    """提出を登録し、登録済みの提出から似ているものを探す.
+
+    Args:
+        submission_id: 提出の ID (同じ ID で登録し直すと置き換える)
+        code: Python コード
+        class_id: クラスの ID
+        label: 表示用の名前 (生徒名・年度など)
+        threshold: 似ているとみなす類似度
+        limit: 返す件数
+
+    Returns:
+        登録結果と、似ている提出 (matches)
+    """
+    fp, error = _fingerprint_or_error(code)
+    if fp is None:
+        return {"submission_id": submission_id, **error}  # type: ignore[dict-item]
+    index = get_similarity_index()
+    matches = index.query(fp, threshold=threshold, limit=limit, exclude=submission_id)
+    indexed = index.add(submission_id, fp, class_id=class_id, label=label)
+    return {
+        "success": True,
+        "submission_id": submission_id,
+        "indexed": indexed,
+        "fingerprints": fp.fingerprints,
+        "matches": matches,
+        "total_submissions": index.count(),
+    }
+
+
+def find_similar(
+    code: str,
+    *,
+    class_id: str | None = None,
+    threshold: float = DEFAULT_THRESHOLD,
+    limit: int = 10,
+) -> dict[str, Any]:
+    """登録せずに、登録済みの提出から似ているものを探す."""
+    fp, error = _fingerprint_or_error(code)
+    if fp is None:
+        return error  # type: ignore[return-value]
+    index = get_similarity_index()
+    return {
+        "success": True,
+        "indexed": False,
+        "fingerprints": fp.fingerprints,
+        "matches": index.query(fp, threshold=threshold, limit=limit, class_id=class_id),
+        "total_submissions": index.count(),
+    }
+
+
+def find_class_pairs(class_id: str, *, threshold: float = DEFAULT_THRESHOLD, limit: int = 100) -> dict[str, Any]:
+    """クラスの中で似ている提出の組を探す."""
+    index = get_similarity_index()
+    return {
+        "class_id": class_id,
+        "submissions": index.count(class_id),
+        "threshold": threshold,
+        "pairs": index.pairs(class_id, threshold=threshold, limit=limit),
+    }
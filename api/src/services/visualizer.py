@@ -4,6 +4,10 @@
 
 import ast
 
+from .deadline import CHECK_INTERVAL, check_deadline
+from .metrics import stage
+from .parsing import ParsedCode
+
 
 class ExecutionFlowSimulator(ast.NodeVisitor):
     """静的解析による実行フローのシミュレーション"""
@@ -16,7 +20,9 @@ class ExecutionFlowSimulator(ast.NodeVisitor):
         self.branch_stack = []
 
     def add_step(self, line: int, operation: str, description: str, variables: dict | None = None) -> None:
-        """実行ステップを追加."""
+        """実行ステップを追加 (一定数ごとに締め切りを確認する)."""
+        if self.current_step % CHECK_INTERVAL == 0:
+            check_deadline()
         step = {
             "step": self.current_step,
             "line": line,
@@ -497,7 +503,9 @@ def create_flowchart_svg(steps: list[dict], edges: list[dict], highlight_line: i
                     )
 
     # ノードを描画
-    for step in steps:
+    for index, step in enumerate(steps):
+        if index % CHECK_INTERVAL == 0:
+            check_deadline()
         pos = node_positions[step["step"]]
         x = pos["x"] - node_width // 2
         y = pos["y"] - node_height // 2
@@ -529,24 +537,32 @@ def create_flowchart_svg(steps: list[dict], edges: list[dict], highlight_line: i
     return "\n".join(svg_parts)
 
 
-def visualize_code(code: str, *, highlight_line: int = 0, show_flow: bool = True) -> dict:
+def visualize_code(
+    code: str,
+    *,
+    highlight_line: int = 0,
+    show_flow: bool = True,
+    parsed: ParsedCode | None = None,
+) -> dict:
     """コードを可視化.
 
     Args:
         code: Pythonコード
         highlight_line: ハイライトする行
         show_flow: フロー図を生成するか
+        parsed: パース済みのコード (ほかのサービスと AST を共有する場合)
 
     Returns:
         可視化結果
     """
     try:
         # ASTを解析
-        tree = ast.parse(code)
+        tree = (parsed or ParsedCode(code)).tree()
 
         # 実行フローをシミュレート
         simulator = ExecutionFlowSimulator()
-        simulator.visit(tree)
+        with stage("simulation"):
+            simulator.visit(tree)
 
         result = {
             "success": True,
@@ -557,11 +573,12 @@ def visualize_code(code: str, *, highlight_line: int = 0, show_flow: bool = True
 
         # フローチャートを生成
         if show_flow and simulator.steps:
-            result["flowchart"] = create_flowchart_svg(
-                simulator.steps,
-                simulator.flow_edges,
-                highlight_line,
-            )
+            with stage("svg_render"):
+                result["flowchart"] = create_flowchart_svg(
+                    simulator.steps,
+                    simulator.flow_edges,
+                    highlight_line,
+                )
 
         # 実行ステップの説明を生成
         explanations = []
@@ -0,0 +1,77 @@
+"""共有キャッシュ (SharedResultCache) のテスト."""
+
+import os
+import struct
+from collections.abc import Iterator
+from pathlib import Path
+
+import pytest
+
+from src.services import cache
+from src.services.cache import SharedResultCache, cache_key
+
+
+@pytest.fixture
+def shared(tmp_path: Path) -> Iterator[SharedResultCache]:
+    """一時ファイル上の小さなキャッシュ."""
+    result_cache = SharedResultCache(tmp_path / "cache.bin", slots=8, slot_size=4096)
+    yield result_cache
+    result_cache.close()
+
+
+def test_round_trip(shared: SharedResultCache) -> None:
+    """保存した本文をそのまま取得できる."""
+    key = cache_key("analyze", {"code": "print(1)"})
+    assert shared.get(key) is None
+    assert shared.set(key, b'{"ok":true}')
+    assert shared.get(key) == b'{"ok":true}'
+
+
+def test_round_trip_compressed(shared: SharedResultCache) -> None:
+    """圧縮して保存した大きな本文も元のまま取得できる."""
+    key = cache_key("analyze", {"code": "x = 1\n" * 1000})
+    value = b"a" * (shared.capacity * 4)
+    assert shared.set(key, value)
+    assert shared.get(key) == value
+
+
+def test_shared_between_instances(tmp_path: Path) -> None:
+    """同じファイルを開いたほかのインスタンス (ほかのワーカー) からも取得できる."""
+    path = tmp_path / "cache.bin"
+    writer = SharedResultCache(path, slots=8, slot_size=4096)
+    reader = SharedResultCache(path, slots=8, slot_size=4096)
+    try:
+        key = cache_key("visualize", {"code": "print(1)"})
+        assert writer.set(key, b"[]")
+        assert reader.get(key) == b"[]"
+    finally:
+        writer.close()
+        reader.close()
+
+
+def test_oversized_value_is_rejected(shared: SharedResultCache) -> None:
+    """圧縮してもスロットに収まらない本文は保存しない."""
+    key = cache_key("analyze", {"code": "print(1)"})
+    value = os.urandom(shared.capacity * 2)
+    assert not shared.set(key, value)
+    assert shared.get(key) is None
+
+
+def test_other_analyzer_version_misses(shared: SharedResultCache, monkeypatch: pytest.MonkeyPatch) -> None:
+    """解析ロジックのバージョンが変わると、以前の結果はヒットしない."""
+    params = {"code": "print(1)"}
+    assert shared.set(cache_key("analyze", params), b"old")
+    monkeypatch.setattr(cache, "ANALYZER_VERSION", cache.ANALYZER_VERSION + "-next")
+    assert shared.get(cache_key("analyze", params)) is None
+
+
+def test_torn_read_returns_none(shared: SharedResultCache) -> None:
+    """シーケンス番号が奇数 (書き込み中) のスロットはミスとして扱う."""
+    key = cache_key("analyze", {"code": "print(1)"})
+    assert shared.set(key, b"value")
+    offset = shared._offset(key)
+    seq = struct.unpack_from("<Q", shared._mm, offset)[0]
+    struct.pack_into("<Q", shared._mm, offset, seq | 1)
+    assert shared.get(key) is None
+    struct.pack_into("<Q", shared._mm, offset, (seq | 1) + 1)
+    assert shared.get(key) == b"value"
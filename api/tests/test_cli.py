@@ -0,0 +1,55 @@
+"""一括解析のコマンドライン (cli.py) のテスト."""
+
+from pathlib import Path
+from typing import Any
+
+import pytest
+from pydantic_core import from_json
+
+from src import cli
+
+FILES = 12
+INTERRUPT_AFTER = 5
+
+
+@pytest.fixture
+def submissions(tmp_path: Path) -> Path:
+    """提出ファイルのディレクトリ."""
+    root = tmp_path / "submissions"
+    root.mkdir()
+    for i in range(FILES):
+        (root / f"s{i:02}.py").write_text(f"x = {i}\nprint(x)\n")
+    return root
+
+
+def test_resume_after_interrupt(submissions: Path, tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """中断して書きかけの行が残っても、--resume で各ファイルをちょうど 1 回ずつ出力する."""
+    output = tmp_path / "results.jsonl"
+    checkpoint = tmp_path / "results.jsonl.checkpoint"
+    args = [str(submissions), "-o", str(output), "--workers", "1", "--chunk-size", "1"]
+
+    write = cli.BatchRunner._write
+
+    def interrupting_write(self: cli.BatchRunner, record: dict[str, Any]) -> None:
+        if self.summary.processed == INTERRUPT_AFTER:
+            raise KeyboardInterrupt
+        write(self, record)
+
+    monkeypatch.setattr(cli.BatchRunner, "_write", interrupting_write)
+    assert cli.main(args) == 130
+    monkeypatch.setattr(cli.BatchRunner, "_write", write)
+
+    assert len(output.read_bytes().splitlines()) == INTERRUPT_AFTER
+    assert len(checkpoint.read_bytes().splitlines()) == INTERRUPT_AFTER
+    # 行の途中で止まった書き込み
+    with output.open("ab") as file:
+        file.write(b'{"id":"half-written","sha')
+    with checkpoint.open("ab") as file:
+        file.write(b'{"id":"half-written","off')
+
+    assert cli.main([*args, "--resume"]) == 0
+
+    ids = [from_json(line)["id"] for line in output.read_bytes().splitlines()]
+    assert sorted(ids) == sorted(str(path) for path in submissions.glob("*.py"))
+    checkpoint_ids = [from_json(line)["id"] for line in checkpoint.read_bytes().splitlines()]
+    assert sorted(checkpoint_ids) == sorted(ids)
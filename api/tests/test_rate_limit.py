@@ -0,0 +1,126 @@
+"""レート制限と同時実行数の制御 (middleware/rate_limit.py) のテスト."""
+
+import httpx
+import pytest
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+
+from src.middleware import rate_limit
+from src.middleware.rate_limit import AdmissionController, RateLimitMiddleware, TokenBucketLimiter, _reject
+
+
+def test_burst_then_limited() -> None:
+    """トークンが burst 個あるうちは続けて受け付け、その次は 1 個貯まるまでの秒数を返す."""
+    limiter = TokenBucketLimiter(per_minute=60, burst=3, max_clients=10)
+    assert [limiter.acquire("a", now=0.0) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert limiter.acquire("a", now=0.0) == pytest.approx(1.0)
+
+
+def test_refill() -> None:
+    """トークンは 1 秒あたり per_minute / 60 個ずつ貯まる."""
+    limiter = TokenBucketLimiter(per_minute=30, burst=1, max_clients=10)
+    assert limiter.acquire("a", now=0.0) == 0.0
+    # 0.5 個/秒なので、1 秒後には 0.5 個. 残りの 0.5 個は 1 秒後に貯まる
+    assert limiter.acquire("a", now=1.0) == pytest.approx(1.0)
+    assert limiter.acquire("a", now=2.0) == 0.0
+    assert limiter.acquire("a", now=2.0) == pytest.approx(2.0)
+
+
+def test_refill_is_capped_at_burst() -> None:
+    """長く空いても burst 個より多くは貯まらない."""
+    limiter = TokenBucketLimiter(per_minute=60, burst=2, max_clients=10)
+    limiter.acquire("a", now=0.0)
+    assert [limiter.acquire("a", now=1000.0) for _ in range(2)] == [0.0, 0.0]
+    assert limiter.acquire("a", now=1000.0) == pytest.approx(1.0)
+
+
+def test_clients_are_independent_and_bounded() -> None:
+    """クライアントごとに別のバケットを持ち、上限を超えたら古いものから忘れる."""
+    limiter = TokenBucketLimiter(per_minute=60, burst=1, max_clients=2)
+    assert limiter.acquire("a", now=0.0) == 0.0
+    assert limiter.acquire("b", now=0.0) == 0.0
+    assert limiter.acquire("a", now=0.0) > 0
+    assert limiter.acquire("c", now=0.0) == 0.0
+    assert limiter.clients == 2
+    # b は忘れたので、もう一度 burst 個から始まる
+    assert limiter.acquire("b", now=0.0) == 0.0
+
+
+def test_zero_rate_disables_limit() -> None:
+    """per_minute が 0 以下なら制限しない."""
+    limiter = TokenBucketLimiter(per_minute=0, burst=1, max_clients=10)
+    assert all(limiter.acquire("a", now=0.0) == 0.0 for _ in range(100))
+
+
+@pytest.mark.parametrize(("retry_after", "expected"), [(0.0, "1"), (0.2, "1"), (1.0, "1"), (2.1, "3")])
+def test_retry_after_is_rounded_up(retry_after: float, expected: str) -> None:
+    """Retry-After は秒単位に切り上げ、最低 1 秒にする."""
+    response = _reject(429, "too many", retry_after)
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == expected
+
+
+async def test_admission_queue_full() -> None:
+    """実行枠も待ち行列も埋まっている場合は、待たずに queue_full で断る."""
+    admission = AdmissionController(max_concurrent=1, max_queue=0, queue_timeout=10.0)
+    assert await admission.acquire() is None
+    assert await admission.acquire() == "queue_full"
+    admission.release()
+    assert await admission.acquire() is None
+
+
+async def test_admission_queue_timeout() -> None:
+    """待ち行列で queue_timeout 秒待っても実行枠が空かなければ queue_timeout で断る."""
+    admission = AdmissionController(max_concurrent=1, max_queue=1, queue_timeout=0.01)
+    assert await admission.acquire() is None
+    assert await admission.acquire() == "queue_timeout"
+    assert admission.waiting == 0
+    assert admission.in_flight == 1
+
+
+async def _ok(_request: Request) -> PlainTextResponse:
+    return PlainTextResponse("ok")
+
+
+def _client() -> httpx.AsyncClient:
+    """レート制限のミドルウェアを通す小さなアプリのクライアント."""
+    routes = [Route("/api/v1/analyze", _ok, methods=["POST"])]
+    app = RateLimitMiddleware(Starlette(routes=routes), enabled=True, paths=("/api/v1/",))
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+
+async def test_middleware_rate_limit_returns_429(monkeypatch: pytest.MonkeyPatch) -> None:
+    """レート制限を超えたリクエストは 429 と Retry-After で断る."""
+    monkeypatch.setattr(rate_limit, "limiter", TokenBucketLimiter(per_minute=6, burst=1, max_clients=10))
+    monkeypatch.setattr(rate_limit, "admission", AdmissionController(max_concurrent=0, max_queue=0, queue_timeout=0))
+    async with _client() as client:
+        assert (await client.post("/api/v1/analyze")).status_code == 200
+        response = await client.post("/api/v1/analyze")
+    assert response.status_code == 429
+    # 0.1 個/秒なので、次の 1 個まで約 10 秒
+    assert response.headers["Retry-After"] == "10"
+    assert response.json()["retry_after"] == 10
+
+
+@pytest.mark.parametrize(("max_queue", "reason"), [(0, "queue_full"), (1, "queue_timeout")])
+async def test_middleware_admission_returns_503(
+    monkeypatch: pytest.MonkeyPatch,
+    caplog: pytest.LogCaptureFixture,
+    max_queue: int,
+    reason: str,
+) -> None:
+    """混雑で断ったリクエストは、待ち行列があふれた場合も待ち時間を過ぎた場合も 503 で断る."""
+    admission = AdmissionController(max_concurrent=1, max_queue=max_queue, queue_timeout=0.01)
+    monkeypatch.setattr(rate_limit, "limiter", TokenBucketLimiter(per_minute=0, burst=1, max_clients=10))
+    monkeypatch.setattr(rate_limit, "admission", admission)
+    assert await admission.acquire() is None
+    try:
+        async with _client() as client:
+            response = await client.post("/api/v1/analyze")
+    finally:
+        admission.release()
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == str(max(1, rate_limit.OVERLOAD_RETRY_AFTER))
+    assert f"Admission rejected ({reason})" in caplog.text
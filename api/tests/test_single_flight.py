@@ -0,0 +1,158 @@
+"""single-flight (SingleFlight・cached_call) のテスト."""
+
+import asyncio
+from collections.abc import Iterator
+from pathlib import Path
+
+import pytest
+
+from src.services import cache
+from src.services.cache import SharedResultCache, SingleFlight, cache_key, cached_call
+from src.services.deadline import Deadline, DeadlineExceeded, check_deadline, use_deadline
+
+
+@pytest.fixture
+def shared(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Iterator[SharedResultCache]:
+    """一時ファイル上のキャッシュと新しい single-flight を cached_call に使わせる."""
+    result_cache = SharedResultCache(tmp_path / "cache.bin", slots=8, slot_size=4096)
+    monkeypatch.setattr(cache, "get_result_cache", lambda: result_cache)
+    monkeypatch.setattr(cache, "single_flight", SingleFlight())
+    yield result_cache
+    result_cache.close()
+
+
+async def test_concurrent_calls_compute_once() -> None:
+    """同じキーの同時の呼び出しは 1 回だけ計算し、全員が同じ結果を受け取る."""
+    flight = SingleFlight()
+    calls = 0
+
+    async def compute() -> dict[str, int]:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return {"answer": 42}
+
+    results = await asyncio.gather(*(flight.do(b"key", compute) for _ in range(10)))
+
+    assert calls == 1
+    assert all(result is results[0] for result in results)
+    assert flight.stats.leaders == 1
+    assert flight.stats.coalesced == 9
+    assert flight.in_flight == 0
+
+
+async def test_waiter_cancellation_does_not_cancel_computation() -> None:
+    """待っている側が取り消されても、計算とほかの待っている側には影響しない."""
+    flight = SingleFlight()
+    release = asyncio.Event()
+    finished = False
+
+    async def compute() -> str:
+        nonlocal finished
+        await release.wait()
+        finished = True
+        return "done"
+
+    leader = asyncio.create_task(flight.do(b"key", compute))
+    follower = asyncio.create_task(flight.do(b"key", compute))
+    await asyncio.sleep(0)
+    leader.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await leader
+
+    release.set()
+    assert await follower == "done"
+    assert finished
+    assert flight.stats.leaders == 1
+
+
+async def test_exception_is_not_cached() -> None:
+    """計算が失敗した場合は待っている全員に例外を送り、次の呼び出しで計算し直す."""
+    flight = SingleFlight()
+    calls = 0
+
+    async def compute() -> str:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        if calls == 1:
+            msg = "boom"
+            raise ValueError(msg)
+        return "ok"
+
+    results = await asyncio.gather(flight.do(b"key", compute), flight.do(b"key", compute), return_exceptions=True)
+    assert all(isinstance(result, ValueError) for result in results)
+    assert flight.in_flight == 0
+
+    assert await flight.do(b"key", compute) == "ok"
+    assert calls == 2
+
+
+async def test_deadline_exceeded_propagates_to_all_waiters() -> None:
+    """計算が締め切りで打ち切られた場合は、待っている全員に DeadlineExceeded を送る."""
+    flight = SingleFlight()
+
+    async def compute() -> str:
+        await asyncio.sleep(0.01)
+        Deadline.after(None).abort("expired")
+
+    results = await asyncio.gather(flight.do(b"key", compute), flight.do(b"key", compute), return_exceptions=True)
+    assert all(isinstance(result, DeadlineExceeded) for result in results)
+    assert flight.in_flight == 0
+
+
+async def test_waiters_past_deadline_cancel_computation() -> None:
+    """待っている全員が締め切りを過ぎると、全員に DeadlineExceeded を送り、計算を取り消す."""
+    flight = SingleFlight()
+    stopped = asyncio.Event()
+
+    async def compute() -> str:
+        try:
+            while True:
+                check_deadline()
+                await asyncio.sleep(0.01)
+        finally:
+            stopped.set()
+
+    async def wait_for_result() -> str:
+        with use_deadline(Deadline.after(0.05)):
+            return await flight.do(b"key", compute)
+
+    results = await asyncio.gather(wait_for_result(), wait_for_result(), return_exceptions=True)
+    assert all(isinstance(result, DeadlineExceeded) for result in results)
+    await asyncio.wait_for(stopped.wait(), 1)
+
+
+async def test_cached_call_stores_result(shared: SharedResultCache) -> None:
+    """cached_call は計算結果をキャッシュに保存し、次からは計算しない."""
+    calls = 0
+
+    def compute() -> dict[str, int]:
+        nonlocal calls
+        calls += 1
+        return {"lines": 1}
+
+    assert await cached_call("analyze", {"code": "x = 1"}, compute) == {"lines": 1}
+    assert await cached_call("analyze", {"code": "x = 1"}, compute) == {"lines": 1}
+    assert calls == 1
+    assert shared.get(cache_key("analyze", {"code": "x = 1"})) == b'{"lines":1}'
+
+
+async def test_cached_call_does_not_cache_exception(shared: SharedResultCache) -> None:
+    """cached_call の計算が失敗した場合はキャッシュに何も保存しない."""
+    calls = 0
+
+    async def compute() -> dict[str, int]:
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            msg = "boom"
+            raise ValueError(msg)
+        return {"lines": 1}
+
+    with pytest.raises(ValueError, match="boom"):
+        await cached_call("analyze", {"code": "x = 1"}, compute)
+    assert shared.get(cache_key("analyze", {"code": "x = 1"})) is None
+
+    assert await cached_call("analyze", {"code": "x = 1"}, compute) == {"lines": 1}
+    assert calls == 2
@@ -0,0 +1 @@
+"""MCP サーバーの使用例・ベンチマーク."""
@@ -0,0 +1,158 @@
+"""バックエンドの呼び出し方のベンチマーク.
+
+MCP ツールが使う各呼び出し (解析・可視化・エラー解析) のレイテンシを、次の 2 つで比較する.
+
+- http: uvicorn で FastAPI バックエンドを起動し、HTTP で呼び出す (MCP_BACKEND=http)
+- embedded: バックエンドのサービスを同じプロセス内で呼び出す (MCP_BACKEND=embedded)
+
+結果キャッシュにヒットする場合 (同じコード) と、しない場合 (呼び出しごとにコードを変える) の両方を測る.
+バックエンドの依存パッケージが必要なため、次のように実行する.
+
+実行方法 (mcp ディレクトリで):
+    uv run --with "fastapi[standard]>=0.116.1" --with "graphviz>=0.20" python -m examples.benchmark_backends
+    uv run --with "fastapi[standard]>=0.116.1" --with "graphviz>=0.20" python -m examples.benchmark_backends --rounds 500
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+import httpx
+
+from src.client import HighSchoolPythonClient
+from src.embedded import API_DIR, EmbeddedClient
+
+SAMPLE_CODE = (
+    "def average(scores):\n    total = 0\n    for s in scores:\n        total += s\n    return total / len(scores)\n\n\n"
+    "print(average([72, 85, 90]))\n"
+)
+ERROR_CODE = "numbers = [1, 2, 3]\nfor i in range(4):\n    print(numbers[i])\n"
+ERROR_MESSAGE = "IndexError: list index out of range"
+
+Client = HighSchoolPythonClient | EmbeddedClient
+
+
+def free_port() -> int:
+    """空いているポートを取得."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_backend(port: int, timeout: float) -> subprocess.Popen:
+    """FastAPI バックエンドを uvicorn で起動し、応答するまで待つ."""
+    env = {**os.environ, "SANDBOX_PREFORK": "false", "RATE_LIMIT_ENABLED": "false"}
+    process = subprocess.Popen(  # noqa: S603
+        [sys.executable, "-m", "uvicorn", "src.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=API_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    started = time.perf_counter()
+    while True:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/", timeout=1.0)
+        except httpx.TransportError:
+            if time.perf_counter() - started > timeout:
+                process.terminate()
+                msg = "バックエンドが起動しませんでした"
+                raise TimeoutError(msg) from None
+            time.sleep(0.05)
+        else:
+            return process
+
+
+def calls(client: Client) -> dict[str, Callable[[str], Awaitable[Any]]]:
+    """計測する呼び出し (引数はコードの末尾に付けるコメント)."""
+    return {
+        "analyze_code": lambda suffix: client.analyze_code(SAMPLE_CODE + suffix),
+        "visualize_code": lambda suffix: client.visualize_code(SAMPLE_CODE + suffix, 2),
+        "analyze_error": lambda suffix: client.analyze_error(ERROR_CODE + suffix, ERROR_MESSAGE),
+    }
+
+
+async def measure(client: Client, mode: str, rounds: int) -> dict[tuple[str, str], list[float]]:
+    """各呼び出しのレイテンシ (ミリ秒) を測る."""
+    results: dict[tuple[str, str], list[float]] = {}
+    for name, call in calls(client).items():
+        # キャッシュにヒットする場合 (最初の 1 回は結果をキャッシュに入れるため除く)
+        await call("")
+        latencies = []
+        for _ in range(rounds):
+            started = time.perf_counter()
+            await call("")
+            latencies.append((time.perf_counter() - started) * 1000)
+        results[name, "cached"] = latencies
+
+        # キャッシュにヒットしない場合 (モードと回数でコードを変える)
+        latencies = []
+        for i in range(max(1, rounds // 10)):
+            suffix = f"# {mode} {time.time_ns()} {i}\n"
+            started = time.perf_counter()
+            await call(suffix)
+            latencies.append((time.perf_counter() - started) * 1000)
+        results[name, "uncached"] = latencies
+    return results
+
+
+def p95(values: list[float]) -> float:
+    """95 パーセンタイル."""
+    return statistics.quantiles(values, n=20)[-1] if len(values) >= 2 else values[0]  # noqa: PLR2004
+
+
+async def run(rounds: int, startup_timeout: float) -> None:
+    """両方の呼び出し方で計測して比較."""
+    port = free_port()
+    process = start_backend(port, startup_timeout)
+    try:
+        http_client = HighSchoolPythonClient(f"http://127.0.0.1:{port}")
+        try:
+            http_results = await measure(http_client, "http", rounds)
+        finally:
+            await http_client.close()
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+    embedded_client = EmbeddedClient()
+    try:
+        embedded_results = await measure(embedded_client, "embedded", rounds)
+    finally:
+        await embedded_client.close()
+
+    print(
+        f"{'call':16s} {'cache':9s} {'http p50':>10s} {'http p95':>10s} {'emb p50':>10s} {'emb p95':>10s} {'speedup':>8s}"
+    )
+    for (name, case), http_values in http_results.items():
+        embedded_values = embedded_results[name, case]
+        http_median = statistics.median(http_values)
+        embedded_median = statistics.median(embedded_values)
+        print(
+            f"{name:16s} {case:9s} {http_median:8.2f}ms {p95(http_values):8.2f}ms"
+            f" {embedded_median:8.2f}ms {p95(embedded_values):8.2f}ms {http_median / embedded_median:7.1f}x",
+        )
+
+
+def main() -> None:
+    """ベンチマークを実行."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        "--rounds", type=int, default=200, help="キャッシュにヒットする場合の計測回数 (しない場合は 1/10)"
+    )
+    parser.add_argument("--timeout", type=float, default=30.0, help="バックエンドの起動待ちのタイムアウト (秒)")
+    args = parser.parse_args()
+
+    print(f"バックエンド: {API_DIR}, rounds={args.rounds}\n")
+    asyncio.run(run(args.rounds, args.timeout))
+
+
+if __name__ == "__main__":
+    main()
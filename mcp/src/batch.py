@@ -0,0 +1,116 @@
+"""MCP ツールの一括実行.
+
+生徒のプロジェクトを見るエージェントがファイルごとにツールを呼び出すと、ファイル数だけ
+往復が必要になる. 一括実行のツールは複数のコードを受け取り、同時実行数を
+MAX_CONCURRENCY に抑えながらバックエンドに並行して送る.
+終わったものから MCP の進捗通知で途中経過を送り、最後にすべての結果を入力の順に返す.
+"""
+
+import asyncio
+import logging
+import os
+from collections.abc import Awaitable, Callable
+from typing import Any, TypeVar
+
+from fastmcp import Context
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+# バックエンドへの同時実行数
+MAX_CONCURRENCY = int(os.getenv("MCP_BATCH_CONCURRENCY", "8"))
+# 1 回に受け付けるコードの数
+MAX_BATCH_SIZE = int(os.getenv("MCP_BATCH_MAX_ITEMS", "50"))
+
+
+class CodeFile(BaseModel):
+    """一括実行の 1 つのコード.
+
+    Attributes:
+        name: ファイル名などの識別名
+        code: Python コード
+    """
+
+    name: str
+    code: str
+
+
+class ErrorCase(CodeFile):
+    """一括エラー解析の 1 つのコードとエラーメッセージ.
+
+    Attributes:
+        error_message: エラーメッセージ
+    """
+
+    error_message: str
+
+
+Item = TypeVar("Item", bound=CodeFile)
+
+
+async def run_batch(  # noqa: UP047
+    items: list[Item],
+    run: Callable[[Item], Awaitable[dict[str, Any]]],
+    summarize: Callable[[dict[str, Any]], str],
+    ctx: Context | None = None,
+) -> dict[str, Any]:
+    """コードごとの処理を並行して実行し、終わったものから進捗を通知.
+
+    Args:
+        items: コードのリスト
+        run: 1 つのコードを処理して結果を返すコルーチン関数
+        summarize: 進捗通知に載せる結果の要約を作る関数
+        ctx: MCP のコンテキスト (進捗通知に使う)
+
+    Returns:
+        件数と、入力の順に並べた結果 (各要素は name と result. 呼び出しに失敗したものは result の代わりに error)
+    """
+    if len(items) > MAX_BATCH_SIZE:
+        msg = f"一度に処理できるのは {MAX_BATCH_SIZE} 件までです ({len(items)} 件が指定されました)"
+        raise ValueError(msg)
+
+    semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+
+    async def run_one(index: int, item: Item) -> tuple[int, dict[str, Any]]:
+        async with semaphore:
+            try:
+                result = await run(item)
+            except Exception as e:
+                logger.warning("Batch item %s failed", item.name, exc_info=True)
+                return index, {"name": item.name, "error": str(e)}
+        return index, {"name": item.name, "result": result}
+
+    results: list[dict[str, Any]] = [{} for _ in items]
+    tasks = [asyncio.create_task(run_one(index, item)) for index, item in enumerate(items)]
+    try:
+        for done, task in enumerate(asyncio.as_completed(tasks), start=1):
+            index, result = await task
+            results[index] = result
+            if ctx is not None:
+                status = summarize(result["result"]) if "result" in result else f"失敗: {result['error']}"
+                await ctx.report_progress(done, len(items), message=f"{result['name']}: {status}")
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    failed = sum(1 for result in results if "error" in result)
+    return {"count": len(items), "succeeded": len(items) - failed, "failed": failed, "results": results}
+
+
+def summarize_analysis(result: dict[str, Any]) -> str:
+    """解析結果の要約 (進捗通知用)."""
+    summary = result.get("summary") or {}
+    if "quality_score" not in summary:
+        return result.get("message") or result.get("error") or "解析しました"
+    return f"品質スコア {summary['quality_score']}, 問題 {summary['total_issues']} 件"
+
+
+def summarize_visualization(result: dict[str, Any]) -> str:
+    """可視化結果の要約 (進捗通知用)."""
+    total = result.get("truncated", {}).get("steps", {}).get("total", len(result.get("steps", [])))
+    return f"{total} ステップ"
+
+
+def summarize_error(result: dict[str, Any]) -> str:
+    """エラー解析結果の要約 (進捗通知用)."""
+    return f"{result.get('error_type', '')}: {result.get('simple_explanation', '')[:80]}"
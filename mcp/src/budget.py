@@ -0,0 +1,251 @@
+"""MCP ツールの出力の予算管理.
+
+解析結果をそのまま LLM に返すと、大きなプログラムでは SVG のフロー図・全ステップ・全説明で
+コンテキストを使い切ってしまう. ツールは次のように絞った結果を返す.
+
+- リストは先頭の MAX_ITEMS 件まで. 残りは result_id と項目名を get_result_page に渡して取得する
+- 可視化のステップは行・動作・説明だけに要約する
+- SVG のフロー図は既定では返さず、大きさだけを示す (get_flowchart_svg で取得する)
+- 長い文章は MAX_TEXT_CHARS 文字まで (残りは get_result_page で取得する)
+
+完全な結果はコードのハッシュごとに MCP サーバー内にキャッシュするため、同じコードに対する
+続きの取得や再度の呼び出しはバックエンドを呼び出さずにすぐ返る.
+"""
+
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+from typing import Any
+
+# 1 回の応答で返すリストの件数
+MAX_ITEMS = int(os.getenv("MCP_MAX_LIST_ITEMS", "20"))
+# 1 回の応答で返す文章の文字数
+MAX_TEXT_CHARS = int(os.getenv("MCP_MAX_TEXT_CHARS", "2000"))
+# 完全な結果をキャッシュする件数
+CACHE_SIZE = int(os.getenv("MCP_RESULT_CACHE_SIZE", "128"))
+
+# ツールごとに件数を絞る項目 (ドット区切りのパス)
+ANALYSIS_FIELDS = (
+    "structure.imports",
+    "structure.functions",
+    "structure.classes",
+    "structure.variables",
+    "structure.loops",
+    "structure.conditionals",
+    "structure.scopes",
+    "structure.undefined_names",
+    "structure.duplicates",
+    "style_issues",
+    "improvements",
+)
+VISUALIZATION_FIELDS = ("steps", "structure.variables", "structure.flow_edges", "explanation")
+ERROR_FIELDS = (
+    "detailed_explanation",
+    "common_causes",
+    "fix_suggestions",
+    "similar_examples",
+    "learning_resources",
+    "step_by_step_guide",
+)
+
+
+@dataclass
+class ResultStoreStats:
+    """結果キャッシュの統計.
+
+    Attributes:
+        hits: ヒット数
+        misses: ミス数
+    """
+
+    hits: int = 0
+    misses: int = 0
+
+
+class ResultStore:
+    """完全な結果を result_id ごとに保持する LRU キャッシュ."""
+
+    def __init__(self, size: int = CACHE_SIZE) -> None:
+        """コンストラクタ.
+
+        Args:
+            size: 保持する結果の数
+        """
+        self.size = size
+        self.stats = ResultStoreStats()
+        self._results: OrderedDict[str, dict[str, Any]] = OrderedDict()
+
+    def get(self, result_id: str) -> dict[str, Any] | None:
+        """結果を取得 (なければ None)."""
+        result = self._results.get(result_id)
+        if result is None:
+            self.stats.misses += 1
+            return None
+        self._results.move_to_end(result_id)
+        self.stats.hits += 1
+        return result
+
+    def put(self, result_id: str, result: dict[str, Any]) -> None:
+        """結果を保存 (あふれた場合は最も古く使われた結果を捨てる)."""
+        self._results[result_id] = result
+        self._results.move_to_end(result_id)
+        while len(self._results) > self.size:
+            self._results.popitem(last=False)
+
+
+store = ResultStore()
+
+
+def result_id(tool: str, code: str, **params: Any) -> str:  # noqa: ANN401
+    """ツール・コードのハッシュ・パラメータから結果の ID を作る."""
+    payload = json.dumps({"tool": tool, "code": code, "params": params}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+
+async def cached_result(
+    tool: str,
+    code: str,
+    fetch: Callable[[], Awaitable[dict[str, Any]]],
+    **params: Any,  # noqa: ANN401
+) -> tuple[str, dict[str, Any]]:
+    """キャッシュから完全な結果を取得し、なければバックエンドを呼び出して保存.
+
+    Args:
+        tool: ツール名
+        code: Python コード
+        fetch: バックエンドを呼び出して結果を返すコルーチン関数
+        **params: 結果を決めるコード以外のパラメータ
+
+    Returns:
+        結果の ID と完全な結果
+    """
+    rid = result_id(tool, code, **params)
+    result = store.get(rid)
+    if result is None:
+        result = await fetch()
+        store.put(rid, result)
+    return rid, result
+
+
+def stored_result(rid: str) -> dict[str, Any]:
+    """result_id の完全な結果を取得 (キャッシュから消えている場合は ValueError)."""
+    result = store.get(rid)
+    if result is None:
+        msg = f"結果 {rid} は見つかりません (キャッシュから消えています). 元のツールをもう一度呼び出してください"
+        raise ValueError(msg)
+    return result
+
+
+def _lookup(result: dict[str, Any], path: str) -> Any:  # noqa: ANN401
+    """ドット区切りのパスの値を取得 (なければ None)."""
+    value: Any = result
+    for name in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(name)
+    return value
+
+
+def _replace(result: dict[str, Any], path: str, value: Any) -> None:  # noqa: ANN401
+    """ドット区切りのパスの値を置き換える (途中の辞書はコピーする)."""
+    *parents, name = path.split(".")
+    target = result
+    for parent in parents:
+        target[parent] = dict(target[parent])
+        target = target[parent]
+    target[name] = value
+
+
+def _slice(value: Any, offset: int, limit: int) -> Any:  # noqa: ANN401
+    """リスト・辞書・文章の一部を取り出す."""
+    if isinstance(value, dict):
+        return dict(list(value.items())[offset : offset + limit])
+    return value[offset : offset + limit]
+
+
+def _default_limit(value: Any) -> int:  # noqa: ANN401
+    """1 回に返す件数 (文章の場合は文字数)."""
+    return MAX_TEXT_CHARS if isinstance(value, str) else MAX_ITEMS
+
+
+def budget(rid: str, result: dict[str, Any], fields: tuple[str, ...]) -> dict[str, Any]:
+    """結果の各項目を 1 回の応答の上限まで絞る.
+
+    Args:
+        rid: 結果の ID
+        result: 完全な結果 (変更しない)
+        fields: 絞る項目 (リスト・辞書・文章)
+
+    Returns:
+        絞った結果. result_id と、絞った項目の件数 (truncated) を含む
+    """
+    shaped = dict(result)
+    truncated = {}
+    for path in fields:
+        value = _lookup(result, path)
+        if not isinstance(value, list | dict | str):
+            continue
+        limit = _default_limit(value)
+        if len(value) > limit:
+            _replace(shaped, path, _slice(value, 0, limit))
+            truncated[path] = {"total": len(value), "returned": limit}
+    shaped["result_id"] = rid
+    if truncated:
+        shaped["truncated"] = truncated
+        shaped["more"] = "残りは get_result_page(result_id, field, offset) で取得できます"
+    return shaped
+
+
+def _summarize_steps(steps: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """可視化のステップを行・動作・説明だけにする."""
+    return [
+        {"line": step["line_number"], "action": step["action"], "description": step["description"]} for step in steps
+    ]
+
+
+def summarize_visualization(rid: str, result: dict[str, Any], *, include_svg: bool) -> dict[str, Any]:
+    """可視化の結果を要約 (ステップは行・動作・説明だけにし、SVG は既定で省く)."""
+    shaped = dict(result)
+    shaped["steps"] = _summarize_steps(result.get("steps", []))
+    svg = shaped.pop("flow_diagram", "")
+    if include_svg:
+        shaped["flow_diagram"] = svg
+    else:
+        shaped["flow_diagram_chars"] = len(svg)
+        if svg:
+            shaped["flow_diagram_hint"] = "SVG は get_flowchart_svg(result_id) で取得できます"
+    return budget(rid, shaped, VISUALIZATION_FIELDS)
+
+
+def page(rid: str, field: str, offset: int = 0, limit: int | None = None) -> dict[str, Any]:
+    """保存した結果の項目の一部を取得.
+
+    Args:
+        rid: 結果の ID
+        field: 項目 (ドット区切りのパス. 例: steps, structure.functions)
+        offset: 先頭からの位置
+        limit: 件数 (文章の場合は文字数. 省略時は 1 回の応答の上限)
+
+    Returns:
+        項目の一部と、続きの位置 (next_offset. 最後まで取得した場合は None)
+    """
+    result = stored_result(rid)
+    value = _lookup(result, field)
+    if field == "steps" and isinstance(value, list):
+        value = _summarize_steps(value)
+    if not isinstance(value, list | dict | str):
+        msg = f"項目 {field} は取得できません"
+        raise ValueError(msg)  # noqa: TRY004
+    limit = limit or _default_limit(value)
+    end = offset + limit
+    return {
+        "result_id": rid,
+        "field": field,
+        "offset": offset,
+        "total": len(value),
+        "items": _slice(value, offset, limit),
+        "next_offset": end if end < len(value) else None,
+    }
@@ -1,32 +1,257 @@
 """MCP クライアント.
 
 FastAPI バックエンドを呼び出すクライアント実装.
+
+- 接続プール: 同時接続数と keep-alive の接続数・保持時間を設定できる (HTTP/2 も選べる)
+- タイムアウト: エンドポイントごとに設定する (可視化は解析より時間がかかる). 再試行を含めた
+  呼び出し全体の締め切りになり、残り時間を X-Request-Deadline-Ms ヘッダーでバックエンドに伝える
+  (バックエンドは締め切りを過ぎた解析を打ち切る)
+- 再試行: 解析系の呼び出しは同じ入力に同じ結果を返す (冪等) ため、接続エラーや
+  429・502・503・504 のときはジッター付きの指数バックオフで再試行する
+- サーキットブレーカー: バックエンドへの呼び出しが続けて失敗したら、しばらくの間は
+  呼び出さずにすぐエラーを返す (エージェントがタイムアウトまで待たされないようにする)
 """
 
+import asyncio
+import logging
 import os
+import random
+import time
+from typing import TYPE_CHECKING
 
 import httpx
 
+if TYPE_CHECKING:
+    from .embedded import EmbeddedClient
+
+logger = logging.getLogger(__name__)
+
 # FastAPI サーバーの URL (環境変数で設定可能)
 API_BASE_URL = os.getenv("API_BASE_URL", "http://localhost:8000")
+# API のレート制限でこの MCP サーバーを区別するためのキー (任意)
+API_KEY = os.getenv("API_KEY")
+# バックエンドの呼び出し方 (http: FastAPI サーバーに送る, embedded: 同じプロセス内で呼び出す)
+BACKEND = os.getenv("MCP_BACKEND", "http").lower()
+
+# 接続プール
+MAX_CONNECTIONS = int(os.getenv("API_MAX_CONNECTIONS", "20"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("API_MAX_KEEPALIVE_CONNECTIONS", "10"))
+KEEPALIVE_EXPIRY = float(os.getenv("API_KEEPALIVE_EXPIRY", "30"))
+HTTP2 = os.getenv("API_HTTP2", "false").lower() == "true"
+
+# タイムアウト (秒)
+CONNECT_TIMEOUT = float(os.getenv("API_CONNECT_TIMEOUT", "3"))
+TIMEOUTS = {
+    "/": float(os.getenv("API_HEALTH_TIMEOUT", "5")),
+    "/api/v1/analyze": float(os.getenv("API_ANALYZE_TIMEOUT", "15")),
+    "/api/v1/visualize": float(os.getenv("API_VISUALIZE_TIMEOUT", "30")),
+    "/api/v1/analyze-error": float(os.getenv("API_ANALYZE_ERROR_TIMEOUT", "15")),
+}
+DEFAULT_TIMEOUT = 15.0
+# 締め切りまでの残り時間 (ミリ秒) を伝えるヘッダー
+DEADLINE_HEADER = "X-Request-Deadline-Ms"
+
+# 再試行
+MAX_RETRIES = int(os.getenv("API_MAX_RETRIES", "2"))
+RETRY_BACKOFF = float(os.getenv("API_RETRY_BACKOFF", "0.2"))
+RETRY_BACKOFF_MAX = float(os.getenv("API_RETRY_BACKOFF_MAX", "5"))
+RETRY_STATUSES = frozenset({429, 502, 503, 504})
+
+# サーキットブレーカー
+BREAKER_THRESHOLD = int(os.getenv("API_BREAKER_THRESHOLD", "5"))
+BREAKER_RESET = float(os.getenv("API_BREAKER_RESET", "30"))
+
+try:
+    import h2  # noqa: F401
+except ImportError:  # HTTP/2 には httpx[http2] が必要
+    HTTP2_AVAILABLE = False
+else:
+    HTTP2_AVAILABLE = True
+
+
+class BackendUnavailableError(Exception):
+    """バックエンドが応答しないため、呼び出さずに失敗させたことを示す例外."""
+
+
+class CircuitBreaker:
+    """連続した失敗でバックエンドの呼び出しを止めるサーキットブレーカー.
+
+    - closed: 通常どおり呼び出す. threshold 回続けて失敗すると open になる
+    - open: reset_timeout 秒の間は呼び出さずに BackendUnavailableError を送出する
+    - half-open: open になってから reset_timeout 秒たつと、1 件だけ試しに呼び出す.
+      成功すれば closed、失敗すれば再び open になる
+    """
+
+    def __init__(self, threshold: int = BREAKER_THRESHOLD, reset_timeout: float = BREAKER_RESET) -> None:
+        """コンストラクタ.
+
+        Args:
+            threshold: open にする連続失敗の回数 (0 で無効)
+            reset_timeout: open にしてから試しに呼び出すまでの時間 (秒)
+        """
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self._opened_at: float | None = None
+        self._trial = False
+
+    @property
+    def state(self) -> str:
+        """状態 (closed, open, half-open)."""
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at < self.reset_timeout:
+            return "open"
+        return "half-open"
+
+    def before_call(self) -> None:
+        """呼び出す前に確認 (呼び出せない場合は BackendUnavailableError)."""
+        state = self.state
+        if state == "closed":
+            return
+        if state == "half-open" and not self._trial:
+            self._trial = True
+            return
+        retry_in = max(0.0, self.reset_timeout - (time.monotonic() - (self._opened_at or 0.0)))
+        msg = f"バックエンド API に接続できません ({retry_in:.0f} 秒後に再試行します)"
+        raise BackendUnavailableError(msg)
+
+    def record_success(self) -> None:
+        """呼び出しの成功を記録."""
+        if self._opened_at is not None:
+            logger.info("Backend recovered, closing circuit")
+        self.failures = 0
+        self._opened_at = None
+        self._trial = False
+
+    def release_trial(self) -> None:
+        """結果がわからないまま終わった試しの呼び出しを取り消す (次の呼び出しで再び試す)."""
+        self._trial = False
+
+    def record_failure(self) -> None:
+        """呼び出しの失敗を記録."""
+        self.failures += 1
+        if self._trial or (self.threshold and self.failures >= self.threshold):
+            if self._opened_at is None or self._trial:
+                logger.warning("Backend failing (%d consecutive failures), opening circuit", self.failures)
+            self._opened_at = time.monotonic()
+            self._trial = False
+
+
+def backoff_delay(attempt: int, retry_after: str | None = None) -> float:
+    """再試行までの待ち時間 (Retry-After があればそれを優先し、なければフルジッター)."""
+    if retry_after is not None:
+        try:
+            return min(float(retry_after), RETRY_BACKOFF_MAX)
+        except ValueError:
+            pass
+    return random.uniform(0, min(RETRY_BACKOFF_MAX, RETRY_BACKOFF * 2**attempt))  # noqa: S311
 
 
 class HighSchoolPythonClient:
     """ハイスクールPython - コード解析ツール API クライアント."""
 
-    def __init__(self, base_url: str = API_BASE_URL) -> None:
-        """初期化."""
+    def __init__(
+        self,
+        base_url: str = API_BASE_URL,
+        api_key: str | None = API_KEY,
+        *,
+        http2: bool = HTTP2,
+        max_retries: int = MAX_RETRIES,
+        breaker: CircuitBreaker | None = None,
+    ) -> None:
+        """初期化.
+
+        Args:
+            base_url: FastAPI サーバーの URL
+            api_key: X-API-Key ヘッダーで送るキー
+            http2: HTTP/2 を使うか (h2 がインストールされていない場合は HTTP/1.1)
+            max_retries: 冪等な呼び出しを再試行する回数
+            breaker: サーキットブレーカー (省略時は環境変数の設定で作る)
+        """
         self.base_url = base_url
-        self.client = httpx.AsyncClient(base_url=base_url)
+        self.max_retries = max_retries
+        self.breaker = breaker or CircuitBreaker()
+        if http2 and not HTTP2_AVAILABLE:
+            logger.warning("API_HTTP2=true but h2 is not installed, falling back to HTTP/1.1")
+        headers = {"X-API-Key": api_key} if api_key else None
+        self.client = httpx.AsyncClient(
+            base_url=base_url,
+            headers=headers,
+            http2=http2 and HTTP2_AVAILABLE,
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(DEFAULT_TIMEOUT, connect=CONNECT_TIMEOUT),
+        )
 
     async def close(self) -> None:
         """クライアントを閉じる."""
         await self.client.aclose()
 
+    async def _request(self, method: str, path: str, *, idempotent: bool = True, **kwargs: object) -> httpx.Response:
+        """バックエンドを呼び出す (冪等な呼び出しは失敗時に再試行する).
+
+        Args:
+            method: HTTP メソッド
+            path: パス
+            idempotent: 再試行してよい呼び出しか
+            **kwargs: httpx に渡す引数 (json など)
+
+        Returns:
+            レスポンス (4xx・5xx の場合は httpx.HTTPStatusError を送出)
+
+        Raises:
+            BackendUnavailableError: サーキットブレーカーが open の場合
+        """
+        deadline = time.monotonic() + TIMEOUTS.get(path, DEFAULT_TIMEOUT)
+        attempts = 1 + (self.max_retries if idempotent else 0)
+        for attempt in range(attempts):
+            self.breaker.before_call()
+            remaining = max(0.0, deadline - time.monotonic())
+            timeout = httpx.Timeout(remaining, connect=min(CONNECT_TIMEOUT, remaining))
+            headers = {DEADLINE_HEADER: str(int(remaining * 1000))}
+            try:
+                res = await self.client.request(method, path, timeout=timeout, headers=headers, **kwargs)
+            except httpx.TransportError as e:
+                self.breaker.record_failure()
+                delay = backoff_delay(attempt)
+                if attempt + 1 >= attempts or delay >= deadline - time.monotonic():
+                    raise
+                logger.warning("%s %s failed (%r), retrying in %.2fs", method, path, e, delay)
+            except BaseException:
+                # ツール呼び出しの取り消しや想定外の例外. バックエンドの状態はわからないため、
+                # 試しの呼び出しだけを取り消して、回路が半開のまま固まらないようにする
+                self.breaker.release_trial()
+                raise
+            else:
+                if res.status_code not in RETRY_STATUSES:
+                    # 4xx はリクエストの問題で、バックエンドは応答しているため成功として扱う
+                    if res.status_code >= 500:  # noqa: PLR2004
+                        self.breaker.record_failure()
+                    else:
+                        self.breaker.record_success()
+                    res.raise_for_status()
+                    return res
+                if res.status_code != 429:  # noqa: PLR2004
+                    self.breaker.record_failure()
+                else:
+                    # 混雑で断られただけで、バックエンドは応答している
+                    self.breaker.release_trial()
+                delay = backoff_delay(attempt, res.headers.get("Retry-After"))
+                # 締め切りまでに再試行できない場合はあきらめる
+                if attempt + 1 >= attempts or delay >= deadline - time.monotonic():
+                    res.raise_for_status()
+                logger.warning("%s %s returned %d, retrying in %.2fs", method, path, res.status_code, delay)
+            await asyncio.sleep(delay)
+        msg = "unreachable"
+        raise AssertionError(msg)
+
     async def health_check(self) -> dict:
         """ヘルスチェック."""
-        res = await self.client.get("/")
-        res.raise_for_status()
+        res = await self._request("GET", "/")
         return res.json()
 
     async def analyze_code(self, code: str, options: dict | None = None) -> dict:
@@ -39,11 +264,11 @@ class HighSchoolPythonClient:
         Returns:
             解析結果
         """
-        res = await self.client.post(
+        res = await self._request(
+            "POST",
             "/api/v1/analyze",
             json={"code": code, "options": options},
         )
-        res.raise_for_status()
 
         return res.json()
 
@@ -63,7 +288,8 @@ class HighSchoolPythonClient:
         Returns:
             可視化結果
         """
-        res = await self.client.post(
+        res = await self._request(
+            "POST",
             "/api/v1/visualize",
             json={
                 "code": code,
@@ -71,7 +297,6 @@ class HighSchoolPythonClient:
                 "show_flow": show_flow,
             },
         )
-        res.raise_for_status()
 
         return res.json()
 
@@ -85,27 +310,41 @@ class HighSchoolPythonClient:
         Returns:
             解析結果
         """
-        res = await self.client.post(
+        res = await self._request(
+            "POST",
             "/api/v1/analyze-error",
             json={
                 "code": code,
                 "error_message": error_message,
             },
         )
-        res.raise_for_status()
 
         return res.json()
 
 
 # グローバルクライアントインスタンス
-_client: HighSchoolPythonClient | None = None
+_client: "HighSchoolPythonClient | EmbeddedClient | None" = None
 
 
-async def get_client() -> HighSchoolPythonClient:
-    """クライアントインスタンスを取得."""
+async def get_client() -> "HighSchoolPythonClient | EmbeddedClient":
+    """クライアントインスタンスを取得 (MCP_BACKEND=embedded なら組み込みバックエンド)."""
     global _client  # noqa: PLW0603
 
     if _client is None:
-        _client = HighSchoolPythonClient()
+        if BACKEND == "embedded":
+            from .embedded import EmbeddedClient  # noqa: PLC0415
+
+            _client = EmbeddedClient()
+        else:
+            _client = HighSchoolPythonClient()
 
     return _client
+
+
+async def close_client() -> None:
+    """グローバルクライアントを閉じる (サーバーの終了時に呼ぶ)."""
+    global _client  # noqa: PLW0603
+
+    if _client is not None:
+        await _client.close()
+        _client = None
@@ -0,0 +1,150 @@
+"""組み込みバックエンド.
+
+MCP サーバーと FastAPI バックエンドを同じマシンで動かす場合に、HTTP を経由せず
+バックエンドのサービス (api/src/services) を同じプロセス内で直接呼び出す.
+JSON のエンコード・ソケットの往復・2 つ目のプロセスが不要になる.
+
+結果は HTTP の場合と同じ形にするため、バックエンドのレスポンスモデルを通して辞書にする.
+結果キャッシュ (共有メモリ・永続キャッシュ) もバックエンドと同じキーで使う.
+HTTP の場合と同じタイムアウト (client.TIMEOUTS) をバックエンドの締め切りとして設定し、
+ツールの呼び出しが取り消された場合は、ほかに結果を待つ呼び出しがなければ解析も打ち切られる.
+
+MCP_BACKEND=embedded で有効になる. バックエンドの依存パッケージ (fastapi, graphviz) が必要.
+"""
+
+import asyncio
+import importlib
+import importlib.util
+import os
+import sys
+from pathlib import Path
+from types import ModuleType
+from typing import Any
+
+from .client import TIMEOUTS
+
+# バックエンド (api ディレクトリ) の場所
+API_DIR = Path(os.getenv("EMBEDDED_API_DIR", str(Path(__file__).resolve().parents[2] / "api")))
+# MCP サーバーの src パッケージと名前が衝突しないよう、別の名前で読み込む
+_PACKAGE = "hsp_api"
+# 処理ごとのタイムアウトに使う HTTP のパス
+_SECTION_PATHS = {"analysis": "/api/v1/analyze", "visualization": "/api/v1/visualize", "error": "/api/v1/analyze-error"}
+
+
+def load_api_module(name: str) -> ModuleType:
+    """バックエンドのモジュールを読み込む.
+
+    Args:
+        name: src パッケージからのモジュール名 (services.inspector など)
+
+    Returns:
+        読み込んだモジュール
+    """
+    if _PACKAGE not in sys.modules:
+        package_dir = API_DIR / "src"
+        spec = importlib.util.spec_from_file_location(
+            _PACKAGE,
+            package_dir / "__init__.py",
+            submodule_search_locations=[str(package_dir)],
+        )
+        if spec is None or spec.loader is None:
+            msg = f"バックエンドが見つかりません: {package_dir}"
+            raise ImportError(msg)
+        package = importlib.util.module_from_spec(spec)
+        sys.modules[_PACKAGE] = package
+        spec.loader.exec_module(package)
+    return importlib.import_module(f"{_PACKAGE}.{name}")
+
+
+class EmbeddedClient:
+    """バックエンドのサービスを同じプロセス内で呼び出すクライアント.
+
+    HighSchoolPythonClient と同じメソッドを持ち、同じ形の結果を返す.
+    """
+
+    def __init__(self) -> None:
+        """初期化 (バックエンドのモジュールを読み込む)."""
+        self._inspector = load_api_module("services.inspector")
+        self._deadline = load_api_module("services.deadline")
+        self._parsing = load_api_module("services.parsing")
+        self._analysis = load_api_module("models.analysis")
+        self._visualization = load_api_module("models.visualization")
+        self._error_analysis = load_api_module("models.error_analysis")
+
+    async def close(self) -> None:
+        """永続キャッシュの書き込み待ちの結果を書き込む."""
+        persistent_cache = load_api_module("services.persistent_cache")
+        await asyncio.to_thread(persistent_cache.close_persistent_cache)
+
+    async def _run(self, section: str, code: str, **options: Any) -> dict[str, Any]:  # noqa: ANN401
+        """バックエンドの処理を結果キャッシュを使って実行.
+
+        Raises:
+            TimeoutError: HTTP の場合と同じタイムアウトまでに終わらなかった場合
+        """
+        deadline = self._deadline.Deadline.after(TIMEOUTS[_SECTION_PATHS[section]])
+        try:
+            with self._deadline.use_deadline(deadline):
+                return await self._inspector.run_section(section, self._parsing.ParsedCode(code), **options)
+        except self._deadline.DeadlineExceeded as e:
+            # BaseException のままでは MCP のツールのエラーとして扱われないため変換する
+            raise TimeoutError(str(e)) from None
+
+    async def health_check(self) -> dict:
+        """ヘルスチェック."""
+        return {
+            "status": "healthy",
+            "version": "1.0.0",
+            "message": "ハイスクールPython - コード解析ツール API は正常に動作しています (組み込み)",
+        }
+
+    async def analyze_code(self, code: str, options: dict | None = None) -> dict:  # noqa: ARG002
+        """コードを解析.
+
+        Args:
+            code: Python コード
+            options: 解析オプション (HTTP の場合と同じく未使用)
+
+        Returns:
+            解析結果
+        """
+        result = await self._run("analysis", code)
+        return self._analysis.AnalyzeResponse(**result).model_dump(mode="json", by_alias=True)
+
+    async def visualize_code(
+        self,
+        code: str,
+        highlight_line: int = 0,
+        show_flow: bool = True,  # noqa: FBT001, FBT002
+    ) -> dict:
+        """コードを可視化.
+
+        Args:
+            code: Python コード
+            highlight_line: ハイライトする行
+            show_flow: フロー図を表示するか
+
+        Returns:
+            可視化結果
+        """
+        response_model = self._visualization.VisualizeResponse
+        try:
+            result = await self._run("visualization", code, highlight_line=highlight_line, show_flow=show_flow)
+        except TimeoutError:
+            raise
+        except Exception as e:  # noqa: BLE001 (HTTP の場合と同じく失敗の結果を返す)
+            return response_model.failure(str(e)).model_dump(mode="json", by_alias=True)
+        return response_model.from_result(result).model_dump(mode="json", by_alias=True)
+
+    async def analyze_error(self, code: str, error_message: str) -> dict:
+        """エラーを解析.
+
+        Args:
+            code: エラーが発生したコード
+            error_message: エラーメッセージ
+
+        Returns:
+            解析結果
+        """
+        result = await self._run("error", code, error_message=error_message)
+        return self._error_analysis.ErrorAnalyzeResponse(success=True, **result).model_dump(mode="json", by_alias=True)
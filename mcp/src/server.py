@@ -1,16 +1,65 @@
 """ハイスクールPython - コード解析ツール MCP サーバー.
 
 FastAPI バックエンドを呼び出す MCP ツールを提供.
+結果は LLM のコンテキストを使いすぎないよう絞って返す (budget.py).
 """
 
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
 from typing import Any
 
-from fastmcp import FastMCP
+from fastmcp import Context, FastMCP
+
+from . import batch, budget
+from .client import close_client, get_client
+
+
+@asynccontextmanager
+async def lifespan(server: FastMCP) -> AsyncIterator[None]:  # noqa: ARG001
+    """終了時に API クライアントの接続プールを閉じる."""
+    try:
+        yield
+    finally:
+        await close_client()
 
-from .client import get_client
 
 # MCPサーバーインスタンスの作成
-mcp = FastMCP("ハイスクール Python - コード解析ツール")
+mcp = FastMCP("ハイスクール Python - コード解析ツール", lifespan=lifespan)
+
+
+async def _analyze(code: str) -> dict[str, Any]:
+    """コードを解析し、絞った結果を返す (単体・一括のツールで共有)."""
+    client = await get_client()
+    rid, result = await budget.cached_result("analyze", code, lambda: client.analyze_code(code))
+
+    return budget.budget(rid, result, budget.ANALYSIS_FIELDS)
+
+
+async def _visualize(code: str, highlight_line: int, *, show_flow: bool, include_svg: bool) -> dict[str, Any]:
+    """コードを可視化し、要約した結果を返す (単体・一括のツールで共有)."""
+    client = await get_client()
+    rid, result = await budget.cached_result(
+        "visualize",
+        code,
+        lambda: client.visualize_code(code, highlight_line, show_flow),
+        highlight_line=highlight_line,
+        show_flow=show_flow,
+    )
+
+    return budget.summarize_visualization(rid, result, include_svg=include_svg)
+
+
+async def _analyze_error(code: str, error_message: str) -> dict[str, Any]:
+    """エラーを解析し、絞った結果を返す (単体・一括のツールで共有)."""
+    client = await get_client()
+    rid, result = await budget.cached_result(
+        "analyze-error",
+        code,
+        lambda: client.analyze_error(code, error_message),
+        error_message=error_message,
+    )
+
+    return budget.budget(rid, result, budget.ERROR_FIELDS)
 
 
 @mcp.tool()
@@ -21,11 +70,10 @@ async def analyze_python_code(code: str) -> dict[str, Any]:
         code: 解析する Python コード
 
     Returns:
-        解析結果 (構造、警告、エラーなど)
+        解析結果 (構造、警告、エラーなど). 長いリストは先頭だけを返し、
+        残りは get_result_page で取得できる
     """
-    client = await get_client()
-
-    return await client.analyze_code(code)
+    return await _analyze(code)
 
 
 @mcp.tool()
@@ -33,20 +81,21 @@ async def visualize_code_structure(
     code: str,
     highlight_line: int = 0,
     show_flow: bool = True,  # noqa: FBT001, FBT002
+    include_svg: bool = False,  # noqa: FBT001, FBT002
 ) -> dict[str, Any]:
     """コードの構造を可視化する.
 
     Args:
         code: 可視化する Python コード
         highlight_line: ハイライトする行番号
-        show_flow: フロー図を表示するか
+        show_flow: フロー図を生成するか
+        include_svg: SVG のフロー図を結果に含めるか (省略時は get_flowchart_svg で取得する)
 
     Returns:
-        可視化結果 (ステップ、フロー図、説明)
+        可視化結果 (要約したステップ、説明). 長いリストは先頭だけを返し、
+        残りは get_result_page で取得できる
     """
-    client = await get_client()
-
-    return await client.visualize_code(code, highlight_line, show_flow)
+    return await _visualize(code, highlight_line, show_flow=show_flow, include_svg=include_svg)
 
 
 @mcp.tool()
@@ -58,11 +107,105 @@ async def analyze_error(code: str, error_message: str) -> dict[str, Any]:
         error_message: エラーメッセージ
 
     Returns:
-        エラー解析結果 (説明、修正提案、学習リソース)
+        エラー解析結果 (説明、修正提案、学習リソース). 長い説明やリストは先頭だけを返し、
+        残りは get_result_page で取得できる
     """
-    client = await get_client()
+    return await _analyze_error(code, error_message)
+
+
+@mcp.tool()
+async def batch_analyze_python_code(files: list[batch.CodeFile], ctx: Context) -> dict[str, Any]:
+    """複数の Python コード (プロジェクトの各ファイルなど) をまとめて静的解析する.
+
+    バックエンドに並行して送り、終わったものから進捗通知で途中経過を送る.
+
+    Args:
+        files: 解析するコード (name: ファイル名など, code: Python コード) のリスト
+        ctx: MCP のコンテキスト
+
+    Returns:
+        件数と、入力の順に並べた各コードの解析結果 (analyze_python_code と同じ形)
+    """
+    return await batch.run_batch(files, lambda file: _analyze(file.code), batch.summarize_analysis, ctx)
+
+
+@mcp.tool()
+async def batch_visualize_code_structure(
+    files: list[batch.CodeFile],
+    ctx: Context,
+    show_flow: bool = True,  # noqa: FBT001, FBT002
+) -> dict[str, Any]:
+    """複数の Python コードの構造をまとめて可視化する.
+
+    バックエンドに並行して送り、終わったものから進捗通知で途中経過を送る.
+    SVG のフロー図は含めない (各結果の result_id を get_flowchart_svg に渡して取得する).
+
+    Args:
+        files: 可視化するコード (name: ファイル名など, code: Python コード) のリスト
+        ctx: MCP のコンテキスト
+        show_flow: フロー図を生成するか
+
+    Returns:
+        件数と、入力の順に並べた各コードの可視化結果 (visualize_code_structure と同じ形)
+    """
+    return await batch.run_batch(
+        files,
+        lambda file: _visualize(file.code, 0, show_flow=show_flow, include_svg=False),
+        batch.summarize_visualization,
+        ctx,
+    )
+
+
+@mcp.tool()
+async def batch_analyze_error(cases: list[batch.ErrorCase], ctx: Context) -> dict[str, Any]:
+    """複数のエラーをまとめて教育的に分析・説明する.
+
+    バックエンドに並行して送り、終わったものから進捗通知で途中経過を送る.
+
+    Args:
+        cases: エラー (name: ファイル名など, code: コード, error_message: エラーメッセージ) のリスト
+        ctx: MCP のコンテキスト
+
+    Returns:
+        件数と、入力の順に並べた各エラーの解析結果 (analyze_error と同じ形)
+    """
+    return await batch.run_batch(
+        cases,
+        lambda case: _analyze_error(case.code, case.error_message),
+        batch.summarize_error,
+        ctx,
+    )
+
+
+@mcp.tool()
+async def get_result_page(result_id: str, field: str, offset: int = 0, limit: int | None = None) -> dict[str, Any]:
+    """ほかのツールが省略した結果の続きを取得する.
+
+    Args:
+        result_id: ツールの結果の result_id
+        field: 項目 (結果の truncated に含まれる名前. 例: steps, structure.functions)
+        offset: 先頭からの位置
+        limit: 件数 (文章の場合は文字数. 省略時は 1 回の上限)
+
+    Returns:
+        項目の一部 (items) と続きの位置 (next_offset. 最後まで取得した場合は null)
+    """
+    return budget.page(result_id, field, offset, limit)
+
+
+@mcp.tool()
+async def get_flowchart_svg(result_id: str) -> dict[str, Any]:
+    """visualize_code_structure で省略した SVG のフロー図を取得する.
+
+    Args:
+        result_id: visualize_code_structure の結果の result_id
+
+    Returns:
+        SVG のフロー図 (svg)
+    """
+    result = budget.stored_result(result_id)
 
-    return await client.analyze_error(code, error_message)
+    return {"result_id": result_id, "svg": result.get("flow_diagram", "")}
 
 
 if __name__ == "__main__":
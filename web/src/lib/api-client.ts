@@ -1,5 +1,12 @@
 import axios from 'axios'
-import type { AnalyzeResponse, ErrorAnalyzeResponse, VisualizeResponse } from './api-types'
+import type {
+  AnalyzeResponse,
+  ErrorAnalyzeResponse,
+  InspectResponse,
+  InspectSection,
+  LiveMessage,
+  VisualizeResponse,
+} from './api-types'
 
 const API_BASE_URL = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000'
 
@@ -24,19 +31,81 @@ export interface AnalyzeErrorRequest {
   error_message: string
 }
 
+export interface InspectCodeRequest {
+  code: string
+  include?: InspectSection[]
+  highlight_line?: number
+  show_flow?: boolean
+  error_message?: string
+}
+
+// 前回のレスポンスと ETag (同じコードを再び解析するときは If-None-Match で送り、304 なら前回の結果を使う)
+const MAX_CACHED_RESPONSES = 32
+const responseCache = new Map<string, { etag: string; data: unknown }>()
+
+async function postCached<T>(url: string, request: object): Promise<T> {
+  const key = `${url}\n${JSON.stringify(request)}`
+  const cached = responseCache.get(key)
+  const res = await apiClient.post<T>(url, request, {
+    headers: cached ? { 'If-None-Match': cached.etag } : undefined,
+    validateStatus: (status) => (status >= 200 && status < 300) || status === 304,
+  })
+  if (res.status === 304 && cached) return cached.data as T
+
+  const etag = res.headers.etag as string | undefined
+  responseCache.delete(key)
+  if (etag) {
+    responseCache.set(key, { etag, data: res.data })
+    if (responseCache.size > MAX_CACHED_RESPONSES) {
+      const oldest = responseCache.keys().next().value
+      if (oldest !== undefined) responseCache.delete(oldest)
+    }
+  }
+  return res.data
+}
+
 export const api = {
   async analyzeCode(request: AnalyzeCodeRequest): Promise<AnalyzeResponse> {
-    const res = await apiClient.post<AnalyzeResponse>('/api/v1/analyze', request)
-    return res.data
+    return postCached<AnalyzeResponse>('/api/v1/analyze', request)
   },
 
   async visualizeCode(request: VisualizeCodeRequest): Promise<VisualizeResponse> {
-    const res = await apiClient.post<VisualizeResponse>('/api/v1/visualize', request)
-    return res.data
+    return postCached<VisualizeResponse>('/api/v1/visualize', request)
   },
 
   async analyzeError(request: AnalyzeErrorRequest): Promise<ErrorAnalyzeResponse> {
-    const res = await apiClient.post<ErrorAnalyzeResponse>('/api/v1/analyze-error', request)
-    return res.data
+    return postCached<ErrorAnalyzeResponse>('/api/v1/analyze-error', request)
+  },
+
+  // 解析・可視化・エラー解析を 1 回のリクエストでまとめて実行する
+  async inspectCode(request: InspectCodeRequest): Promise<InspectResponse> {
+    return postCached<InspectResponse>('/api/v1/inspect', request)
   },
 }
+
+// ライブ解析の WebSocket を開く (送ったコードには版の番号を付け、結果にも同じ番号が付く)
+export function openLiveSession(onMessage: (message: LiveMessage) => void) {
+  const socket = new WebSocket(`${API_BASE_URL.replace(/^http/, 'ws')}/api/v1/live`)
+  let version = 0
+  let pending: string | null = null
+
+  socket.onopen = () => {
+    if (pending !== null) socket.send(pending)
+    pending = null
+  }
+  socket.onmessage = (event) => onMessage(JSON.parse(event.data) as LiveMessage)
+
+  return {
+    send(request: InspectCodeRequest): number {
+      version += 1
+      const message = JSON.stringify({ ...request, version })
+      // 接続前は最新の版だけを送る
+      if (socket.readyState === WebSocket.OPEN) socket.send(message)
+      else pending = message
+      return version
+    },
+    close() {
+      socket.close()
+    },
+  }
+}
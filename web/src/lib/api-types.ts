@@ -111,3 +111,16 @@ export interface ErrorContext {
   line_after?: string
   surrounding_lines?: string[]
 }
+
+export type InspectSection = 'analysis' | 'visualization' | 'error'
+
+export interface InspectResponse {
+  success: boolean
+  analysis: AnalyzeResponse | null
+  visualization: VisualizeResponse | null
+  error_analysis: ErrorAnalyzeResponse | null
+}
+
+export type LiveMessage =
+  | { type: 'result'; version: number; section: InspectSection; final: boolean; result: InspectResponse }
+  | { type: 'error'; version: number | null; message: string }